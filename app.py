@@ -5,21 +5,53 @@ Maestría en Ciencia de los Datos - Universidad de Guadalajara
 """
 
 import chainlit as cl
+import asyncio
+import math
+import logging
 import os
 import httpx
 import time
 import re
-import pandas as pd
+import uuid
+from typing import Optional
+
+from chainlit.auth import decode_jwt, get_token_from_cookies
+from chainlit.server import app as chainlit_app
+from services.answer_table import ANSWER_TABLE_ENABLED, answer_table, render_table
+from services.audit_export import audit_exporter
+from services.audit_trail import SessionTrace, audit_writer
+from services.auth import credential_store
+from services.batch_api import BATCH_API_ENABLED, BatchAPI, BatchItem
+from services.cache import shared_cache
+from services.charts import chart_service
+from services.conversation import ConversationMemory, evict_idle
+from services.cube_client import CUBE_ENABLED, METRIC_MEASURES, CubeError, build_metric_query, cube_client
+from services.data_version import DATA_VERSIONED_CACHE_TTL, data_versions
+from services.derived_metrics import (
+    DERIVED_INTENTS, RATIO_BASE_PATTERN, DerivedMetricEngine, detect_derived_intent, extract_base_year
+)
+from services.fuzzy_match import FUZZY_MATCH_ENABLED, MetricMatcher
+from services.http_replay import cassette_transport
+from services.llm_usage import (
+    CallUsage, QuotaExceededError, estimate_prompt_tokens, parse_stream_line, parse_usage, usage_tracker
+)
+from services.loop_monitor import LOOP_MONITOR_ENABLED, loop_monitor
+from services.n8n_router import N8nRouter
+from services.prefetch import Prefetcher, TransitionModel, read_history
+from services.profiler import request_profiler
+from services.tables import markdown_table
+from services.ui_updates import CoalescedStep, StreamTarget, TokenBuffer, ui_stats
+from services.warmup import WARMUP_ENABLED, warm_up
+
+logger = logging.getLogger(__name__)
 
 # Configuración
-N8N_WEBHOOK_URL = os.getenv("N8N_WEBHOOK_URL", "http://100.105.68.15:5678/webhook/sdrag-query")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
 OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "mistralai/devstral-2512:free")
-
-# Usuarios autorizados
-AUTHORIZED_USERS = {
-    os.getenv("CHAINLIT_USER", "hector"): os.getenv("CHAINLIT_PASSWORD", "sdrag2025")
-}
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_STREAM = os.getenv("OPENROUTER_STREAM", "false").lower() == "true"
+# Grabación/reproducción de llamadas (HTTP_CASSETTE_MODE); None = red real
+OPENROUTER_TRANSPORT = cassette_transport("openrouter")
 
 # =============================================================================
 # DATOS MOCK - Métricas FP&A de ejemplo
@@ -57,6 +89,38 @@ MOCK_METRICS = {
     }
 }
 
+# Presupuesto mock (varianza real vs plan)
+MOCK_BUDGET = {
+    "revenue": {
+        "Q1_2024": 1_000_000, "Q2_2024": 1_050_000,
+        "Q3_2024": 1_080_000, "Q4_2024": 1_200_000,
+        "2024": 4_330_000
+    },
+    "cogs": {
+        "Q1_2024": 390_000, "Q2_2024": 405_000,
+        "Q3_2024": 415_000, "Q4_2024": 440_000,
+        "2024": 1_650_000
+    },
+    "opex": {
+        "Q1_2024": 275_000, "Q2_2024": 285_000,
+        "Q3_2024": 300_000, "Q4_2024": 305_000,
+        "2024": 1_165_000
+    },
+    "ebitda": {
+        "Q1_2024": 335_000, "Q2_2024": 360_000,
+        "Q3_2024": 365_000, "Q4_2024": 455_000,
+        "2024": 1_515_000
+    },
+    "net_income": {
+        "Q1_2024": 220_000, "Q2_2024": 240_000,
+        "Q3_2024": 250_000, "Q4_2024": 300_000,
+        "2024": 1_010_000
+    }
+}
+
+# Versión de los datos: parte de las claves de cache (gráficas, explicaciones)
+data_versions.track(lambda: MOCK_METRICS)
+
 # Keywords para clasificación
 SEMANTIC_KEYWORDS = {
     "revenue": ["revenue", "ventas", "ingresos", "sales", "facturación"],
@@ -67,6 +131,19 @@ SEMANTIC_KEYWORDS = {
     "net_income": ["net income", "utilidad neta", "ganancia", "profit"]
 }
 
+# Métricas que suelen consultarse a continuación (prefetch sin historial)
+RELATED_METRICS = {
+    "revenue": ["cogs", "gross_margin"],
+    "cogs": ["revenue", "gross_margin"],
+    "gross_margin": ["revenue", "cogs"],
+    "opex": ["ebitda", "revenue"],
+    "ebitda": ["net_income", "opex"],
+    "net_income": ["ebitda", "revenue"]
+}
+
+# Índice de trigramas para sinónimos con errores de escritura ("revenu", "ebidta")
+metric_matcher = MetricMatcher(SEMANTIC_KEYWORDS)
+
 PERIOD_PATTERNS = {
     "Q1_2024": [r"q1.?2024", r"primer.?trimestre.?2024"],
     "Q2_2024": [r"q2.?2024", r"segundo.?trimestre.?2024"],
@@ -78,18 +155,38 @@ PERIOD_PATTERNS = {
 
 
 def classify_query(query: str) -> dict:
-    """Clasifica la consulta y extrae métrica y período"""
+    """Clasifica la consulta y extrae métrica, período e intención derivada"""
     query_lower = query.lower()
+    derived = detect_derived_intent(query)
+    base_period = extract_base_year(query)
+    if base_period:
+        # "vs 2023" es la base de comparación, no el período consultado
+        query_lower = re.sub(rf"\b{base_period}\b", " ", query_lower)
+    if derived == "ratio":
+        # El denominador (revenue) no es la métrica consultada
+        query_lower = re.sub(RATIO_BASE_PATTERN, " ", query_lower)
     
     detected_metric = None
+    matched_term = None
+    match_confidence = None
     for metric, keywords in SEMANTIC_KEYWORDS.items():
         for keyword in keywords:
             if keyword in query_lower:
                 detected_metric = metric
+                matched_term = keyword
+                match_confidence = 1.0
                 break
         if detected_metric:
             break
     
+    # Sin coincidencia exacta: tolerar errores de escritura antes de ir al LLM
+    if not detected_metric and FUZZY_MATCH_ENABLED:
+        fuzzy = metric_matcher.match(query_lower)
+        if fuzzy:
+            detected_metric = fuzzy.metric
+            matched_term = fuzzy.term
+            match_confidence = fuzzy.confidence
+    
     # Detectar período (trimestres primero, luego año)
     detected_period = None
     
@@ -113,6 +210,7 @@ def classify_query(query: str) -> dict:
                 break
     
     # Default a 2024 si no se detectó período
+    period_explicit = detected_period is not None
     if not detected_period:
         detected_period = "2024"
     
@@ -128,7 +226,12 @@ def classify_query(query: str) -> dict:
         "route_target": route_target,
         "metric": detected_metric,
         "period": detected_period,
-        "is_financial": detected_metric is not None
+        "period_explicit": period_explicit,
+        "is_financial": detected_metric is not None,
+        "derived": derived,
+        "base_period": base_period,
+        "matched_term": matched_term,
+        "match_confidence": match_confidence
     }
 
 
@@ -156,68 +259,192 @@ FROM financial_metrics
 
 
 def get_mock_data(metric: str, period: str) -> dict:
-    """Obtiene datos mock para la métrica y período"""
-    if metric and metric in MOCK_METRICS:
-        value = MOCK_METRICS[metric].get(period, 0)
+    """Obtiene datos mock para la métrica y período (None si no hay dato, nunca 0)"""
+    if metric in MOCK_METRICS and period in MOCK_METRICS[metric]:
+        value = MOCK_METRICS[metric][period]
         return {
             "metric": metric,
             "period": period,
             "value": value,
-            "formatted": f"${value:,.2f}" if metric != "gross_margin" else f"{value*100:.1f}%"
+            "formatted": format_metric_value(metric, value)
         }
     return None
 
 
+def format_metric_value(metric: str, value: float) -> str:
+    """Formato de presentación: moneda o porcentaje para gross_margin"""
+    return f"${value:,.2f}" if metric != "gross_margin" else f"{value*100:.1f}%"
+
+
+async def fetch_metric_data(metric: str, period: str) -> tuple[dict, str]:
+    """
+    Obtiene el valor de la métrica desde Cube Core, con fallback a datos mock.
+
+    Returns:
+        (data, fuente) donde fuente describe qué respondió la consulta
+    """
+    if CUBE_ENABLED and metric in METRIC_MEASURES:
+        try:
+            result = await cube_client.load(build_metric_query(metric, period))
+            value = float(result.data[0][METRIC_MEASURES[metric]])
+        except (CubeError, IndexError, KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Cube Core no disponible, usando datos mock: {e}")
+        else:
+            if result.from_cache:
+                source = "Cube Core (cache local)"
+            elif result.from_pre_aggregation:
+                source = f"Cube Core (pre-aggregation: {', '.join(result.used_pre_aggregations)})"
+            else:
+                source = "Cube Core"
+            data = {
+                "metric": metric,
+                "period": period,
+                "value": value,
+                "formatted": format_metric_value(metric, value)
+            }
+            return data, source
+    return get_mock_data(metric, period), "Datos mock"
+
+
+def get_metric_series(metric: str, period: str) -> list[tuple[str, float]]:
+    """Serie trimestral de la métrica en el año del período, hasta el período"""
+    year = period.split("_")[-1]
+    series = []
+    for key, value in MOCK_METRICS.get(metric, {}).items():
+        if key.startswith("Q") and key.endswith(year):
+            series.append((key.replace("_", " "), value))
+            if key == period:
+                break
+    return series
+
+
+# Motor de métricas derivadas (YoY, QoQ, ratios, varianza)
+derived_engine = DerivedMetricEngine(MOCK_METRICS, MOCK_BUDGET)
+
+
+# Router n8n (Fase 4) con classify_query() como fallback local
+router = N8nRouter(
+    local_classifier=classify_query,
+    metrics=SEMANTIC_KEYWORDS,
+    periods=PERIOD_PATTERNS,
+    transport=cassette_transport("n8n")
+)
+
+
 @cl.password_auth_callback
-def auth_callback(username: str, password: str):
-    """Valida credenciales de usuario"""
-    if username in AUTHORIZED_USERS and AUTHORIZED_USERS[username] == password:
+async def auth_callback(username: str, password: str):
+    """Valida credenciales de usuario (hash verificado fuera del event loop)"""
+    metadata = await credential_store.verify(username, password)
+    if metadata is not None:
         return cl.User(
             identifier=username,
-            metadata={"role": "admin", "provider": "credentials"}
+            metadata={"role": metadata.get("role", "user"), "provider": "credentials"}
         )
     return None
 
 
-async def call_openrouter(prompt: str) -> str:
-    """Llama a OpenRouter API para generar explicaciones"""
+async def call_openrouter(
+    prompt: str,
+    history: Optional[list[dict]] = None,
+    user_id: Optional[str] = None,
+    stream_to: Optional[StreamTarget] = None
+) -> tuple[str, Optional[CallUsage]]:
+    """
+    Llama a OpenRouter API para generar explicaciones (con turnos previos opcionales).
+
+    Args:
+        user_id: Usuario al que se carga el consumo; None (jobs internos) no aplica cuota
+        stream_to: Mensaje/step al que se transmiten los tokens (con OPENROUTER_STREAM)
+
+    Returns:
+        (texto, uso de tokens); el uso es None si no hubo llamada
+    """
     if not OPENROUTER_API_KEY:
-        return "⚠️ OpenRouter API Key no configurada"
+        return "⚠️ OpenRouter API Key no configurada", None
     
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    messages = [
+        {
+            "role": "system",
+            "content": "Eres un asistente financiero experto en analítica FP&A. Explica los datos proporcionados de manera clara y concisa. NO inventes números, solo usa los datos que te proporcionan."
+        },
+        *(history or []),
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+    usage = CallUsage(model=OPENROUTER_MODEL, estimated_prompt_tokens=estimate_prompt_tokens(messages))
+    if user_id is not None:
         try:
-            response = await client.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                    "HTTP-Referer": "https://chainlit.sdrag.com",
-                    "X-Title": "SDRAG Chainlit Frontend",
-                },
-                json={
-                    "model": OPENROUTER_MODEL,
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": "Eres un asistente financiero experto en analítica FP&A. Explica los datos proporcionados de manera clara y concisa. NO inventes números, solo usa los datos que te proporcionan."
-                        },
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ],
-                    "temperature": 0.3,
-                }
-            )
-            response.raise_for_status()
-            data = response.json()
-            return data["choices"][0]["message"]["content"]
+            usage_tracker.check_quota(user_id, usage.estimated_prompt_tokens)
+        except QuotaExceededError as e:
+            return f"⚠️ {str(e)}. Intenta de nuevo mañana.", None
+    
+    payload = {
+        "model": OPENROUTER_MODEL,
+        "messages": messages,
+        "temperature": 0.3,
+        "usage": {"include": True},
+    }
+    headers = {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "HTTP-Referer": "https://chainlit.sdrag.com",
+        "X-Title": "SDRAG Chainlit Frontend",
+    }
+    async with httpx.AsyncClient(timeout=30.0, transport=OPENROUTER_TRANSPORT) as client:
+        try:
+            call_start = time.perf_counter()
+            if stream_to is not None and OPENROUTER_STREAM:
+                # Tokens agrupados hacia la UI (un frame cada UI_FLUSH_INTERVAL_MS / UI_FLUSH_MAX_CHARS)
+                parts, reported = [], None
+                async with client.stream("POST", OPENROUTER_URL, headers=headers,
+                                         json={**payload, "stream": True}) as response:
+                    response.raise_for_status()
+                    async with TokenBuffer(stream_to, stats=ui_stats) as buffer:
+                        async for line in response.aiter_lines():
+                            text, chunk_usage, done = parse_stream_line(line)
+                            if done:
+                                break
+                            if text:
+                                parts.append(text)
+                                await buffer.push(text)
+                            reported = chunk_usage or reported
+                content = "".join(parts)
+                usage.streamed = True
+            else:
+                response = await client.post(OPENROUTER_URL, headers=headers, json=payload)
+                response.raise_for_status()
+                data = response.json()
+                reported = parse_usage(data)
+                content = data["choices"][0]["message"]["content"]
+                usage.model = data.get("model") or OPENROUTER_MODEL
+            usage.latency_ms = (time.perf_counter() - call_start) * 1000
+            if reported:
+                usage.prompt_tokens = reported["prompt_tokens"]
+                usage.completion_tokens = reported["completion_tokens"]
+                usage.cost = reported["cost"]
+            usage_tracker.record(user_id or "system", usage)
+            return content, usage
         except Exception as e:
-            return f"❌ Error llamando a OpenRouter: {str(e)}"
+            return f"❌ Error llamando a OpenRouter: {str(e)}", None
+
+
+def format_usage(usage: Optional[CallUsage]) -> str:
+    """Resumen de tokens para la salida del paso LLM"""
+    if usage is None:
+        return ""
+    return (
+        f"🔢 *{usage.prompt_tokens}+{usage.completion_tokens} tokens "
+        f"(estimado {usage.estimated_prompt_tokens}) · {usage.tokens_per_second:.0f} tok/s · "
+        f"${usage.cost or 0:.4f}* | "
+    )
 
 
 @cl.on_chat_start
 async def start():
     """Inicializa la sesión de chat"""
+    evict_idle()
+    cl.user_session.set("memory", ConversationMemory(periods=PERIOD_PATTERNS))
     user = cl.user_session.get("user")
     if user:
         await cl.Message(
@@ -226,75 +453,500 @@ async def start():
                     f"- *¿Cuál fue el revenue del Q4 2024?*\n"
                     f"- *¿Cuál es el EBITDA del 2024?*\n"
                     f"- *¿Cómo está el margen bruto del Q3 2024?*\n\n"
+                    f"📄 Escribe `/exportar pdf` o `/exportar json` para descargar el audit trail de la sesión.\n"
+                    f"📈 Escribe `/metricas` para ver tokens, latencia y caches del proceso.\n\n"
                     f"📊 *Modelo: {OPENROUTER_MODEL}*"
         ).send()
 
 
+async def _fetch_for_precompute(metric: str, period: str) -> dict:
+    data, _ = await fetch_metric_data(metric, period)
+    return data
+
+
+def generic_explanation_prompt(metric: str, period: str, formatted: str) -> str:
+    """Prompt de la explicación genérica de un par (sin la consulta del usuario)"""
+    return f"""Basándote ÚNICAMENTE en estos datos, genera una explicación breve:
+
+Métrica: {metric.replace('_', ' ').title()}
+Período: {period.replace('_', ' ')}
+Valor: {formatted}
+
+Responde como analista FP&A. NO inventes datos adicionales."""
+
+
+def explanation_cache_key(metric: str, period: str, formatted: str) -> str:
+    return data_versions.key("explanation", OPENROUTER_MODEL, metric, period, formatted)
+
+
+async def _explain_for_precompute(metric: str, period: str, formatted: str, user_id: Optional[str] = None):
+    """
+    Explicación genérica del par; None si el LLM no está disponible o sin cuota.
+
+    Args:
+        user_id: Usuario al que se carga la generación (None: jobs internos)
+    """
+    if not OPENROUTER_API_KEY:
+        return None
+    prompt = generic_explanation_prompt(metric, period, formatted)
+
+    async def generate():
+        explanation, _ = await call_openrouter(prompt, user_id=user_id)
+        if explanation.startswith(("⚠️", "❌")):
+            return None
+        return explanation
+
+    # Compartida entre réplicas: cada explicación se genera una sola vez
+    return await shared_cache.get_or_set(
+        explanation_cache_key(metric, period, formatted), generate, ttl=DATA_VERSIONED_CACHE_TTL
+    )
+
+
+async def warm_followup(metric: str, period: str, user_id: str) -> None:
+    """Calienta datos, explicación y gráfica de un seguimiento previsto (prefetch)"""
+    data, _ = await fetch_metric_data(metric, period)
+    if not data:
+        return
+    prompt = generic_explanation_prompt(metric, period, data["formatted"])
+    try:
+        # La especulación no consume la cuota del usuario, pero tampoco la rebasa
+        usage_tracker.check_quota(user_id, estimate_prompt_tokens([{"role": "user", "content": prompt}]))
+    except QuotaExceededError:
+        pass
+    else:
+        await _explain_for_precompute(metric, period, data["formatted"])
+    series = get_metric_series(metric, period)
+    if series:
+        await asyncio.to_thread(chart_service.figure_json, metric, series, data_versions.current)
+
+
+# Prefetch especulativo de seguimientos (transiciones aprendidas del audit log)
+prefetcher = Prefetcher(TransitionModel(PERIOD_PATTERNS, RELATED_METRICS), warm=warm_followup)
+
+
+async def load_prefetch_history() -> None:
+    try:
+        history = await asyncio.to_thread(read_history)
+    except Exception as e:
+        logger.warning(f"Prefetch: no se pudo leer el audit log: {e}")
+        return
+    learned = prefetcher.model.fit(history)
+    logger.info(f"Prefetch: {learned} transiciones aprendidas de {len(history)} consultas")
+
+
+async def answer_batch_item(item: BatchItem, explain: bool, user_id: str) -> dict:
+    """Clasificación, datos y (si se pide) explicación de una consulta de la API batch"""
+    values = {}
+    base_period = None
+    if item.query is not None:
+        classification = await router.route(item.query, user_id=user_id)
+        values.update(
+            route=classification["route"],
+            decided_by=classification["decided_by"],
+            match_confidence=classification.get("match_confidence"),
+        )
+        if not classification["is_financial"]:
+            return values
+        metric, period = classification["metric"], classification["period"]
+        derived, base_period = classification.get("derived"), classification.get("base_period")
+    else:
+        metric, period, derived = item.metric, item.period, item.derived
+        if metric not in SEMANTIC_KEYWORDS:
+            raise ValueError(f"Métrica desconocida: {metric}")
+        if period not in PERIOD_PATTERNS:
+            raise ValueError(f"Período desconocido: {period}")
+        if derived is not None and derived not in DERIVED_INTENTS:
+            raise ValueError(f"Intención derivada desconocida: {derived}")
+        values.update(route="semantic", decided_by="structured")
+    values.update(metric=metric, period=period, derived=derived)
+
+    answer = None if derived else lookup_precomputed(metric, period)
+    if answer is not None:
+        values.update(
+            value=answer.value, formatted=answer.formatted, sql=answer.sql,
+            source="Respuesta precalculada", data_version=answer.data_version,
+            explanation=answer.explanation if explain else None
+        )
+        return values
+
+    data, source = await fetch_metric_data(metric, period)
+    if not data:
+        raise ValueError(f"Sin datos para {metric} {period}")
+    values.update(
+        value=data["value"], formatted=data["formatted"], sql=generate_mock_sql(metric, period),
+        source=source, data_version=data_versions.current
+    )
+    if derived:
+        figure = derived_engine.compute(derived, metric, period, base_period)
+        if figure:
+            values.update(
+                base_value=figure.base_value, change=figure.change,
+                # NaN no es JSON válido
+                change_pct=None if figure.change_pct is None or math.isnan(figure.change_pct)
+                else figure.change_pct
+            )
+    if explain:
+        prompt = generic_explanation_prompt(metric, period, data["formatted"])
+        try:
+            usage_tracker.check_quota(user_id, estimate_prompt_tokens([{"role": "user", "content": prompt}]))
+        except QuotaExceededError as e:
+            values["error"] = f"Explicación omitida: {e}"
+            return values
+        # Se carga (y se vuelve a verificar) contra la cuota del usuario del lote
+        values["explanation"] = await _explain_for_precompute(metric, period, data["formatted"], user_id)
+    return values
+
+
+def verify_chainlit_token(token: str) -> Optional[str]:
+    """Identificador del usuario de un JWT de sesión de Chainlit"""
+    return decode_jwt(token).identifier
+
+
+# API HTTP por lotes sobre la app FastAPI de Chainlit (POST /api/batch)
+batch_api = BatchAPI(answer_batch_item, credential_store.verify, verify_chainlit_token)
+if BATCH_API_ENABLED:
+    batch_api.mount(chainlit_app, cookie_token=get_token_from_cookies)
+
+
+async def precompute_answers() -> str:
+    """Materializa todas las respuestas métrica × período (precompute job)"""
+    pairs = [(metric, period) for metric in SEMANTIC_KEYWORDS for period in PERIOD_PATTERNS]
+    return await answer_table.build(
+        pairs,
+        fetch_data=_fetch_for_precompute,
+        generate_sql=generate_mock_sql,
+        explain=_explain_for_precompute
+    )
+
+
+# Referencias a tasks en background (evita que el GC las cancele)
+_background_tasks: set[asyncio.Task] = set()
+
+
+def lookup_precomputed(metric: str, period: str):
+    """Busca en la tabla precalculada; si hay pares sin explicación, reintenta en background"""
+    answer = answer_table.lookup(metric, period)
+    if answer is None and ANSWER_TABLE_ENABLED and answer_table.needs_retry():
+        task = asyncio.create_task(precompute_answers())
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    return answer
+
+
+def on_data_version_change(version: str) -> None:
+    """Vacía los caches sin versión en la clave y reconstruye la tabla precalculada"""
+    cube_client.invalidate()
+    derived_engine.invalidate()
+    answer_table.invalidate()
+    if ANSWER_TABLE_ENABLED:
+        task = asyncio.create_task(precompute_answers())
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+
+data_versions.on_change(on_data_version_change)
+
+
+async def send_audit_export(session_ids: list[str], fmt: str):
+    """Genera la exportación en background y la entrega como cl.File"""
+    try:
+        await audit_writer.flush()
+        path = await audit_exporter.export(session_ids, fmt)
+    except Exception as e:
+        await cl.Message(content=f"❌ Error exportando audit trail: {str(e)}").send()
+        return
+    await cl.Message(
+        content=f"📄 Audit trail listo ({len(session_ids)} consultas)",
+        elements=[cl.File(name=path.name, path=str(path), display="inline")]
+    ).send()
+
+
+def metrics_snapshot() -> dict:
+    """Métricas en proceso: uso del LLM por modelo, router y caches"""
+    return {
+        "llm": usage_tracker.snapshot(),
+        "router_decisions": dict(router.decisions),
+        "event_loop": loop_monitor.snapshot(),
+        "ui": ui_stats.snapshot(),
+        "data_version": data_versions.snapshot(),
+        "prefetch": prefetcher.snapshot(),
+        "batch_api": batch_api.snapshot(),
+        "caches": {
+            "charts": (chart_service.hits, chart_service.misses),
+            "cube": (cube_client.hits, cube_client.misses),
+            "answer_table": (answer_table.hits, answer_table.misses),
+        },
+    }
+
+
+def render_metrics(snapshot: dict) -> str:
+    """Markdown de metrics_snapshot() para el comando /metricas"""
+    llm_rows = [
+        (model, m["calls"], f"{m['prompt_tokens']:,}", f"{m['completion_tokens']:,}",
+         f"{m['estimated_prompt_tokens']:,}", f"{m['avg_latency_ms']:.0f}",
+         f"{m['tokens_per_second']:.1f}", f"${m['cost']:.4f}")
+        for model, m in snapshot["llm"].items()
+    ]
+    cache_rows = [
+        (name, hits, misses, f"{hits / (hits + misses):.0%}" if hits + misses else "-")
+        for name, (hits, misses) in snapshot["caches"].items()
+    ]
+    decisions = ", ".join(f"{k}: {v}" for k, v in snapshot["router_decisions"].items()) or "-"
+    loop = snapshot["event_loop"]
+    blocked = ", ".join(f"{k}: {v}" for k, v in loop["blocked_by_step"].items()) or "-"
+    ui = snapshot["ui"]
+    prefetch = snapshot["prefetch"]
+    batch = snapshot["batch_api"]
+    return (
+        "## 📈 Métricas del proceso\n\n### LLM por modelo\n\n"
+        + (markdown_table(
+            ("Modelo", "Llamadas", "Prompt", "Completion", "Prompt estimado",
+             "Latencia media (ms)", "Tokens/s", "Costo"),
+            llm_rows
+        ) if llm_rows else "Sin llamadas al LLM todavía.")
+        + f"\n\n### Datos\n\nVersión `{snapshot['data_version']['version']}` "
+        + f"(época {snapshot['data_version']['epoch']})"
+        + f"\n\n### Prefetch\n\nHit rate {prefetch['hit_rate']:.0%} "
+        + f"({prefetch['hits']}/{prefetch['followups']} seguimientos) · "
+        + f"{prefetch['warmed']} calentados · {prefetch['cancelled']} cancelados · "
+        + f"{prefetch['transitions']} transiciones aprendidas"
+        + f"\n\n### API batch\n\n{batch['batches']} lotes · {batch['queries']} consultas · "
+        + f"{batch['errors']} errores"
+        + f"\n\n### Router\n\n{decisions}\n\n### Event loop\n\n"
+        + f"Lag p50 {loop['p50_ms']:.1f}ms · p99 {loop['p99_ms']:.1f}ms · máx {loop['max_ms']:.1f}ms "
+        + f"({loop['samples']} muestras)\n\n**Bloqueos:** {loop['blocked']} ({blocked})"
+        + f"\n\n### UI\n\n{ui['frames_per_answer']:.1f} frames por respuesta streamed "
+        + f"({ui['tokens_per_answer']:.0f} tokens) · {ui['frames_per_step']:.1f} frames por paso"
+        + "\n\n### Caches\n\n"
+        + markdown_table(("Cache", "Hits", "Misses", "Hit rate"), cache_rows)
+    )
+
+
+@cl.on_chat_end
+async def end():
+    """Descarta el estado de prefetch de la sesión"""
+    prefetcher.forget(cl.user_session.get("id"))
+
+
 @cl.on_message
 async def main(message: cl.Message):
     """Procesa mensajes con trazabilidad completa usando cl.Step"""
     
     query = message.content
+    # El mensaje real llegó: el prefetch especulativo de la sesión ya no aplica
+    prefetcher.cancel(cl.user_session.get("id"))
+    
+    # Comando de exportación: el render corre en el pool de procesos
+    if query.strip().lower().startswith("/exportar"):
+        fmt = "json" if "json" in query.lower() else "pdf"
+        session_ids = cl.user_session.get("audit_session_ids") or []
+        if not session_ids:
+            await cl.Message(content="ℹ️ Aún no hay consultas en esta sesión para exportar.").send()
+            return
+        await cl.Message(content=f"⏳ Generando exportación {fmt.upper()}...").send()
+        task = asyncio.create_task(send_audit_export(list(session_ids), fmt))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+        return
+    
+    if query.strip().lower() == "/metricas":
+        await cl.Message(content=render_metrics(metrics_snapshot())).send()
+        return
+    
+    if query.strip().lower() == "/perfilar":
+        enabled = not cl.user_session.get("profile", False)
+        cl.user_session.set("profile", enabled)
+        state = "activado" if enabled else "desactivado"
+        await cl.Message(content=f"🔬 Profiling {state} para las consultas de esta sesión.").send()
+        return
+    
+    user = cl.user_session.get("user")
+    user_id = user.identifier if user else "anonymous"
+    # Mientras haya consultas de usuario en curso el prefetch espera
+    async with prefetcher.foreground():
+        if not request_profiler.should_profile(user_id, cl.user_session.get("profile", False)):
+            await answer_query(query)
+            return
+        
+        key = f"{cl.user_session.get('id')}-{int(time.time() * 1000)}"
+        async with request_profiler.profile(key) as profile:
+            await answer_query(query)
+    async with CoalescedStep(name="🔬 Perfil de la Consulta", type="tool") as step_profile:
+        step_profile.input = query
+        step_profile.output = profile.summary_markdown()
+
+
+async def answer_query(query: str):
+    """Pipeline de una consulta: clasificación, datos, explicación y audit trail"""
     start_time = time.time()
+    user = cl.user_session.get("user")
+    memory = cl.user_session.get("memory")
+    if memory is None:
+        memory = ConversationMemory(periods=PERIOD_PATTERNS)
+        cl.user_session.set("memory", memory)
+    memory.touch()
+    trace = SessionTrace(
+        session_id=str(uuid.uuid4()),
+        user_id=user.identifier if user else "anonymous",
+        query=query
+    )
     
     # PASO 1: Clasificación de consulta
-    async with cl.Step(name="🔍 Clasificación", type="tool") as step_classify:
+    async with (
+        CoalescedStep(name="🔍 Clasificación", type="tool") as step_classify,
+        loop_monitor.step("Clasificación"),
+    ):
         step_classify.input = query
         classify_start = time.time()
         
-        classification = classify_query(query)
+        classification = await router.route(
+            query,
+            user_id=trace.user_id,
+            session_id=cl.user_session.get("id")
+        )
+        # Seguimientos ("¿y en Q3?") heredan métrica/período del turno anterior
+        classification = memory.resolve(classification, query)
         
         classify_time = time.time() - classify_start
         
         if classification["is_financial"]:
+            inherited = (
+                f"**Heredado del turno anterior:** {', '.join(classification['inherited'])}\n"
+                if classification["inherited"] else ""
+            )
+            confidence = classification.get("match_confidence")
+            fuzzy_note = (
+                f"**Coincidencia aproximada:** \"{classification['matched_term']}\" "
+                f"(confianza {confidence:.0%})\n"
+                if confidence is not None and confidence < 1 else ""
+            )
             step_classify.output = (
                 f"**Tipo:** Consulta Semántica\n"
                 f"**Ruta:** {classification['route_target']}\n"
                 f"**Métrica detectada:** `{classification['metric']}`\n"
                 f"**Período:** `{classification['period']}`\n"
+                f"{inherited}"
+                f"{fuzzy_note}"
+                f"**Decidido por:** {classification['decided_by']}\n"
                 f"⏱️ *{classify_time*1000:.0f}ms*"
             )
         else:
             step_classify.output = (
                 f"**Tipo:** Consulta General\n"
                 f"**Ruta:** Chat directo (OpenRouter)\n"
+                f"**Decidido por:** {classification['decided_by']}\n"
                 f"⏱️ *{classify_time*1000:.0f}ms*"
             )
+        trace.add_step("Clasificación", "tool", query, str(classification), classify_time * 1000)
+    
+    session_key = cl.user_session.get("id")
+    prefetched = prefetcher.record(
+        session_key,
+        (classification["metric"], classification["period"]) if classification["is_financial"] else None
+    )
     
-    if classification["is_financial"]:
+    if classification.get("needs_period"):
+        # Período inferido sin datos: preguntar en vez de responder con otro
+        available = ", ".join(p.replace("_", " ") for p in PERIOD_PATTERNS)
+        response = (
+            f"❓ No hay datos para **{classification['needs_period'].replace('_', ' ')}**. "
+            f"¿De qué período? Disponibles: {available}"
+        )
+        total_time = time.time() - start_time
+        await cl.Message(content=response).send()
+        trace.result = {"answer": response}
+        memory.add_turn(query, response, classification)
+    
+    elif classification["is_financial"]:
         metric = classification["metric"]
         period = classification["period"]
         
-        # PASO 2: Generación de SQL
-        async with cl.Step(name="📝 SQL Generado", type="tool") as step_sql:
-            sql_start = time.time()
-            sql = generate_mock_sql(metric, period)
-            sql_time = time.time() - sql_start
-            step_sql.input = f"Métrica: {metric}, Período: {period}"
-            step_sql.output = f"```sql\n{sql}\n```\n⏱️ *{sql_time*1000:.0f}ms*"
+        derived = classification.get("derived")
+        derived_figure = None
+        answer = None if derived else lookup_precomputed(metric, period)
+        
+        if answer is not None:
+            # Fast path: respuesta materializada por el precompute job
+            async with (
+                CoalescedStep(name="⚡ Respuesta Precalculada", type="tool") as step_cached,
+                loop_monitor.step("Precalculada"),
+            ):
+                cached_start = time.time()
+                sql = answer.sql
+                data = answer.data
+                explanation = answer.explanation
+                cached_time = time.time() - cached_start
+                step_cached.input = f"Métrica: {metric}, Período: {period}"
+                step_cached.output = (
+                    f"```sql\n{sql}\n```\n\n**Resultado:**\n\n{answer.table}\n\n"
+                    f"**Versión de datos:** `{answer.data_version}`\n"
+                    f"⏱️ *{cached_time*1000:.0f}ms*"
+                )
+                trace.add_step("Precalculada", "tool", step_cached.input, str(data), cached_time * 1000)
         
-        # PASO 3: Ejecución y recuperación de datos
-        async with cl.Step(name="📊 Datos Recuperados", type="tool") as step_data:
-            data_start = time.time()
-            data = get_mock_data(metric, period)
+        else:
+            # PASO 2: Generación de SQL
+            async with (
+                CoalescedStep(name="📝 SQL Generado", type="tool") as step_sql,
+                loop_monitor.step("SQL"),
+            ):
+                sql_start = time.time()
+                sql = generate_mock_sql(metric, period)
+                sql_time = time.time() - sql_start
+                step_sql.input = f"Métrica: {metric}, Período: {period}"
+                step_sql.output = f"```sql\n{sql}\n```\n⏱️ *{sql_time*1000:.0f}ms*"
+                trace.add_step("SQL", "tool", step_sql.input, sql, sql_time * 1000)
+        
+            # PASO 3: Ejecución y recuperación de datos
+            async with (
+                CoalescedStep(name="📊 Datos Recuperados", type="tool") as step_data,
+                loop_monitor.step("Datos"),
+            ):
+                data_start = time.time()
+                data, data_source = await fetch_metric_data(metric, period)
             
-            if data:
-                df = pd.DataFrame([{
-                    "Métrica": metric.replace("_", " ").title(),
-                    "Período": period.replace("_", " "),
-                    "Valor": data["formatted"]
-                }])
-                data_time = time.time() - data_start
-                step_data.input = "Ejecutando query en DuckDB..."
-                step_data.output = f"**Resultado:**\n\n{df.to_markdown(index=False)}\n\n⏱️ *{data_time*1000:.0f}ms*"
-            else:
-                step_data.output = "❌ No se encontraron datos"
+                if data:
+                    table = render_table(metric, period, data["formatted"])
+                    data_time = time.time() - data_start
+                    step_data.input = "Ejecutando query en DuckDB..."
+                    step_data.output = (
+                        f"**Resultado:**\n\n{table}\n\n"
+                        f"**Fuente:** {data_source}\n"
+                        f"⏱️ *{data_time*1000:.0f}ms*"
+                    )
+                else:
+                    data_time = time.time() - data_start
+                    step_data.output = "❌ No se encontraron datos"
+                trace.add_step("Datos", "tool", f"{metric} {period}", str(data), data_time * 1000)
         
-        # PASO 4: Generación de explicación
-        async with cl.Step(name="💬 Generando Explicación", type="llm") as step_explain:
-            explain_start = time.time()
+            # PASO 3b: Métricas derivadas (cálculo determinista, no del LLM)
+            if derived:
+                async with (
+                    CoalescedStep(name="🧮 Métricas Derivadas", type="tool") as step_derived,
+                    loop_monitor.step("Derivadas"),
+                ):
+                    derived_start = time.time()
+                    derived_figure = derived_engine.compute(
+                        derived, metric, period, classification.get("base_period")
+                    )
+                    derived_time = time.time() - derived_start
+                    step_derived.input = f"{derived.upper()}: {metric} {period}"
+                    if derived_figure:
+                        step_derived.output = f"{derived_figure.describe()}\n\n⏱️ *{derived_time*1000:.0f}ms*"
+                    else:
+                        step_derived.output = "ℹ️ No hay datos suficientes para el cálculo"
+                    trace.add_step(
+                        "Derivadas", "tool", step_derived.input, str(derived_figure), derived_time * 1000
+                    )
+            
+            # PASO 4: Generación de explicación
+            async with (
+                CoalescedStep(name="💬 Generando Explicación", type="llm") as step_explain,
+                loop_monitor.step("Explicación"),
+            ):
+                explain_start = time.time()
             
-            prompt = f"""Basándote ÚNICAMENTE en estos datos, genera una explicación breve:
+                prompt = f"""Basándote ÚNICAMENTE en estos datos, genera una explicación breve:
 
 Consulta: {query}
 Métrica: {metric.replace('_', ' ').title()}
@@ -302,18 +954,42 @@ Período: {period.replace('_', ' ')}
 Valor: {data['formatted'] if data else 'N/A'}
 
 Responde como analista FP&A. NO inventes datos adicionales."""
+                if derived_figure:
+                    prompt += (
+                        "\n\nCálculos ya realizados (úsalos tal cual, NO recalcules):\n"
+                        f"{derived_figure.describe()}"
+                    )
             
-            step_explain.input = prompt
-            explanation = await call_openrouter(prompt)
-            explain_time = time.time() - explain_start
-            step_explain.output = f"{explanation}\n\n⏱️ *{explain_time*1000:.0f}ms*"
+                step_explain.input = prompt
+                # Explicación genérica ya generada (prefetch o precompute)
+                explanation = None if derived or not data else await shared_cache.get(
+                    explanation_cache_key(metric, period, data["formatted"])
+                )
+                if explanation is not None:
+                    usage = None
+                    source_note = "⚡ *Anticipada por prefetch* | " if prefetched else "⚡ *Desde cache* | "
+                else:
+                    explanation, usage = await call_openrouter(
+                        prompt, history=memory.context_messages(), user_id=trace.user_id,
+                        stream_to=step_explain
+                    )
+                    source_note = ""
+                explain_time = time.time() - explain_start
+                step_explain.output = (
+                    f"{explanation}\n\n{source_note}{format_usage(usage)}⏱️ *{explain_time*1000:.0f}ms*"
+                )
+                trace.add_step(
+                    "Explicación", "llm", prompt, explanation, explain_time * 1000,
+                    metadata={"usage": usage.to_dict()} if usage else None
+                )
         
         # Respuesta final
         total_time = time.time() - start_time
+        derived_block = f"\n{derived_figure.describe()}\n" if derived_figure else ""
         final_response = f"""## 📊 Resultado
 
 **{metric.replace('_', ' ').title()}** ({period.replace('_', ' ')}): **{data['formatted'] if data else 'N/A'}**
-
+{derived_block}
 ---
 
 {explanation}
@@ -321,17 +997,77 @@ Responde como analista FP&A. NO inventes datos adicionales."""
 ---
 *⏱️ Tiempo total: {total_time:.2f}s | Ruta: {classification['route_target']}*"""
         
-        await cl.Message(content=final_response).send()
+        elements = []
+        series = get_metric_series(metric, period)
+        if series:
+            elements.append(await chart_service.element(metric, series, data_versions.current))
+        await cl.Message(content=final_response, elements=elements).send()
+        trace.result = {"answer": explanation, "data": data, "sql": sql}
+        memory.add_turn(query, explanation, classification)
+        prefetcher.schedule(session_key, metric, period, trace.user_id)
     
     else:
         # Consulta general - Chat directo
-        async with cl.Step(name="💬 Generando Respuesta", type="llm") as step_chat:
+        async with (
+            CoalescedStep(name="💬 Generando Respuesta", type="llm") as step_chat,
+            loop_monitor.step("Respuesta"),
+        ):
             chat_start = time.time()
             prompt = f"Responde de manera clara y concisa:\n\n{query}"
             step_chat.input = query
-            response = await call_openrouter(prompt)
+            response, usage = await call_openrouter(
+                prompt, history=memory.context_messages(), user_id=trace.user_id,
+                stream_to=step_chat
+            )
             chat_time = time.time() - chat_start
-            step_chat.output = f"{response}\n\n⏱️ *{chat_time*1000:.0f}ms*"
+            step_chat.output = f"{response}\n\n{format_usage(usage)}⏱️ *{chat_time*1000:.0f}ms*"
+            trace.add_step(
+                "Respuesta", "llm", query, response, chat_time * 1000,
+                metadata={"usage": usage.to_dict()} if usage else None
+            )
         
         total_time = time.time() - start_time
         await cl.Message(content=f"{response}\n\n---\n*⏱️ Tiempo: {total_time:.2f}s*").send()
+        trace.result = {"answer": response}
+        memory.add_turn(query, response, classification)
+    
+    # Audit trail (no bloquea: se escribe en background)
+    trace.total_duration_ms = total_time * 1000
+    trace.classification = classification
+    audit_writer.record(trace)
+    session_ids = cl.user_session.get("audit_session_ids") or []
+    session_ids.append(trace.session_id)
+    cl.user_session.set("audit_session_ids", session_ids)
+
+
+@cl.on_app_startup
+async def startup():
+    """Precalienta dependencias y respuestas sin retrasar el arranque del servidor"""
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    data_versions.start()
+    jobs = []
+    if WARMUP_ENABLED:
+        jobs.append(warm_up())
+    if ANSWER_TABLE_ENABLED:
+        jobs.append(precompute_answers())
+    if prefetcher.enabled:
+        jobs.append(load_prefetch_history())
+    for job in jobs:
+        task = asyncio.create_task(job)
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+
+@cl.on_app_shutdown
+async def shutdown():
+    """Drena el audit trail pendiente antes de salir"""
+    await audit_writer.close()
+    audit_exporter.shutdown()
+    await router.aclose()
+    await cube_client.aclose()
+    await shared_cache.close()
+    credential_store.shutdown()
+    loop_monitor.stop()
+    await data_versions.stop()
+    await prefetcher.stop()
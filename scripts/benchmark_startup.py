@@ -0,0 +1,172 @@
+"""
+Benchmark de arranque en frío de app.py.
+
+Mide:
+- `python -X importtime -c "import app"`: total y desglose por paquete
+  (chainlit, services, pandas, plotly, ...).
+- Time-to-first-response: tiempo desde `chainlit run app.py` hasta la primera
+  respuesta HTTP del servidor.
+
+Uso:
+    python3 scripts/benchmark_startup.py --output startup_benchmark.json
+    python3 scripts/benchmark_startup.py --max-import-ms 4000 --max-first-response-ms 8000
+
+Con presupuestos (--max-*) el script termina con código 1 si se exceden,
+para detectar regresiones en CI.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Paquetes cuyo costo acumulado se reporta por separado
+TRACKED_PACKAGES = (
+    "chainlit", "services", "httpx", "pandas", "numpy", "plotly", "reportlab", "zstandard"
+)
+# No deben cargarse por código propio al importar app.py
+LAZY_PACKAGES = ("plotly", "reportlab")
+
+
+def parse_importtime(stderr: str) -> dict:
+    """
+    Parsea la salida de `-X importtime`.
+
+    Returns:
+        total_ms (suma de imports de primer nivel), packages (ms acumulados
+        del primer import de cada paquete rastreado) y modules (set de nombres)
+    """
+    total_us = 0
+    packages: dict[str, float] = {}
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative_us, name = line.rstrip().split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        module = name.strip()
+        modules.add(module)
+        cumulative = int(cumulative_us)
+        if depth == 0:
+            total_us += cumulative
+        top = module.split(".")[0]
+        if top in TRACKED_PACKAGES and module == top and top not in packages:
+            packages[top] = cumulative / 1000
+        elif top == "services" and module.startswith("services."):
+            packages[module] = cumulative / 1000
+    return {"total_ms": total_us / 1000, "packages": packages, "modules": modules}
+
+
+def measure_importtime(runs: int = 3) -> dict:
+    """
+    Ejecuta `import app` en procesos nuevos y reporta la mediana.
+
+    El desglose por paquete (`packages_ms`) es el de la corrida más cercana
+    a la mediana; los imports pesados se buscan en todas las corridas.
+    """
+    results = []
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import app"],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        )
+        results.append(parse_importtime(proc.stderr))
+    median_ms = statistics.median(r["total_ms"] for r in results)
+    typical = min(results, key=lambda r: abs(r["total_ms"] - median_ms))
+    loaded = set().union(*(r["modules"] for r in results))
+    return {
+        "runs": runs,
+        "median_ms": median_ms,
+        "min_ms": min(r["total_ms"] for r in results),
+        "packages_run_ms": typical["total_ms"],
+        "packages_ms": typical["packages"],
+        "eager_heavy_imports": sorted(pkg for pkg in LAZY_PACKAGES if pkg in loaded),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_first_response(timeout: float = 60.0) -> float:
+    """Arranca Chainlit y mide ms hasta la primera respuesta HTTP."""
+    port = _free_port()
+    env = dict(os.environ)
+    # La autenticación requiere un secreto JWT; uno desechable basta para medir
+    env.setdefault("CHAINLIT_AUTH_SECRET", "benchmark-startup-secret-" + "x" * 32)
+    log = tempfile.TemporaryFile()
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "chainlit", "run", "app.py", "--headless",
+         "--host", "127.0.0.1", "--port", str(port)],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if proc.poll() is not None:
+                log.seek(0)
+                tail = log.read().decode(errors="replace")[-2000:]
+                raise RuntimeError(f"chainlit terminó con código {proc.returncode}:\n{tail}")
+            try:
+                response = httpx.get(f"http://127.0.0.1:{port}/", timeout=1.0)
+                if response.status_code < 500:
+                    return (time.perf_counter() - start) * 1000
+            except httpx.TransportError:
+                pass
+            time.sleep(0.05)
+        raise TimeoutError(f"Sin respuesta en {timeout}s")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        log.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de arranque de SDRAG Chainlit")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--skip-server", action="store_true",
+                        help="Solo medir importtime (sin arrancar Chainlit)")
+    parser.add_argument("--max-import-ms", type=float)
+    parser.add_argument("--max-first-response-ms", type=float)
+    parser.add_argument("--output", help="Archivo JSON para guardar resultados")
+    args = parser.parse_args()
+
+    report = {"import": measure_importtime(args.runs)}
+    if not args.skip_server:
+        report["first_response_ms"] = measure_first_response()
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+    failures = []
+    if report["import"]["eager_heavy_imports"]:
+        failures.append(f"imports pesados al cargar app.py: {report['import']['eager_heavy_imports']}")
+    if args.max_import_ms and report["import"]["median_ms"] > args.max_import_ms:
+        failures.append(f"import {report['import']['median_ms']:.0f}ms > {args.max_import_ms:.0f}ms")
+    if (args.max_first_response_ms and "first_response_ms" in report
+            and report["first_response_ms"] > args.max_first_response_ms):
+        failures.append(
+            f"first response {report['first_response_ms']:.0f}ms > {args.max_first_response_ms:.0f}ms"
+        )
+    for failure in failures:
+        print(f"❌ Regresión: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Benchmark de frames de websocket por respuesta streamed: directo vs. TokenBuffer.
+
+Simula N respuestas concurrentes que reciben tokens del LLM a ritmo
+constante y los envían a un destino que imita el costo del emitter de
+socket.io (serializar el payload JSON y entregarlo al transporte). Mide
+frames por respuesta y CPU del proceso en ambos modos.
+
+Uso:
+    python3 scripts/benchmark_ui_updates.py
+    python3 scripts/benchmark_ui_updates.py --answers 200 --tokens 400 --token-interval-ms 5
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from services.ui_updates import UI_FLUSH_INTERVAL_MS, UI_FLUSH_MAX_CHARS, TokenBuffer  # noqa: E402
+
+
+class EmitterStandIn:
+    """Destino con el costo aproximado de un frame de socket.io."""
+
+    def __init__(self, answer_id: str):
+        self.id = answer_id
+        self.output = ""
+        self.frames = 0
+
+    async def stream_token(self, token: str, is_sequence: bool = False) -> None:
+        self.output += token
+        self.frames += 1
+        packet = json.dumps({"id": self.id, "token": token, "isSequence": is_sequence})
+        await asyncio.sleep(0)  # Entrega al transporte
+        del packet
+
+
+async def answer(index: int, tokens: int, token_interval: float, buffered: bool) -> int:
+    target = EmitterStandIn(f"answer-{index}")
+    words = [f"tok{i} " for i in range(tokens)]
+    if buffered:
+        async with TokenBuffer(target) as buffer:
+            for word in words:
+                await buffer.push(word)
+                await asyncio.sleep(token_interval)
+    else:
+        for word in words:
+            await target.stream_token(word)
+            await asyncio.sleep(token_interval)
+    assert target.output == "".join(words)
+    return target.frames
+
+
+async def run(answers: int, tokens: int, token_interval_ms: float, buffered: bool) -> dict:
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    frames = await asyncio.gather(*(
+        answer(i, tokens, token_interval_ms / 1000, buffered) for i in range(answers)
+    ))
+    return {
+        "frames_per_answer": sum(frames) / answers,
+        "cpu_ms": (time.process_time() - cpu_start) * 1000,
+        "wall_ms": (time.perf_counter() - wall_start) * 1000,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de actualizaciones de UI agrupadas")
+    parser.add_argument("--answers", type=int, default=100, help="Respuestas concurrentes")
+    parser.add_argument("--tokens", type=int, default=300, help="Tokens por respuesta")
+    parser.add_argument("--token-interval-ms", type=float, default=5)
+    parser.add_argument("--output", help="Archivo JSON para guardar resultados")
+    args = parser.parse_args()
+
+    report = {
+        "config": {
+            "answers": args.answers, "tokens": args.tokens,
+            "token_interval_ms": args.token_interval_ms,
+            "flush_interval_ms": UI_FLUSH_INTERVAL_MS, "flush_max_chars": UI_FLUSH_MAX_CHARS,
+        },
+        "direct": asyncio.run(run(args.answers, args.tokens, args.token_interval_ms, False)),
+        "buffered": asyncio.run(run(args.answers, args.tokens, args.token_interval_ms, True)),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
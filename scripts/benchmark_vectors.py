@@ -0,0 +1,125 @@
+"""
+Benchmark del almacén de vectores cuantizado frente a la búsqueda exacta en float32.
+
+Genera embeddings sintéticos de 768 dimensiones con estructura de baja
+dimensión intrínseca (como los de texto: un espacio latente proyectado más
+ruido), construye índices int8 y PQ en un directorio temporal y mide por
+configuración:
+
+- recall@10 contra el top-10 exacto (coseno en float32),
+- bytes por vector que recorre cada búsqueda y tamaño en disco,
+- consultas por segundo (una consulta a la vez, como en línea).
+
+Uso:
+    python3 scripts/benchmark_vectors.py
+    python3 scripts/benchmark_vectors.py --vectors 100000 --queries 200 --rescore-factor 8
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from services.vector_store import QuantizedVectorStore, normalize_rows  # noqa: E402
+
+
+def synthetic_embeddings(n: int, queries: int, dim: int, latent: int, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    projection = rng.normal(size=(latent, dim)).astype(np.float32)
+    points = rng.normal(size=(n, latent)).astype(np.float32)
+    noise = 0.1 * np.sqrt(latent)
+    vectors = points @ projection + noise * rng.normal(size=(n, dim)).astype(np.float32)
+    # Consultas cerca de documentos existentes (paráfrasis)
+    anchors = points[rng.integers(0, n, queries)] + 0.3 * rng.normal(size=(queries, latent)).astype(np.float32)
+    return normalize_rows(vectors), normalize_rows(anchors @ projection)
+
+
+def python_list_bytes(vector: np.ndarray) -> int:
+    """Tamaño de un embedding como lista de floats de Python (el formato actual)."""
+    values = vector.tolist()
+    return sys.getsizeof(values) + sum(sys.getsizeof(v) for v in values)
+
+
+def recall_at(results: list[list[int]], truth: np.ndarray, k: int) -> float:
+    return float(np.mean([len(set(r[:k]) & set(t[:k])) / k for r, t in zip(results, truth)]))
+
+
+def exact_search(vectors: np.ndarray, query: np.ndarray, k: int) -> list[int]:
+    scores = vectors @ query
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])].tolist()
+
+
+def measure(search, queries: np.ndarray) -> tuple[list[list[int]], float]:
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        results.append(search(query))
+    return results, len(queries) / (time.perf_counter() - start)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de embeddings cuantizados (int8/PQ)")
+    parser.add_argument("--vectors", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--latent", type=int, default=64, help="Dimensión intrínseca de los datos sintéticos")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--pq-subspaces", type=int, default=96)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Archivo JSON para guardar resultados")
+    args = parser.parse_args()
+
+    vectors, queries = synthetic_embeddings(args.vectors, args.queries, args.dim, args.latent, args.seed)
+    truth = np.array([exact_search(vectors, q, args.k) for q in queries])
+    ids = [str(i) for i in range(len(vectors))]
+
+    _, baseline_qps = measure(lambda q: exact_search(vectors, q, args.k), queries)
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "float32": {
+            "recall_at_k": 1.0,
+            "scan_bytes_per_vector": vectors.itemsize * args.dim,
+            "python_list_bytes_per_vector": python_list_bytes(vectors[0]),
+            "qps": baseline_qps,
+        },
+    }
+
+    for quantization in ("int8", "pq"):
+        with tempfile.TemporaryDirectory() as tmp:
+            build_start = time.perf_counter()
+            store = QuantizedVectorStore.build(
+                tmp, ids, vectors, quantization=quantization, pq_subspaces=args.pq_subspaces
+            )
+            build_s = time.perf_counter() - build_start
+            disk = sum(p.stat().st_size for p in Path(tmp).iterdir())
+            for rescore in (0, args.rescore_factor):
+                results, qps = measure(
+                    lambda q: [int(i) for i, _ in store.search(q, args.k, rescore_factor=rescore)[0]],
+                    queries
+                )
+                name = f"{quantization}" + (f"+rescore{rescore}" if rescore else "")
+                report[name] = {
+                    "recall_at_k": recall_at(results, truth, args.k),
+                    "scan_bytes_per_vector": store.code_bytes // len(vectors),
+                    "disk_bytes": disk,
+                    "build_s": build_s,
+                    "qps": qps,
+                }
+            del store
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
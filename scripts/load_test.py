@@ -0,0 +1,146 @@
+"""
+Load test en proceso del pipeline semántico con monitor del event loop.
+
+Simula N sesiones concurrentes que ejecutan la parte local de cada consulta
+(clasificación, datos, tabla markdown, métricas derivadas) en un solo event
+loop con `loop_monitor` activo, y reporta latencias por consulta junto con
+el lag del loop y los bloqueos por paso. Si alguna parte síncrona crece lo
+suficiente para bloquear el loop, aparece aquí antes que en producción.
+
+Con --cassette-dir cada consulta también pide su explicación a OpenRouter,
+reproducida sin red desde cassettes grabados con HTTP_CASSETTE_MODE=record
+(ver services/http_replay.py), con la latencia grabada o escalada.
+
+Uso:
+    python3 scripts/load_test.py --sessions 50 --queries 20
+    python3 scripts/load_test.py --max-lag-p99-ms 50 --max-blocked 0 --output load_test.json
+    python3 scripts/load_test.py --cassette-dir cassettes --latency sampled --latency-scale 1.5
+
+Con presupuestos (--max-*) el script termina con código 1 si se exceden.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Mezcla de consultas representativa (directas, derivadas, generales)
+QUERIES = (
+    "¿Cuál fue el revenue del Q4 2024?",
+    "Muéstrame el EBITDA de 2024",
+    "gross margin Q3 2024",
+    "¿Cómo cambió el revenue en 2024 vs 2023?",
+    "variación del EBITDA contra presupuesto en Q2 2024",
+    "opex como porcentaje del revenue en 2024",
+    "¿Qué políticas de gasto tenemos?",
+)
+
+
+async def run_session(app, monitor, queries: int, latencies: list[float], explain: bool) -> None:
+    """Una sesión: consultas secuenciales con los mismos pasos que on_message."""
+    for i in range(queries):
+        query = QUERIES[i % len(QUERIES)]
+        start = time.perf_counter()
+        with monitor.step("Clasificación"):
+            classification = app.classify_query(query)
+        if classification["is_financial"]:
+            metric, period = classification["metric"], classification["period"]
+            with monitor.step("Datos"):
+                data, _ = await app.fetch_metric_data(metric, period)
+                app.render_table(metric, period, data["formatted"] if data else "N/A")
+            if classification["derived"]:
+                with monitor.step("Derivadas"):
+                    app.derived_engine.compute(
+                        classification["derived"], metric, period, classification["base_period"]
+                    )
+        if explain:
+            with monitor.step("Explicación"):
+                await app.call_openrouter(f"Consulta: {query}")
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0)  # Ceder como lo haría la llamada al LLM
+
+
+async def run(sessions: int, queries: int, interval: float, threshold_ms: float, explain: bool) -> dict:
+    import app
+    from services.loop_monitor import LoopMonitor
+
+    monitor = LoopMonitor(interval=interval, threshold_ms=threshold_ms)
+    monitor.start()
+    latencies: list[float] = []
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(run_session(app, monitor, queries, latencies, explain) for _ in range(sessions)))
+        # Al menos un par de muestras aunque la carga termine antes del intervalo
+        await asyncio.sleep(interval * 2)
+    finally:
+        monitor.stop()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    report = {
+        "sessions": sessions,
+        "queries": len(latencies),
+        "throughput_qps": len(latencies) / elapsed,
+        "latency_ms": {
+            "p50": statistics.median(latencies),
+            "p99": latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))],
+            "max": latencies[-1],
+        },
+        "event_loop": monitor.snapshot(),
+    }
+    if explain:
+        transport = app.OPENROUTER_TRANSPORT
+        report["replay"] = {"calls": transport.replayed, "misses": transport.misses}
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load test del pipeline de SDRAG Chainlit")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=20, help="Consultas por sesión")
+    parser.add_argument("--interval", type=float, default=0.01, help="Segundos entre pings al loop")
+    parser.add_argument("--threshold-ms", type=float, default=100)
+    parser.add_argument("--cassette-dir", help="Reproducir llamadas externas desde cassettes")
+    parser.add_argument("--latency", choices=("recorded", "sampled", "none"), default="recorded")
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--max-lag-p99-ms", type=float)
+    parser.add_argument("--max-blocked", type=int)
+    parser.add_argument("--output", help="Archivo JSON para guardar resultados")
+    args = parser.parse_args()
+
+    if args.cassette_dir:
+        # Se lee al importar app: debe fijarse antes
+        os.environ.update({
+            "HTTP_CASSETTE_MODE": "replay",
+            "HTTP_CASSETTE_DIR": args.cassette_dir,
+            "HTTP_REPLAY_LATENCY": args.latency,
+            "HTTP_REPLAY_LATENCY_SCALE": str(args.latency_scale),
+        })
+        os.environ.setdefault("OPENROUTER_API_KEY", "replay")
+
+    report = asyncio.run(run(
+        args.sessions, args.queries, args.interval, args.threshold_ms, bool(args.cassette_dir)
+    ))
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+
+    loop = report["event_loop"]
+    failures = []
+    if args.max_lag_p99_ms is not None and loop["p99_ms"] > args.max_lag_p99_ms:
+        failures.append(f"lag p99 {loop['p99_ms']:.1f}ms > {args.max_lag_p99_ms:.1f}ms")
+    if args.max_blocked is not None and loop["blocked"] > args.max_blocked:
+        failures.append(f"{loop['blocked']} bloqueos > {args.max_blocked} ({loop['blocked_by_step']})")
+    for failure in failures:
+        print(f"❌ Regresión: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+"""Servicios de SDRAG Chainlit (clientes externos, audit trail, caches)."""
@@ -0,0 +1,212 @@
+"""
+Tabla de respuestas precalculadas para el dominio cerrado métrica × período.
+
+La ruta semántica solo cubre SEMANTIC_KEYWORDS × PERIOD_PATTERNS, así que
+cada par se puede materializar de antemano: SQL, valor formateado, tabla
+markdown y explicación. `AnswerTable.build()` corre en background (al
+arrancar o al refrescar datos) con un pool de workers acotado y publica la
+tabla completa de una sola vez como mapping de solo lectura.
+
+La tabla se versiona por hash de los datos: si los valores no cambiaron,
+`build()` conserva la tabla actual (y sus explicaciones) sin recalcular.
+Los pares sin explicación (LLM caído, sin cuota o sin API key) quedan
+incompletos: el siguiente `build()` reintenta solo esos, y `needs_retry()`
+indica cuándo conviene lanzarlo (cada ANSWER_TABLE_RETRY_SECONDS).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Awaitable, Callable, Iterable, Mapping, Optional
+
+from services.tables import markdown_table
+
+logger = logging.getLogger(__name__)
+
+ANSWER_TABLE_ENABLED = os.getenv("ANSWER_TABLE_ENABLED", "true").lower() == "true"
+ANSWER_TABLE_WORKERS = int(os.getenv("ANSWER_TABLE_WORKERS", "4"))
+ANSWER_TABLE_RETRY_SECONDS = float(os.getenv("ANSWER_TABLE_RETRY_SECONDS", "300"))
+
+FetchData = Callable[[str, str], Awaitable[Optional[dict]]]
+Explain = Callable[[str, str, str], Awaitable[Optional[str]]]
+
+
+@dataclass(frozen=True)
+class PrecomputedAnswer:
+    """Respuesta materializada para un par (métrica, período)."""
+    metric: str
+    period: str
+    value: float
+    formatted: str
+    sql: str
+    table: str
+    explanation: Optional[str]
+    data_version: str
+
+    @property
+    def data(self) -> dict:
+        """Mismo formato que get_mock_data()."""
+        return {
+            "metric": self.metric,
+            "period": self.period,
+            "value": self.value,
+            "formatted": self.formatted,
+        }
+
+
+def data_version(values: Mapping[tuple[str, str], dict]) -> str:
+    """Hash estable de los valores de todos los pares."""
+    payload = sorted((m, p, d["value"]) for (m, p), d in values.items())
+    return hashlib.sha256(json.dumps(payload).encode()).hexdigest()[:12]
+
+
+def render_table(metric: str, period: str, formatted: str) -> str:
+    return markdown_table(
+        ("Métrica", "Período", "Valor"),
+        [(metric.replace("_", " ").title(), period.replace("_", " "), formatted)]
+    )
+
+
+class AnswerTable:
+    """
+    Tabla en memoria (solo lectura) de respuestas precalculadas.
+
+    Args:
+        workers: Máximo de pares procesándose a la vez (datos + explicación)
+        retry_seconds: Espera mínima entre reintentos de pares incompletos
+    """
+
+    def __init__(self, workers: int = ANSWER_TABLE_WORKERS, retry_seconds: float = ANSWER_TABLE_RETRY_SECONDS):
+        self.workers = workers
+        self.retry_seconds = retry_seconds
+        self.version: Optional[str] = None
+        self.built_at: Optional[float] = None
+        self.attempted_at: Optional[float] = None
+        self.incomplete = 0
+        self._answers: Mapping[tuple[str, str], PrecomputedAnswer] = MappingProxyType({})
+        self._build_lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._answers)
+
+    def lookup(self, metric: str, period: str) -> Optional[PrecomputedAnswer]:
+        """Respuesta precalculada completa (con explicación) o None."""
+        answer = self._answers.get((metric, period))
+        if answer is None or answer.explanation is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return answer
+
+    def needs_retry(self) -> bool:
+        """Hay pares sin explicación y pasó `retry_seconds` desde el último build()."""
+        return (
+            self.incomplete > 0
+            and not self._build_lock.locked()
+            and self.attempted_at is not None
+            and time.time() - self.attempted_at >= self.retry_seconds
+        )
+
+    def invalidate(self) -> None:
+        """Descarta la tabla (cambió la versión de datos); se reconstruye con build()."""
+        self._answers = MappingProxyType({})
+        self.version = None
+        self.incomplete = 0
+
+    async def _run_pool(self, pairs: list[tuple[str, str]], job: Callable) -> list:
+        """Ejecuta `job` sobre cada par con `workers` workers consumiendo una cola."""
+        queue: asyncio.Queue = asyncio.Queue()
+        for i, pair in enumerate(pairs):
+            queue.put_nowait((i, pair))
+        results: list = [None] * len(pairs)
+
+        async def worker():
+            while True:
+                try:
+                    i, pair = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    results[i] = await job(*pair)
+                except Exception as e:
+                    logger.warning(f"Answer table: {pair} falló: {e}")
+
+        await asyncio.gather(*(worker() for _ in range(max(1, self.workers))))
+        return results
+
+    async def build(
+        self,
+        pairs: Iterable[tuple[str, str]],
+        fetch_data: FetchData,
+        generate_sql: Callable[[str, str], str],
+        explain: Optional[Explain] = None
+    ) -> str:
+        """
+        Materializa todos los pares y publica la nueva tabla.
+
+        Args:
+            pairs: Pares (métrica, período) del dominio
+            fetch_data: Async (métrica, período) -> dict con value/formatted
+            generate_sql: (métrica, período) -> SQL mostrado al usuario
+            explain: Async (métrica, período, valor formateado) -> explicación;
+                None o un retorno None deja el par sin explicación
+
+        Returns:
+            Versión (hash de datos) de la tabla publicada
+        """
+        async with self._build_lock:
+            start = time.perf_counter()
+            self.attempted_at = time.time()
+            pairs = list(pairs)
+            fetched = await self._run_pool(pairs, fetch_data)
+            values = {pair: data for pair, data in zip(pairs, fetched) if data}
+            version = data_version(values)
+            # Misma versión: se conservan las respuestas completas y solo se reintentan las demás
+            current = dict(self._answers) if version == self.version else {}
+            pending = [
+                pair for pair in values
+                if pair not in current or (explain is not None and current[pair].explanation is None)
+            ]
+            if not pending:
+                logger.info(f"Answer table: datos sin cambios (versión {version})")
+                return version
+
+            async def materialize(metric: str, period: str) -> PrecomputedAnswer:
+                data = values[(metric, period)]
+                explanation = await explain(metric, period, data["formatted"]) if explain else None
+                return PrecomputedAnswer(
+                    metric=metric,
+                    period=period,
+                    value=data["value"],
+                    formatted=data["formatted"],
+                    sql=generate_sql(metric, period),
+                    table=render_table(metric, period, data["formatted"]),
+                    explanation=explanation,
+                    data_version=version
+                )
+
+            answers = await self._run_pool(pending, materialize)
+            for answer in answers:
+                # Un reintento fallido no borra la respuesta (sin explicación) que ya había
+                if answer is not None and (answer.explanation or (answer.metric, answer.period) not in current):
+                    current[(answer.metric, answer.period)] = answer
+            self._answers = MappingProxyType(current)
+            self.version = version
+            self.built_at = time.time()
+            explained = sum(1 for a in self._answers.values() if a.explanation)
+            self.incomplete = len(values) - explained if explain is not None else 0
+            logger.info(
+                f"Answer table: {len(self._answers)} pares ({explained} con explicación, "
+                f"{len(pending)} calculados) versión {version} en {(time.perf_counter() - start) * 1000:.0f}ms"
+            )
+            return version
+
+
+# Instancia global
+answer_table = AnswerTable()
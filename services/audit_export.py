@@ -0,0 +1,266 @@
+"""
+Audit Export - Exportación de trazas a PDF/JSON fuera del event loop.
+
+El render se ejecuta en un pool de procesos: cada job abre su propia conexión
+al AuditStore, ingiere los JSONL pendientes y recorre las trazas con un cursor,
+así que exportaciones con muchas consultas usan memoria acotada. El archivo
+resultante se nombra por hash del contenido y se reutiliza si ya existe.
+
+Dependencia opcional para PDF:
+    uv add reportlab
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Optional
+
+from services.audit_store import AUDIT_DB_PATH, AuditStore
+from services.audit_trail import AUDIT_TRAIL_DIR
+
+logger = logging.getLogger(__name__)
+
+AUDIT_EXPORT_DIR = os.getenv("AUDIT_EXPORT_DIR", os.path.join(AUDIT_TRAIL_DIR, "exports"))
+AUDIT_EXPORT_WORKERS = int(os.getenv("AUDIT_EXPORT_WORKERS", "2"))
+
+EXPORT_FORMATS = ("pdf", "json")
+# Cambiar al modificar el layout para invalidar exportaciones cacheadas
+RENDER_VERSION = "1"
+
+SDRAG_BLUE = "#1e3a8a"
+SDRAG_LIGHT_BLUE = "#e0e7ff"
+
+
+# =============================================================================
+# Renderers (se ejecutan en el proceso worker)
+# =============================================================================
+
+def _content_hash(records: Iterable[dict], fmt: str) -> str:
+    digest = hashlib.sha256(f"{RENDER_VERSION}:{fmt}".encode())
+    for record in records:
+        digest.update(json.dumps(record, sort_keys=True, default=str).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def _render_json(records: Iterable[dict], output_path: Path) -> int:
+    """Escribe un bundle JSON sesión por sesión (sin materializar la lista)."""
+    count = 0
+    with open(output_path, "w", encoding="utf-8") as f:
+        generated_at = datetime.now(timezone.utc).isoformat()
+        f.write(f'{{"generated_at": "{generated_at}", "sessions": [\n')
+        for record in records:
+            if count:
+                f.write(",\n")
+            json.dump(record, f, ensure_ascii=False, default=str)
+            count += 1
+        f.write(f'\n], "count": {count}}}\n')
+    return count
+
+
+class _PdfWriter:
+    """Layout mínimo sobre el canvas de reportlab: cada página se emite al llenarse."""
+
+    def __init__(self, output_path: Path):
+        from reportlab.lib.pagesizes import letter
+        from reportlab.pdfgen.canvas import Canvas
+
+        self.width, self.height = letter
+        self.margin = 54
+        self.canvas = Canvas(str(output_path), pagesize=letter, pageCompression=1)
+        self.y = self.height - self.margin
+
+    def _ensure_space(self, needed: float) -> None:
+        if self.y - needed < self.margin:
+            self.canvas.showPage()
+            self.y = self.height - self.margin
+
+    def title(self, text: str) -> None:
+        from reportlab.lib import colors
+
+        self._ensure_space(40)
+        self.canvas.setFillColor(colors.HexColor(SDRAG_BLUE))
+        self.canvas.setFont("Helvetica-Bold", 20)
+        self.canvas.drawString(self.margin, self.y - 20, text)
+        self.canvas.setFillColor(colors.black)
+        self.y -= 40
+
+    def heading(self, text: str) -> None:
+        from reportlab.lib import colors
+
+        self._ensure_space(30)
+        self.canvas.setFillColor(colors.HexColor(SDRAG_LIGHT_BLUE))
+        self.canvas.rect(
+            self.margin, self.y - 18, self.width - 2 * self.margin, 18, stroke=0, fill=1
+        )
+        self.canvas.setFillColor(colors.HexColor(SDRAG_BLUE))
+        self.canvas.setFont("Helvetica-Bold", 11)
+        self.canvas.drawString(self.margin + 4, self.y - 13, text[:100])
+        self.canvas.setFillColor(colors.black)
+        self.y -= 26
+
+    def field(self, label: str, value: str, max_chars: int = 600) -> None:
+        from reportlab.lib.utils import simpleSplit
+
+        value = value if len(value) <= max_chars else value[:max_chars] + "..."
+        label_width = 110
+        lines = simpleSplit(value, "Helvetica", 9, self.width - 2 * self.margin - label_width)
+        for i, line in enumerate(lines or [""]):
+            self._ensure_space(12)
+            if i == 0:
+                self.canvas.setFont("Helvetica-Bold", 9)
+                self.canvas.drawString(self.margin, self.y - 9, label)
+            self.canvas.setFont("Helvetica", 9)
+            self.canvas.drawString(self.margin + label_width, self.y - 9, line)
+            self.y -= 12
+
+    def spacer(self, height: float = 8) -> None:
+        self.y -= height
+
+    def save(self) -> None:
+        self.canvas.save()
+
+
+def _render_pdf(records: Iterable[dict], output_path: Path) -> int:
+    """Genera el reporte PDF de auditoría (Fase 7, Tarea 7.2)."""
+    pdf = _PdfWriter(output_path)
+    pdf.title("SDRAG Audit Trail Report")
+    count = 0
+    for record in records:
+        count += 1
+        classification = record.get("classification") or {}
+        pdf.heading(f"{count}. {record.get('query', '')}")
+        pdf.field("Session ID", str(record.get("session_id", "")))
+        pdf.field("Usuario", str(record.get("user_id", "")))
+        pdf.field("Timestamp", str(record.get("timestamp", "")))
+        pdf.field("Ruta", str(classification.get("route", "N/A")))
+        pdf.field("Duración Total", f"{record.get('total_duration_ms') or 0:.0f} ms")
+        for i, step in enumerate(record.get("steps") or [], 1):
+            pdf.field(
+                f"{i}. {step.get('step_name', '')}",
+                f"[{step.get('step_type', '')}, {step.get('duration_ms') or 0:.0f} ms] "
+                f"{step.get('output', '')}",
+                max_chars=300
+            )
+        result = record.get("result") or {}
+        if result.get("sql"):
+            pdf.field("SQL", str(result["sql"]))
+        if result.get("answer"):
+            pdf.field("Respuesta", str(result["answer"]))
+        if record.get("error"):
+            pdf.field("Error", str(record["error"]))
+        pdf.spacer()
+    generated_at = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+    pdf.field("", f"Generado por SDRAG Chainlit | {generated_at} | {count} consultas")
+    pdf.save()
+    return count
+
+
+_RENDERERS = {"pdf": _render_pdf, "json": _render_json}
+
+
+def run_export_job(
+    session_ids: list[str],
+    fmt: str,
+    db_path: str,
+    trail_dir: str,
+    export_dir: str
+) -> str:
+    """
+    Job de exportación (punto de entrada del proceso worker).
+
+    Returns:
+        Ruta del archivo exportado (reutilizada si el contenido no cambió)
+    """
+    store = AuditStore(db_path)
+    try:
+        store.ingest_directory(trail_dir)
+        content_hash = _content_hash(store.iter_sessions(session_ids), fmt)
+        output_path = Path(export_dir) / f"audit_report_{content_hash[:16]}.{fmt}"
+        if output_path.exists():
+            return str(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = output_path.with_name(f".{output_path.name}.{os.getpid()}.tmp")
+        _RENDERERS[fmt](store.iter_sessions(session_ids), tmp_path)
+        os.replace(tmp_path, output_path)
+        return str(output_path)
+    finally:
+        store.close()
+
+
+# =============================================================================
+# Cola de exportación (event loop)
+# =============================================================================
+
+class AuditExporter:
+    """
+    Cola de jobs de exportación sobre un ProcessPoolExecutor.
+
+    Como máximo `max_workers` exportaciones se renderizan a la vez; el resto
+    espera su turno sin ocupar el event loop. Exportaciones idénticas en curso
+    se comparten.
+    """
+
+    def __init__(
+        self,
+        export_dir: str = AUDIT_EXPORT_DIR,
+        db_path: str = AUDIT_DB_PATH,
+        trail_dir: str = AUDIT_TRAIL_DIR,
+        max_workers: int = AUDIT_EXPORT_WORKERS
+    ):
+        self.export_dir = export_dir
+        self.db_path = db_path
+        self.trail_dir = trail_dir
+        self.max_workers = max_workers
+        self._pool = None
+        self._slots = asyncio.Semaphore(max_workers)
+        self._inflight: dict[tuple, asyncio.Future] = {}
+
+    def _get_pool(self):
+        if self._pool is None:
+            # Import diferido: multiprocessing solo se carga con la primera exportación
+            from concurrent.futures import ProcessPoolExecutor
+
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    async def export(self, session_ids: list[str], fmt: str = "pdf") -> Path:
+        """
+        Exporta las trazas indicadas y retorna la ruta del archivo.
+
+        Args:
+            session_ids: IDs de las consultas a incluir
+            fmt: "pdf" o "json"
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Formato no soportado: {fmt}")
+        key = (fmt, tuple(session_ids))
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._run(list(session_ids), fmt))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _run(self, session_ids: list[str], fmt: str) -> Path:
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            path = await loop.run_in_executor(
+                self._get_pool(),
+                run_export_job,
+                session_ids, fmt, self.db_path, self.trail_dir, self.export_dir
+            )
+        logger.info(f"Audit export: {len(session_ids)} consultas -> {path}")
+        return Path(path)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# Instancia global
+audit_exporter = AuditExporter()
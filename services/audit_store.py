@@ -0,0 +1,396 @@
+"""
+Audit Store - Índice SQLite del audit trail para consultas de auditoría.
+
+Carga por lotes los JSONL escritos por `services.audit_trail` a una base
+SQLite en modo WAL con índices por session_id, usuario, ruta, métrica y
+timestamp. Expone una API de consulta y un CLI:
+
+    python -m services.audit_store ingest
+    python -m services.audit_store sessions --user hector --metric ebitda --since 2026-09-01
+    python -m services.audit_store session <session_id>
+    python -m services.audit_store latency --since 2026-09-01
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional
+
+from services.audit_trail import AUDIT_TRAIL_DIR, SessionTrace, zstandard
+
+logger = logging.getLogger(__name__)
+
+AUDIT_DB_PATH = os.getenv("AUDIT_DB_PATH", os.path.join(AUDIT_TRAIL_DIR, "audit.db"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id        TEXT PRIMARY KEY,
+    user_id           TEXT NOT NULL,
+    timestamp         TEXT NOT NULL,
+    query             TEXT NOT NULL,
+    route             TEXT,
+    metric            TEXT,
+    period            TEXT,
+    total_duration_ms REAL,
+    error             TEXT,
+    record            TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS steps (
+    session_id  TEXT NOT NULL,
+    step_index  INTEGER NOT NULL,
+    step_name   TEXT NOT NULL,
+    step_type   TEXT,
+    duration_ms REAL,
+    PRIMARY KEY (session_id, step_index)
+);
+CREATE TABLE IF NOT EXISTS ingest_state (
+    path   TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_user_ts ON sessions (user_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_sessions_metric_ts ON sessions (metric, timestamp);
+CREATE INDEX IF NOT EXISTS idx_sessions_route_ts ON sessions (route, timestamp);
+CREATE INDEX IF NOT EXISTS idx_sessions_ts ON sessions (timestamp);
+CREATE INDEX IF NOT EXISTS idx_steps_name ON steps (step_name);
+"""
+
+_SUMMARY_COLUMNS = (
+    "session_id", "user_id", "timestamp", "query", "route", "metric", "period",
+    "total_duration_ms", "error"
+)
+
+
+def _normalize_timestamp(value: Any) -> str:
+    """Normaliza un timestamp ISO a UTC con formato fijo (ordenable como texto)."""
+    if not value:
+        dt = datetime.now(timezone.utc)
+    elif isinstance(value, datetime):
+        dt = value
+    else:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")
+
+
+class AuditStore:
+    """
+    Almacén indexado de trazas de auditoría sobre SQLite (WAL).
+
+    Las inserciones son idempotentes por session_id, así que re-ingerir un
+    archivo JSONL no duplica registros.
+    """
+
+    def __init__(self, db_path: str = AUDIT_DB_PATH, batch_size: int = 1000):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        if db_path != ":memory:":
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=30.0)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    # -------------------------------------------------------------------------
+    # Carga
+    # -------------------------------------------------------------------------
+
+    def add_sessions(self, records: Iterable[Any]) -> int:
+        """
+        Inserta trazas en lotes de `batch_size` por transacción.
+
+        Args:
+            records: SessionTrace o dicts con el formato de SessionTrace
+
+        Returns:
+            Número de sesiones nuevas insertadas
+        """
+        inserted = 0
+        session_rows, step_rows = [], []
+        for record in records:
+            if isinstance(record, SessionTrace):
+                record = record.to_dict()
+            classification = record.get("classification") or {}
+            session_rows.append((
+                record["session_id"],
+                record.get("user_id", ""),
+                _normalize_timestamp(record.get("timestamp")),
+                record.get("query", ""),
+                classification.get("route"),
+                classification.get("metric"),
+                classification.get("period"),
+                record.get("total_duration_ms"),
+                record.get("error"),
+                json.dumps(record, ensure_ascii=False, default=str),
+            ))
+            for i, step in enumerate(record.get("steps") or []):
+                step_rows.append((
+                    record["session_id"], i, step.get("step_name", ""),
+                    step.get("step_type"), step.get("duration_ms")
+                ))
+            if len(session_rows) >= self.batch_size:
+                inserted += self._insert_batch(session_rows, step_rows)
+                session_rows, step_rows = [], []
+        if session_rows:
+            inserted += self._insert_batch(session_rows, step_rows)
+        return inserted
+
+    def _insert_batch(self, session_rows: list[tuple], step_rows: list[tuple]) -> int:
+        with self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                session_rows
+            )
+            inserted = self.conn.total_changes - before
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO steps VALUES (?, ?, ?, ?, ?)", step_rows
+            )
+        return inserted
+
+    def ingest_directory(self, directory: str = AUDIT_TRAIL_DIR) -> int:
+        """
+        Ingiere los JSONL del audit trail de forma incremental.
+
+        Para `.jsonl` se recuerda el offset de la última línea completa leída,
+        de modo que el archivo activo del writer puede re-ingerirse sin releer
+        lo ya cargado. Los `.jsonl.zst` se releen completos solo cuando cambian
+        de tamaño (la inserción idempotente evita duplicados).
+
+        Returns:
+            Número de sesiones nuevas insertadas
+        """
+        total = 0
+        for path in sorted(Path(directory).glob("audit_trail_*.jsonl*")):
+            row = self.conn.execute(
+                "SELECT offset FROM ingest_state WHERE path = ?", (str(path),)
+            ).fetchone()
+            offset = row["offset"] if row else 0
+            size = path.stat().st_size
+            if offset >= size:
+                continue
+            if path.suffix == ".zst":
+                if zstandard is None:
+                    logger.warning(f"Omitiendo {path.name}: 'zstandard' no está instalado")
+                    continue
+                records, new_offset = self._read_zst(path), size
+            else:
+                records, new_offset = self._read_jsonl(path, offset)
+            total += self.add_sessions(records)
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO ingest_state VALUES (?, ?)", (str(path), new_offset)
+                )
+        logger.info(f"Audit store: {total} sesiones nuevas desde {directory}")
+        return total
+
+    @staticmethod
+    def _read_jsonl(path: Path, offset: int) -> tuple[list[dict], int]:
+        records = []
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Línea parcial: el writer aún no termina de escribirla
+                offset += len(line)
+                if line.strip():
+                    records.append(json.loads(line))
+        return records, offset
+
+    @staticmethod
+    def _read_zst(path: Path) -> list[dict]:
+        with open(path, "rb") as f:
+            raw = zstandard.ZstdDecompressor().stream_reader(f).read()
+        return [json.loads(line) for line in raw.splitlines() if line.strip()]
+
+    # -------------------------------------------------------------------------
+    # Consultas
+    # -------------------------------------------------------------------------
+
+    def get_session(self, session_id: str) -> Optional[dict]:
+        """Recupera la traza completa de una sesión."""
+        row = self.conn.execute(
+            "SELECT record FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return json.loads(row["record"]) if row else None
+
+    def iter_sessions(self, session_ids: Iterable[str], chunk_size: int = 500) -> Iterator[dict]:
+        """
+        Itera trazas completas sin cargarlas todas en memoria.
+
+        Los ids se consultan por bloques de `chunk_size`; dentro de cada bloque
+        las trazas salen ordenadas por timestamp.
+        """
+        ids = list(dict.fromkeys(session_ids))
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            placeholders = ", ".join("?" * len(chunk))
+            cursor = self.conn.execute(
+                f"SELECT record FROM sessions WHERE session_id IN ({placeholders}) "
+                "ORDER BY timestamp",
+                chunk
+            )
+            for row in cursor:
+                yield json.loads(row["record"])
+
+    def find_sessions(
+        self,
+        user_id: Optional[str] = None,
+        metric: Optional[str] = None,
+        route: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: int = 100
+    ) -> list[dict]:
+        """
+        Busca sesiones por usuario, métrica, ruta y rango de fechas.
+
+        Args:
+            since/until: Fechas ISO (inclusivo / exclusivo)
+
+        Returns:
+            Resúmenes de sesión ordenados del más reciente al más antiguo
+        """
+        where, params = self._filters(user_id, metric, route, since, until)
+        sql = (
+            f"SELECT {', '.join(_SUMMARY_COLUMNS)} FROM sessions{where} "
+            f"ORDER BY timestamp DESC LIMIT ?"
+        )
+        rows = self.conn.execute(sql, (*params, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def iter_query_sequence(
+        self,
+        since: Optional[str] = None,
+        until: Optional[str] = None
+    ) -> Iterator[dict]:
+        """
+        Consultas (user_id, timestamp, route, metric, period) en orden por
+        usuario y timestamp, para aprender qué se pregunta después de qué.
+        """
+        where, params = self._filters(None, None, None, since, until)
+        cursor = self.conn.execute(
+            f"SELECT user_id, timestamp, route, metric, period FROM sessions{where} "
+            "ORDER BY user_id, timestamp",
+            params
+        )
+        for row in cursor:
+            yield dict(row)
+
+    def stage_latency_percentiles(
+        self,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        percentiles: tuple[float, ...] = (0.5, 0.95, 0.99)
+    ):
+        """
+        Percentiles de latencia por ruta y etapa (cl.Step).
+
+        Returns:
+            DataFrame con columnas route, step_name, count, mean_ms y p50_ms...
+            (vacío, con las mismas columnas, si ninguna etapa cumple el filtro)
+        """
+        import pandas as pd
+
+        where, params = self._filters(None, None, None, since, until, prefix="s.")
+        df = pd.read_sql_query(
+            "SELECT s.route AS route, st.step_name AS step_name, st.duration_ms AS duration_ms "
+            f"FROM steps st JOIN sessions s USING (session_id){where}",
+            self.conn,
+            params=params
+        )
+        columns = ["route", "step_name", "count", "mean_ms", *(f"p{round(q * 100):d}_ms" for q in percentiles)]
+        if df.empty:
+            return pd.DataFrame(columns=columns)
+        df["route"] = df["route"].fillna("unknown")
+        df["duration_ms"] = df["duration_ms"].astype(float)
+        grouped = df.groupby(["route", "step_name"], sort=True)["duration_ms"]
+        summary = grouped.agg(count="count", mean_ms="mean")
+        quantiles = grouped.quantile(list(percentiles)).unstack()
+        quantiles.columns = [f"p{round(q * 100):d}_ms" for q in quantiles.columns]
+        return summary.join(quantiles).reset_index()
+
+    @staticmethod
+    def _filters(
+        user_id: Optional[str],
+        metric: Optional[str],
+        route: Optional[str],
+        since: Optional[str],
+        until: Optional[str],
+        prefix: str = ""
+    ) -> tuple[str, list]:
+        clauses, params = [], []
+        for column, value in (("user_id", user_id), ("metric", metric), ("route", route)):
+            if value is not None:
+                clauses.append(f"{prefix}{column} = ?")
+                params.append(value)
+        if since:
+            clauses.append(f"{prefix}timestamp >= ?")
+            params.append(_normalize_timestamp(since))
+        if until:
+            clauses.append(f"{prefix}timestamp < ?")
+            params.append(_normalize_timestamp(until))
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Consultas sobre el audit trail de SDRAG")
+    parser.add_argument("--db", default=AUDIT_DB_PATH, help="Ruta de la base SQLite")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ingest = sub.add_parser("ingest", help="Cargar JSONL del audit trail")
+    ingest.add_argument("--dir", default=AUDIT_TRAIL_DIR)
+
+    sessions = sub.add_parser("sessions", help="Buscar sesiones")
+    sessions.add_argument("--user")
+    sessions.add_argument("--metric")
+    sessions.add_argument("--route")
+    sessions.add_argument("--since")
+    sessions.add_argument("--until")
+    sessions.add_argument("--limit", type=int, default=100)
+
+    session = sub.add_parser("session", help="Traza completa de una sesión")
+    session.add_argument("session_id")
+
+    latency = sub.add_parser("latency", help="Percentiles de latencia por etapa")
+    latency.add_argument("--since")
+    latency.add_argument("--until")
+
+    args = parser.parse_args(argv)
+    store = AuditStore(args.db)
+    try:
+        if args.command == "ingest":
+            print(f"{store.ingest_directory(args.dir)} sesiones nuevas")
+        elif args.command == "sessions":
+            for row in store.find_sessions(
+                args.user, args.metric, args.route, args.since, args.until, args.limit
+            ):
+                print(json.dumps(row, ensure_ascii=False))
+        elif args.command == "session":
+            record = store.get_session(args.session_id)
+            if record is None:
+                print(f"Sesión {args.session_id} no encontrada", file=sys.stderr)
+                return 1
+            print(json.dumps(record, ensure_ascii=False, indent=2))
+        elif args.command == "latency":
+            print(store.stage_latency_percentiles(args.since, args.until).to_string(index=False))
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""
+Audit Trail - Escritura asíncrona de trazas de sesión.
+
+Cada consulta genera un SessionTrace (ver Fase 7). Las trazas se encolan desde
+el handler de Chainlit sin bloquear y un task en background las escribe por
+lotes a archivos JSONL append-only, rotados por tamaño y tiempo y
+opcionalmente comprimidos con zstd.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Optional, Union
+
+try:
+    import zstandard
+except ImportError:  # Dependencia opcional
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+AUDIT_TRAIL_DIR = os.getenv("AUDIT_TRAIL_DIR", "./audit_trails")
+AUDIT_MAX_FILE_MB = float(os.getenv("AUDIT_MAX_FILE_MB", "64"))
+AUDIT_ROTATE_SECONDS = float(os.getenv("AUDIT_ROTATE_SECONDS", "86400"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))
+AUDIT_FSYNC_INTERVAL = float(os.getenv("AUDIT_FSYNC_INTERVAL", "5.0"))
+AUDIT_COMPRESSION = os.getenv("AUDIT_COMPRESSION", "").lower()  # "" o "zstd"
+
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# =============================================================================
+# Modelos de traza
+# =============================================================================
+
+@dataclass
+class StepTrace:
+    """Traza de un paso de ejecución (un cl.Step)."""
+    step_name: str
+    step_type: str  # "tool", "llm", "retrieval"
+    input: str
+    output: str
+    duration_ms: float
+    timestamp: str = field(default_factory=_utc_now)
+    metadata: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class SessionTrace:
+    """Traza completa de una consulta."""
+    session_id: str
+    user_id: str
+    query: str
+    timestamp: str = field(default_factory=_utc_now)
+    steps: list[StepTrace] = field(default_factory=list)
+    total_duration_ms: float = 0
+    result: dict[str, Any] = field(default_factory=dict)
+    classification: Optional[dict[str, Any]] = None
+    error: Optional[str] = None
+
+    def add_step(
+        self,
+        step_name: str,
+        step_type: str,
+        input_data: str,
+        output_data: str,
+        duration_ms: float,
+        metadata: Optional[dict] = None
+    ) -> None:
+        """Agrega un paso a la traza."""
+        self.steps.append(StepTrace(
+            step_name=step_name,
+            step_type=step_type,
+            input=input_data,
+            output=output_data,
+            duration_ms=duration_ms,
+            metadata=metadata or {}
+        ))
+
+    def to_dict(self) -> dict:
+        """Serializa la traza a dict (compatible con JSON)."""
+        return asdict(self)
+
+
+# =============================================================================
+# Archivo JSONL rotado
+# =============================================================================
+
+class _RotatingJsonlFile:
+    """
+    Archivo JSONL append-only con rotación por tamaño y por tiempo.
+
+    El tamaño se mide en bytes sin comprimir. Con compresión zstd cada archivo
+    rotado es un frame independiente (`.jsonl.zst`).
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        max_bytes: int,
+        rotate_seconds: float,
+        compress: bool = False
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.compress = compress
+        self.path: Optional[Path] = None
+        self._fh = None
+        self._writer = None
+        self._bytes = 0
+        self._opened_at = 0.0
+        self._seq = 0
+
+    def write_lines(self, lines: list[bytes]) -> None:
+        """Escribe líneas ya serializadas, rotando si corresponde."""
+        for line in lines:
+            if self._should_rotate(len(line)):
+                self._open_new()
+            self._writer.write(line)
+            self._bytes += len(line)
+
+    def flush(self, fsync: bool = False) -> None:
+        """Vacía buffers al sistema operativo y opcionalmente hace fsync."""
+        if self._fh is None:
+            return
+        if self.compress:
+            self._writer.flush(zstandard.FLUSH_BLOCK)
+        self._fh.flush()
+        if fsync:
+            os.fsync(self._fh.fileno())
+
+    def close(self) -> None:
+        """Cierra el archivo actual (fsync incluido)."""
+        if self._fh is None:
+            return
+        if self.compress:
+            self._writer.flush(zstandard.FLUSH_FRAME)
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._fh.close()
+        self._fh = self._writer = None
+
+    def _should_rotate(self, incoming: int) -> bool:
+        if self._fh is None:
+            return True
+        if self._bytes and self._bytes + incoming > self.max_bytes:
+            return True
+        return time.monotonic() - self._opened_at >= self.rotate_seconds
+
+    def _open_new(self) -> None:
+        self.close()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+        suffix = ".jsonl.zst" if self.compress else ".jsonl"
+        while True:
+            self._seq += 1
+            path = self.directory / f"audit_trail_{stamp}_{self._seq:04d}{suffix}"
+            if not path.exists():
+                break
+        self.path = path
+        self._fh = open(path, "ab")
+        if self.compress:
+            self._writer = zstandard.ZstdCompressor().stream_writer(
+                self._fh, closefd=False
+            )
+        else:
+            self._writer = self._fh
+        self._bytes = 0
+        self._opened_at = time.monotonic()
+        logger.info(f"Audit trail: nuevo archivo {path.name}")
+
+
+# =============================================================================
+# Writer asíncrono
+# =============================================================================
+
+_STOP = object()
+
+
+class AuditWriter:
+    """
+    Sink asíncrono de audit trail.
+
+    `record()` encola la traza sin bloquear el event loop; un task en
+    background agrupa las trazas en lotes (hasta `batch_size` o
+    `flush_interval` segundos) y las escribe en un thread. El fsync se hace
+    como máximo cada `fsync_interval` segundos (0 = en cada lote).
+    """
+
+    def __init__(
+        self,
+        directory: str = AUDIT_TRAIL_DIR,
+        max_file_mb: float = AUDIT_MAX_FILE_MB,
+        rotate_seconds: float = AUDIT_ROTATE_SECONDS,
+        flush_interval: float = AUDIT_FLUSH_INTERVAL,
+        fsync_interval: float = AUDIT_FSYNC_INTERVAL,
+        compression: str = AUDIT_COMPRESSION,
+        batch_size: int = 256,
+        max_queue: int = 10_000
+    ):
+        compress = compression == "zstd"
+        if compress and zstandard is None:
+            logger.warning("AUDIT_COMPRESSION=zstd pero 'zstandard' no está instalado; sin compresión")
+            compress = False
+
+        self.directory = Path(directory)
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self._file = _RotatingJsonlFile(
+            self.directory,
+            max_bytes=int(max_file_mb * 1024 * 1024),
+            rotate_seconds=rotate_seconds,
+            compress=compress
+        )
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_fsync = time.monotonic()
+        self.written = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        """Arranca el task de escritura (requiere event loop activo)."""
+        if self._task is not None and not self._task.done():
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def record(self, trace: Union[SessionTrace, dict]) -> bool:
+        """
+        Encola una traza sin bloquear.
+
+        Args:
+            trace: SessionTrace (o dict equivalente) ya finalizado
+
+        Returns:
+            False si la cola estaba llena y la traza se descartó
+        """
+        if self._task is None or self._task.done():
+            self.start()
+        try:
+            self._queue.put_nowait(trace)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Audit trail: cola llena, traza descartada (total={self.dropped})")
+            return False
+
+    async def flush(self) -> None:
+        """Espera a que las trazas encoladas hasta ahora estén escritas en disco."""
+        if self._task is None or self._task.done():
+            return
+        done = asyncio.get_running_loop().create_future()
+        await self._queue.put(done)
+        await done
+
+    async def close(self) -> None:
+        """Drena la cola, escribe lo pendiente y cierra el archivo."""
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+        await asyncio.to_thread(self._file.close)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            if isinstance(item, asyncio.Future):
+                item.set_result(None)
+                continue
+            batch, waiters = [item], []
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                if isinstance(item, asyncio.Future):
+                    waiters.append(item)  # flush(): escribir el lote ya acumulado
+                    break
+                batch.append(item)
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                logger.error(f"Audit trail: error escribiendo lote de {len(batch)} trazas: {e}")
+            for waiter in waiters:
+                waiter.set_result(None)
+
+    def _write_batch(self, batch: list) -> None:
+        lines = []
+        for trace in batch:
+            record = trace.to_dict() if isinstance(trace, SessionTrace) else trace
+            lines.append(
+                json.dumps(record, ensure_ascii=False, default=str).encode("utf-8") + b"\n"
+            )
+        self._file.write_lines(lines)
+        now = time.monotonic()
+        fsync = now - self._last_fsync >= self.fsync_interval
+        self._file.flush(fsync=fsync)
+        if fsync:
+            self._last_fsync = now
+        self.written += len(lines)
+
+
+# Instancia global
+audit_writer = AuditWriter()
@@ -0,0 +1,252 @@
+"""
+Credenciales con hash y verificación asíncrona para password_auth_callback.
+
+- Hashes scrypt con salt (stdlib) en un archivo JSON; también verifica
+  hashes argon2 si `argon2-cffi` está instalado.
+- La KDF corre en un pool de threads dedicado (AUTH_WORKERS), así que una
+  ráfaga de logins no bloquea el event loop ni el executor por defecto.
+- Las verificaciones exitosas se cachean por AUTH_CACHE_TTL segundos con
+  clave HMAC(secreto del proceso, usuario + password + hash): el cache
+  nunca guarda passwords y un cambio de hash lo invalida.
+
+Archivo de credenciales (CHAINLIT_CREDENTIALS_FILE):
+    {"users": {"hector": {"hash": "scrypt$16384$8$1$<salt>$<hash>", "role": "admin"}}}
+
+CLI:
+    python -m services.auth hash
+    python -m services.auth add hector --role admin
+"""
+import argparse
+import asyncio
+import base64
+import getpass
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+try:
+    from argon2 import PasswordHasher as _Argon2Hasher
+    from argon2.exceptions import VerificationError as _Argon2Error
+except ImportError:  # pragma: no cover - depende del entorno
+    _Argon2Hasher = None
+    _Argon2Error = Exception
+
+logger = logging.getLogger(__name__)
+
+CHAINLIT_CREDENTIALS_FILE = os.getenv("CHAINLIT_CREDENTIALS_FILE", "credentials.json")
+AUTH_WORKERS = int(os.getenv("AUTH_WORKERS", "2"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "300"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "1024"))
+
+# Parámetros scrypt (~16 MiB de memoria por verificación)
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def hash_password(password: str, n: int = SCRYPT_N, r: int = SCRYPT_R, p: int = SCRYPT_P) -> str:
+    """Hash scrypt con salt aleatorio: scrypt$n$r$p$salt$hash (base64)."""
+    salt = secrets.token_bytes(16)
+    digest = hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p, maxmem=2 ** 26)
+    return f"scrypt${n}${r}${p}${_b64(salt)}${_b64(digest)}"
+
+
+def verify_password(password: str, encoded: str) -> bool:
+    """
+    Verifica un password contra su hash (tiempo constante).
+
+    Soporta scrypt (este módulo) y argon2 ($argon2id$..., con argon2-cffi).
+    """
+    if encoded.startswith("$argon2"):
+        if _Argon2Hasher is None:
+            logger.error("Hash argon2 pero argon2-cffi no está instalado")
+            return False
+        try:
+            return _Argon2Hasher().verify(encoded, password)
+        except _Argon2Error:
+            return False
+    try:
+        scheme, n, r, p, salt, expected = encoded.split("$")
+        if scheme != "scrypt":
+            return False
+        digest = hashlib.scrypt(
+            password.encode("utf-8"), salt=base64.b64decode(salt),
+            n=int(n), r=int(r), p=int(p), maxmem=2 ** 26
+        )
+        expected_digest = base64.b64decode(expected)
+    except ValueError:  # Incluye binascii.Error (base64 inválido)
+        return False
+    return hmac.compare_digest(digest, expected_digest)
+
+
+class CredentialStore:
+    """
+    Usuarios con hash cargados desde archivo, verificados fuera del event loop.
+
+    Si el archivo no existe se usa CHAINLIT_USER con CHAINLIT_PASSWORD_HASH
+    (o, solo para desarrollo, CHAINLIT_PASSWORD, que se hashea al cargar).
+    Sin ninguno de los tres no hay usuarios y todo login se rechaza.
+    """
+
+    def __init__(
+        self,
+        path: str = CHAINLIT_CREDENTIALS_FILE,
+        workers: int = AUTH_WORKERS,
+        cache_ttl: float = AUTH_CACHE_TTL,
+        cache_size: int = AUTH_CACHE_SIZE
+    ):
+        self.path = Path(path)
+        self.workers = workers
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._users: Optional[dict[str, dict]] = None
+        self._mtime: Optional[float] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._cache: dict[bytes, tuple[float, dict]] = {}
+        self._cache_key = secrets.token_bytes(32)
+        self._dummy_hash: Optional[str] = None
+
+    # -------------------------------------------------------------------------
+    # Carga
+    # -------------------------------------------------------------------------
+
+    def _load_env(self) -> dict[str, dict]:
+        username = os.getenv("CHAINLIT_USER", "hector")
+        password_hash = os.getenv("CHAINLIT_PASSWORD_HASH")
+        if not password_hash:
+            password = os.getenv("CHAINLIT_PASSWORD", "")
+            if not password:
+                logger.error(
+                    f"Auth: sin {self.path}, CHAINLIT_PASSWORD_HASH ni CHAINLIT_PASSWORD; "
+                    "se rechazarán todos los logins"
+                )
+                return {}
+            logger.warning(
+                "Auth: sin archivo de credenciales ni CHAINLIT_PASSWORD_HASH; "
+                "usando CHAINLIT_PASSWORD (solo desarrollo)"
+            )
+            password_hash = hash_password(password)
+        return {username: {"hash": password_hash, "role": "admin"}}
+
+    def users(self) -> dict[str, dict]:
+        """Usuarios vigentes; recarga el archivo si cambió."""
+        try:
+            mtime = self.path.stat().st_mtime
+        except FileNotFoundError:
+            if self._mtime is not None or self._users is None:
+                self._users = self._load_env()
+                self._mtime = None
+            return self._users
+        if mtime != self._mtime:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            self._users = data.get("users", {})
+            self._mtime = mtime
+            self._cache.clear()
+            logger.info(f"Auth: {len(self._users)} usuarios cargados de {self.path}")
+        return self._users
+
+    # -------------------------------------------------------------------------
+    # Verificación
+    # -------------------------------------------------------------------------
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="auth")
+        return self._executor
+
+    def _digest(self, username: str, password: str, encoded: str) -> bytes:
+        message = "\0".join((username, password, encoded)).encode("utf-8")
+        return hmac.new(self._cache_key, message, hashlib.sha256).digest()
+
+    async def verify(self, username: str, password: str) -> Optional[dict]:
+        """
+        Verifica credenciales sin bloquear el event loop.
+
+        Returns:
+            Metadata del usuario (sin el hash) o None si no son válidas
+        """
+        if not password:
+            return None
+        loop = asyncio.get_running_loop()
+        # La carga puede hashear CHAINLIT_PASSWORD (scrypt): también fuera del loop
+        users = await loop.run_in_executor(self._get_executor(), self.users)
+        user = users.get(username)
+        if user is None and self._dummy_hash is None:
+            # Hash señuelo: usuarios inexistentes cuestan lo mismo que los reales
+            self._dummy_hash = await loop.run_in_executor(
+                self._get_executor(), hash_password, secrets.token_urlsafe(16)
+            )
+        encoded = user["hash"] if user else self._dummy_hash
+        key = self._digest(username, password, encoded)
+
+        now = time.monotonic()
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+        valid = await loop.run_in_executor(self._get_executor(), verify_password, password, encoded)
+        if not (valid and user):
+            return None
+
+        metadata = {k: v for k, v in user.items() if k != "hash"}
+        if len(self._cache) >= self.cache_size:
+            self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+            if len(self._cache) >= self.cache_size:
+                self._cache.pop(next(iter(self._cache)))
+        self._cache[key] = (now + self.cache_ttl, metadata)
+        return metadata
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Credenciales de SDRAG Chainlit")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("hash", help="Imprime el hash de un password")
+    add = sub.add_parser("add", help="Agrega o actualiza un usuario en el archivo")
+    add.add_argument("username")
+    add.add_argument("--role", default="user")
+    add.add_argument("--file", default=CHAINLIT_CREDENTIALS_FILE)
+    args = parser.parse_args(argv)
+
+    password = getpass.getpass("Password: ")
+    if args.command == "hash":
+        print(hash_password(password))
+        return 0
+
+    path = Path(args.file)
+    data = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {"users": {}}
+    data["users"][args.username] = {"hash": hash_password(password), "role": args.role}
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(json.dumps(data, indent=2), encoding="utf-8")
+    os.chmod(tmp, 0o600)
+    os.replace(tmp, path)
+    print(f"Usuario {args.username} guardado en {path}")
+    return 0
+
+
+# Instancia global
+credential_store = CredentialStore()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
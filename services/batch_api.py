@@ -0,0 +1,343 @@
+"""
+API HTTP por lotes (sin UI) sobre la app FastAPI de Chainlit.
+
+`POST /api/batch` recibe una lista de consultas en lenguaje natural o
+estructuradas (métrica, período), las resuelve concurrentemente y devuelve
+cada resultado en cuanto está listo, como NDJSON (una línea JSON por
+consulta) o Arrow IPC stream (un record batch por grupo de resultados).
+
+    {"queries": ["revenue Q4 2024", {"metric": "ebitda", "period": "2023"}],
+     "explain": false, "format": "ndjson"}
+
+- Autenticación: token JWT de Chainlit (cookie o `Authorization: Bearer`)
+  o `Authorization: Basic` verificado con el credential store.
+- Clasificación y datos de todas las consultas en paralelo, con a lo más
+  BATCH_CONCURRENCY en vuelo; el orden de salida es el de terminación y
+  cada fila lleva su `index` en la petición.
+- Las explicaciones (LLM) solo se generan si `explain` es true.
+- Un error en una consulta se reporta en su fila (`error`) sin abortar el lote.
+"""
+import asyncio
+import base64
+import binascii
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+try:
+    import pyarrow
+    import pyarrow.ipc  # noqa: F401
+except ImportError:  # Dependencia opcional
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+BATCH_API_ENABLED = os.getenv("BATCH_API_ENABLED", "true").lower() == "true"
+BATCH_API_PATH = os.getenv("BATCH_API_PATH", "/api/batch")
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "1000"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "16"))
+# Filas por record batch en la salida Arrow
+BATCH_ARROW_ROWS = int(os.getenv("BATCH_ARROW_ROWS", "64"))
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+# Columnas de cada fila (también el esquema Arrow): nombre -> tipo
+RESULT_FIELDS = {
+    "index": "int64",
+    "query": "string",
+    "route": "string",
+    "decided_by": "string",
+    "match_confidence": "float64",
+    "metric": "string",
+    "period": "string",
+    "derived": "string",
+    "value": "float64",
+    "formatted": "string",
+    "base_value": "float64",
+    "change": "float64",
+    "change_pct": "float64",
+    "source": "string",
+    "data_version": "string",
+    "sql": "string",
+    "explanation": "string",
+    "error": "string",
+    "elapsed_ms": "float64",
+}
+
+# Marcador de fin de un Arrow IPC stream (continuación + longitud 0)
+_ARROW_EOS = b"\xff\xff\xff\xff\x00\x00\x00\x00"
+
+
+class BatchRequestError(ValueError):
+    """Petición mal formada (HTTP 400) o formato no disponible (HTTP 406)."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass(frozen=True)
+class BatchItem:
+    """Una consulta del lote: texto libre o par (métrica, período)."""
+    index: int
+    query: Optional[str] = None
+    metric: Optional[str] = None
+    period: Optional[str] = None
+    derived: Optional[str] = None
+
+
+Answer = Callable[[BatchItem, bool, str], Awaitable[dict]]
+VerifyPassword = Callable[[str, str], Awaitable[Optional[dict]]]
+VerifyToken = Callable[[str], Optional[str]]
+
+
+def parse_batch(body, max_queries: int = BATCH_MAX_QUERIES) -> tuple[list[BatchItem], bool, Optional[str]]:
+    """
+    Valida el cuerpo JSON de la petición.
+
+    Args:
+        body: {"queries": [...], "explain": bool, "format": "ndjson"|"arrow"}; cada
+            consulta es un string, {"query": str} o {"metric", "period", "derived"?}
+        max_queries: Tamaño máximo del lote
+
+    Returns:
+        (consultas, explain, formato pedido o None)
+
+    Raises:
+        BatchRequestError: Si el cuerpo no cumple el esquema
+    """
+    if not isinstance(body, dict) or not isinstance(body.get("queries"), list):
+        raise BatchRequestError('Se esperaba {"queries": [...]}')
+    queries = body["queries"]
+    if not queries:
+        raise BatchRequestError("El lote está vacío")
+    if len(queries) > max_queries:
+        raise BatchRequestError(f"El lote excede {max_queries} consultas")
+    explain = body.get("explain", False)
+    if not isinstance(explain, bool):
+        raise BatchRequestError('"explain" debe ser booleano')
+    fmt = body.get("format")
+    if fmt is not None and fmt not in MEDIA_TYPES:
+        raise BatchRequestError(f'"format" debe ser uno de: {", ".join(MEDIA_TYPES)}')
+
+    items = []
+    for index, entry in enumerate(queries):
+        if isinstance(entry, str):
+            entry = {"query": entry}
+        if not isinstance(entry, dict):
+            raise BatchRequestError(f"Consulta {index}: se esperaba string u objeto")
+        if isinstance(entry.get("query"), str) and entry["query"].strip():
+            items.append(BatchItem(index, query=entry["query"]))
+        elif isinstance(entry.get("metric"), str) and isinstance(entry.get("period"), str):
+            derived = entry.get("derived")
+            if derived is not None and not isinstance(derived, str):
+                raise BatchRequestError(f'Consulta {index}: "derived" debe ser string')
+            items.append(BatchItem(index, metric=entry["metric"], period=entry["period"], derived=derived))
+        else:
+            raise BatchRequestError(f'Consulta {index}: se esperaba "query" o "metric" y "period"')
+    return items, explain, fmt
+
+
+def negotiate_format(requested: Optional[str], accept: Optional[str]) -> str:
+    """
+    Formato de salida: el del cuerpo, si no el del header Accept, si no NDJSON.
+
+    Raises:
+        BatchRequestError: 406 si se pide Arrow y pyarrow no está instalado
+    """
+    fmt = requested
+    if fmt is None:
+        fmt = "arrow" if accept and MEDIA_TYPES["arrow"] in accept else "ndjson"
+    if fmt == "arrow" and pyarrow is None:
+        raise BatchRequestError("Salida Arrow no disponible (pyarrow no instalado)", status_code=406)
+    return fmt
+
+
+def result_row(item: BatchItem, **values) -> dict:
+    """Fila completa del resultado (columnas ausentes en None)."""
+    row = dict.fromkeys(RESULT_FIELDS)
+    row.update(index=item.index, query=item.query, metric=item.metric, period=item.period, derived=item.derived)
+    row.update({k: v for k, v in values.items() if k in RESULT_FIELDS})
+    return row
+
+
+async def ndjson_stream(rows: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    """Una línea JSON por resultado, enviada en cuanto llega."""
+    async for row in rows:
+        yield (json.dumps(row, ensure_ascii=False, default=str) + "\n").encode()
+
+
+def arrow_schema():
+    types = {"int64": pyarrow.int64(), "float64": pyarrow.float64(), "string": pyarrow.string()}
+    return pyarrow.schema([(name, types[kind]) for name, kind in RESULT_FIELDS.items()])
+
+
+async def arrow_stream(rows: AsyncIterator[dict], batch_rows: int = BATCH_ARROW_ROWS) -> AsyncIterator[bytes]:
+    """
+    Arrow IPC stream: esquema, un record batch cada `batch_rows` resultados y EOS.
+
+    Los mensajes se serializan por separado para poder enviarlos conforme
+    se completan los grupos, sin acumular el stream entero en memoria.
+    """
+    schema = arrow_schema()
+    yield schema.serialize().to_pybytes()
+    pending = []
+    async for row in rows:
+        pending.append(row)
+        if len(pending) >= batch_rows:
+            yield pyarrow.RecordBatch.from_pylist(pending, schema=schema).serialize().to_pybytes()
+            pending = []
+    if pending:
+        yield pyarrow.RecordBatch.from_pylist(pending, schema=schema).serialize().to_pybytes()
+    yield _ARROW_EOS
+
+
+class BatchAPI:
+    """
+    Endpoint por lotes: autenticación, ejecución concurrente y streaming.
+
+    Args:
+        answer: Corrutina (consulta, explain, user_id) -> columnas del resultado
+        verify_password: Corrutina (usuario, contraseña) -> metadata o None
+        verify_token: Función token JWT -> identificador de usuario o None
+        concurrency: Consultas en vuelo a la vez
+        max_queries: Tamaño máximo del lote
+    """
+
+    def __init__(
+        self,
+        answer: Answer,
+        verify_password: Optional[VerifyPassword] = None,
+        verify_token: Optional[VerifyToken] = None,
+        concurrency: int = BATCH_CONCURRENCY,
+        max_queries: int = BATCH_MAX_QUERIES,
+        path: str = BATCH_API_PATH
+    ):
+        self.answer = answer
+        self.verify_password = verify_password
+        self.verify_token = verify_token
+        self.concurrency = max(1, concurrency)
+        self.max_queries = max_queries
+        self.path = path
+        self.batches = 0
+        self.queries = 0
+        self.errors = 0
+
+    async def authenticate(self, authorization: Optional[str], cookie_token: Optional[str] = None) -> Optional[str]:
+        """
+        Identifica al usuario por Basic, Bearer o la cookie de sesión de Chainlit.
+
+        Returns:
+            Identificador del usuario o None si las credenciales no son válidas
+        """
+        scheme, _, credentials = (authorization or "").partition(" ")
+        if scheme.lower() == "basic" and self.verify_password:
+            try:
+                username, _, password = base64.b64decode(credentials, validate=True).decode().partition(":")
+            except (binascii.Error, UnicodeDecodeError):
+                return None
+            return username if await self.verify_password(username, password) is not None else None
+        token = credentials if scheme.lower() == "bearer" else cookie_token
+        if token and self.verify_token:
+            try:
+                return self.verify_token(token)
+            except Exception:
+                return None
+        return None
+
+    async def _answer_one(self, item: BatchItem, explain: bool, user_id: str) -> dict:
+        start = time.perf_counter()
+        try:
+            values = await self.answer(item, explain, user_id)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Batch: consulta {item.index} falló: {e}")
+            values = {"error": f"{type(e).__name__}: {e}"}
+        return result_row(item, **values, elapsed_ms=(time.perf_counter() - start) * 1000)
+
+    async def run(self, items: list[BatchItem], explain: bool, user_id: str) -> AsyncIterator[dict]:
+        """
+        Resuelve el lote con a lo más `concurrency` consultas en vuelo.
+
+        Yields:
+            Filas en orden de terminación (cada una con su `index`)
+        """
+        self.batches += 1
+        self.queries += len(items)
+        remaining = iter(items)
+        pending: set[asyncio.Task] = set()
+
+        def refill():
+            for item in remaining:
+                pending.add(asyncio.create_task(self._answer_one(item, explain, user_id)))
+                if len(pending) >= self.concurrency:
+                    return
+
+        refill()
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                refill()
+                for task in done:
+                    yield task.result()
+        finally:
+            # El cliente cortó la conexión: no seguir trabajando para nadie
+            for task in pending:
+                task.cancel()
+
+    async def handle(self, request):
+        """Handler de `POST BATCH_API_PATH`."""
+        from fastapi.responses import JSONResponse, StreamingResponse
+
+        user_id = await self.authenticate(
+            request.headers.get("authorization"), getattr(request.state, "cookie_token", None)
+        )
+        if user_id is None:
+            return JSONResponse(
+                {"detail": "No autenticado"}, status_code=401,
+                headers={"WWW-Authenticate": 'Basic realm="sdrag", Bearer'}
+            )
+        try:
+            body = await request.json()
+        except ValueError:
+            return JSONResponse({"detail": "Cuerpo JSON inválido"}, status_code=400)
+        try:
+            items, explain, requested = parse_batch(body, self.max_queries)
+            fmt = negotiate_format(requested, request.headers.get("accept"))
+        except BatchRequestError as e:
+            return JSONResponse({"detail": str(e)}, status_code=e.status_code)
+
+        logger.info(f"Batch: {len(items)} consultas de {user_id} ({fmt}, explain={explain})")
+        rows = self.run(items, explain, user_id)
+        stream = arrow_stream(rows) if fmt == "arrow" else ndjson_stream(rows)
+        return StreamingResponse(
+            stream, media_type=MEDIA_TYPES[fmt], headers={"X-Batch-Size": str(len(items))}
+        )
+
+    def mount(self, app, cookie_token: Optional[Callable[[dict], Optional[str]]] = None) -> None:
+        """
+        Registra el endpoint en la app FastAPI.
+
+        Args:
+            app: App FastAPI (la de Chainlit: `chainlit.server.app`)
+            cookie_token: Extrae el JWT de las cookies (sesión del navegador)
+        """
+        from fastapi import Request
+
+        async def batch(request: Request):
+            if cookie_token is not None:
+                request.state.cookie_token = cookie_token(request.cookies)
+            return await self.handle(request)
+
+        app.add_api_route(self.path, batch, methods=["POST"], include_in_schema=False)
+        logger.info(f"Batch API disponible en POST {self.path}")
+
+    def snapshot(self) -> dict:
+        """Contadores para /metricas."""
+        return {"batches": self.batches, "queries": self.queries, "errors": self.errors}
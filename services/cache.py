@@ -0,0 +1,487 @@
+"""
+Cache en dos niveles compartible entre réplicas de Chainlit.
+
+- Nivel local: LRU en memoria con TTL (por proceso).
+- Nivel compartido (opcional, CACHE_BACKEND_URL):
+    sqlite:///ruta/cache.db   archivo SQLite en modo WAL (réplicas en el mismo host)
+    redis://host:6379/0       cualquier servidor con protocolo Redis (RESP)
+- Valores serializados con msgpack (JSON si msgpack no está instalado).
+- Protección contra estampidas en `get_or_set()`: una sola carga por clave
+  en el proceso (single-flight) y un lock con TTL en el nivel compartido
+  para que las demás réplicas esperen el valor en vez de recalcularlo.
+
+Dependencia opcional:
+    uv add msgpack
+"""
+import asyncio
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional
+from urllib.parse import urlparse
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - depende del entorno
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+CACHE_BACKEND_URL = os.getenv("CACHE_BACKEND_URL", "")
+CACHE_LOCAL_SIZE = int(os.getenv("CACHE_LOCAL_SIZE", "2048"))
+CACHE_LOCAL_TTL = float(os.getenv("CACHE_LOCAL_TTL", "60"))
+CACHE_DEFAULT_TTL = float(os.getenv("CACHE_DEFAULT_TTL", "3600"))
+CACHE_LOCK_TIMEOUT = float(os.getenv("CACHE_LOCK_TIMEOUT", "30"))
+CACHE_NAMESPACE = os.getenv("CACHE_NAMESPACE", "sdrag")
+
+# Borrado atómico solo si el valor coincide (lock con token de dueño)
+REDIS_DELETE_IF_SCRIPT = (
+    "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) else return 0 end"
+)
+
+
+# =============================================================================
+# Serialización
+# =============================================================================
+
+def dumps(value: Any) -> bytes:
+    """Serializa con un byte de formato, para que réplicas mixtas se entiendan."""
+    if msgpack is not None:
+        return b"m" + msgpack.packb(value, use_bin_type=True)
+    return b"j" + json.dumps(value).encode("utf-8")
+
+
+def loads(data: bytes) -> Any:
+    fmt, payload = data[:1], data[1:]
+    if fmt == b"m":
+        if msgpack is None:
+            raise ValueError("Valor serializado con msgpack, pero msgpack no está instalado")
+        return msgpack.unpackb(payload, raw=False)
+    if fmt == b"j":
+        return json.loads(payload)
+    raise ValueError(f"Formato de cache desconocido: {fmt!r}")
+
+
+# =============================================================================
+# Backends
+# =============================================================================
+
+class CacheBackend(ABC):
+    """Interfaz de un nivel de cache (valores ya serializados)."""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        """Escribe solo si la clave no existe (o expiró). Returns: si se escribió."""
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    async def delete_if(self, key: str, value: bytes) -> bool:
+        """Borra solo si la clave aún tiene `value`. Returns: si se borró."""
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryBackend(CacheBackend):
+    """LRU en memoria con TTL por entrada."""
+
+    def __init__(self, max_entries: int = CACHE_LOCAL_SIZE):
+        self.max_entries = max_entries
+        self._data: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+
+    def _live(self, key: str) -> Optional[bytes]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._live(key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        if self._live(key) is not None:
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    async def delete_if(self, key: str, value: bytes) -> bool:
+        if self._live(key) != value:
+            return False
+        del self._data[key]
+        return True
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    Nivel compartido sobre un archivo SQLite en modo WAL.
+
+    Las operaciones corren en un thread para no bloquear el event loop.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        if db_path != ":memory:":
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=30.0, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache "
+            "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self.conn.commit()
+        self._lock = asyncio.Lock()
+
+    async def _run(self, fn: Callable, *args):
+        async with self._lock:
+            return await asyncio.to_thread(fn, *args)
+
+    def _get(self, key: str) -> Optional[bytes]:
+        row = self.conn.execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key: str, value: bytes, ttl: float) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl)
+            )
+
+    def _add(self, key: str, value: bytes, ttl: float) -> bool:
+        now = time.time()
+        with self.conn:
+            self.conn.execute("DELETE FROM cache WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, now + ttl)
+            )
+        return cursor.rowcount == 1
+
+    def _delete(self, key: str) -> None:
+        with self.conn:
+            self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def _delete_if(self, key: str, value: bytes) -> bool:
+        with self.conn:
+            cursor = self.conn.execute("DELETE FROM cache WHERE key = ? AND value = ?", (key, value))
+        return cursor.rowcount == 1
+
+    def purge_expired(self) -> int:
+        with self.conn:
+            return self.conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._run(self._get, key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self._run(self._set, key, value, ttl)
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        return await self._run(self._add, key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        await self._run(self._delete, key)
+
+    async def delete_if(self, key: str, value: bytes) -> bool:
+        return await self._run(self._delete_if, key, value)
+
+    async def close(self) -> None:
+        self.conn.close()
+
+
+class RedisBackend(CacheBackend):
+    """
+    Nivel compartido sobre un servidor con protocolo Redis (RESP2).
+
+    Cliente mínimo (GET/SET PX NX/DEL/EVAL/SELECT/AUTH) sobre una conexión
+    asyncio; no requiere redis-py.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 6379, db: int = 0,
+                 password: Optional[str] = None, timeout: float = 2.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBackend":
+        parsed = urlparse(url)
+        db = int(parsed.path.lstrip("/") or 0)
+        return cls(parsed.hostname or "localhost", parsed.port or 6379, db, parsed.password)
+
+    @staticmethod
+    def _encode(*args) -> bytes:
+        out = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Conexión Redis cerrada")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RuntimeError(f"Redis: {rest.decode()}")
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length == -1:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            return [await self._read_reply() for _ in range(int(rest))]
+        raise RuntimeError(f"Respuesta RESP inválida: {line!r}")
+
+    async def _command(self, *args):
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    self._reader, self._writer = await asyncio.wait_for(
+                        asyncio.open_connection(self.host, self.port), self.timeout
+                    )
+                    if self.password:
+                        self._writer.write(self._encode("AUTH", self.password))
+                        await self._read_reply()
+                    if self.db:
+                        self._writer.write(self._encode("SELECT", self.db))
+                        await self._read_reply()
+                self._writer.write(self._encode(*args))
+                await self._writer.drain()
+                return await asyncio.wait_for(self._read_reply(), self.timeout)
+            except BaseException:
+                # Incluye la cancelación: una respuesta sin leer quedaría en la
+                # conexión y la recibiría el siguiente comando
+                await self._reset()
+                raise
+
+    async def _reset(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._command("GET", key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self._command("SET", key, value, "PX", int(ttl * 1000))
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        return await self._command("SET", key, value, "PX", int(ttl * 1000), "NX") == "OK"
+
+    async def delete(self, key: str) -> None:
+        await self._command("DEL", key)
+
+    async def delete_if(self, key: str, value: bytes) -> bool:
+        return await self._command("EVAL", REDIS_DELETE_IF_SCRIPT, 1, key, value) == 1
+
+    async def close(self) -> None:
+        await self._reset()
+
+
+def create_shared_backend(url: str = CACHE_BACKEND_URL) -> Optional[CacheBackend]:
+    """
+    Backend compartido a partir de la URL.
+
+    Raises:
+        ValueError: Si el esquema no es sqlite:// ni redis://
+    """
+    if not url:
+        return None
+    parsed = urlparse(url)
+    if parsed.scheme == "sqlite":
+        return SQLiteBackend(url[len("sqlite:///"):] if url.startswith("sqlite:///") else parsed.path)
+    if parsed.scheme in ("redis", "rediss"):
+        return RedisBackend.from_url(url)
+    raise ValueError(f"CACHE_BACKEND_URL no soportada: {url}")
+
+
+# =============================================================================
+# Cache en dos niveles
+# =============================================================================
+
+class TieredCache:
+    """
+    LRU local + nivel compartido opcional.
+
+    Args:
+        shared: Backend compartido (None = solo local)
+        local_ttl: TTL máximo en el nivel local, para que las réplicas
+            converjan si el valor compartido cambia
+        lock_timeout: Duración del lock de estampida y espera máxima
+    """
+
+    def __init__(
+        self,
+        shared: Optional[CacheBackend] = None,
+        namespace: str = CACHE_NAMESPACE,
+        local_size: int = CACHE_LOCAL_SIZE,
+        local_ttl: float = CACHE_LOCAL_TTL,
+        default_ttl: float = CACHE_DEFAULT_TTL,
+        lock_timeout: float = CACHE_LOCK_TIMEOUT,
+        poll_interval: float = 0.05
+    ):
+        self.local = MemoryBackend(local_size)
+        self.shared = shared
+        self.namespace = namespace
+        self.local_ttl = local_ttl
+        self.default_ttl = default_ttl
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def _shared_call(self, method: str, *args):
+        """Errores del nivel compartido degradan a solo-local."""
+        if self.shared is None:
+            return None
+        try:
+            return await getattr(self.shared, method)(*args)
+        except Exception as e:
+            logger.warning(f"Cache compartido: {method} falló ({type(e).__name__}: {e})")
+            return None
+
+    async def get(self, key: str) -> Any:
+        """Valor deserializado o None."""
+        full_key = self._key(key)
+        data = await self.local.get(full_key)
+        if data is not None:
+            self.local_hits += 1
+            return loads(data)
+        data = await self._shared_call("get", full_key)
+        if data is not None:
+            self.shared_hits += 1
+            await self.local.set(full_key, data, self.local_ttl)
+            return loads(data)
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = ttl or self.default_ttl
+        full_key = self._key(key)
+        data = dumps(value)
+        await self.local.set(full_key, data, min(ttl, self.local_ttl))
+        await self._shared_call("set", full_key, data, ttl)
+
+    async def delete(self, key: str) -> None:
+        full_key = self._key(key)
+        await self.local.delete(full_key)
+        await self._shared_call("delete", full_key)
+
+    async def get_or_set(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None
+    ) -> Any:
+        """
+        Retorna el valor cacheado o lo calcula una sola vez.
+
+        Si `loader` retorna None el valor no se cachea.
+        """
+        value = await self.get(key)
+        if value is not None:
+            return value
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._load(key, loader, ttl))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _wait_for_holder(self, key: str, lock_key: str) -> Optional[bytes]:
+        """
+        Espera el valor que calcula otra réplica.
+
+        Returns:
+            El valor serializado, o None si el lock se liberó sin valor
+            (carga fallida o no cacheable) o expiró
+        """
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            data = await self._shared_call("get", self._key(key))
+            if data is not None:
+                return data
+            if await self._shared_call("get", lock_key) is None:
+                # Última lectura: el dueño pudo escribir y liberar entre ambas
+                return await self._shared_call("get", self._key(key))
+        logger.warning(f"Cache: lock de '{key}' expiró, calculando localmente")
+        return None
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: Optional[float]) -> Any:
+        lock_key = self._key(f"lock:{key}")
+        token = secrets.token_hex(16).encode()
+        # True = lock propio; False = otra réplica calcula; None = sin nivel compartido o caído
+        acquired = await self._shared_call("add", lock_key, token, self.lock_timeout)
+        if acquired is False:
+            data = await self._wait_for_holder(key, lock_key)
+            if data is not None:
+                self.shared_hits += 1
+                await self.local.set(self._key(key), data, self.local_ttl)
+                return loads(data)
+        try:
+            value = await loader()
+            if value is not None:
+                await self.set(key, value, ttl)
+            return value
+        finally:
+            if acquired:
+                # Solo el dueño libera: si el lock expiró, puede ser ya de otra réplica
+                await self._shared_call("delete_if", lock_key, token)
+
+    async def close(self) -> None:
+        if self.shared is not None:
+            await self.shared.close()
+
+
+# Instancia global
+shared_cache = TieredCache(create_shared_backend())
@@ -0,0 +1,217 @@
+"""
+Gráficos Plotly por métrica (Fase 6) con cache del JSON serializado.
+
+- El tipo de gráfico se elige según la métrica (línea, barras, gauge,
+  waterfall; ver tabla "Tipos de Visualización por Métrica").
+- Las series largas se reducen con LTTB antes de serializar para no inflar
+  el payload del websocket.
+- El JSON de la figura se cachea por (métrica, tipo, rango de períodos,
+  versión de datos), así que la misma gráfica no se reconstruye por mensaje.
+"""
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import chainlit as cl
+from chainlit.element import Element
+
+logger = logging.getLogger(__name__)
+
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "500"))
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", "256"))
+
+# Tipo de gráfico por métrica
+CHART_TYPES = {
+    "revenue": "line",
+    "ebitda": "line",
+    "net_income": "line",
+    "cogs": "bar",
+    "opex": "bar",
+    "gross_margin": "gauge",
+}
+
+PERCENT_METRICS = {"gross_margin"}
+
+SDRAG_BLUE = "#1e3a8a"
+
+
+def chart_type_for(metric: str) -> str:
+    """Tipo de gráfico para una métrica (línea por defecto)."""
+    return CHART_TYPES.get(metric, "line")
+
+
+# =============================================================================
+# Downsampling
+# =============================================================================
+
+def lttb(values: Sequence[float], threshold: int) -> list[int]:
+    """
+    Largest-Triangle-Three-Buckets sobre una serie equiespaciada.
+
+    Args:
+        values: Valores de la serie (x implícito = índice)
+        threshold: Número máximo de puntos a conservar
+
+    Returns:
+        Índices de los puntos seleccionados (incluye primero y último)
+    """
+    import numpy as np
+
+    n = len(values)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    y = np.asarray(values, dtype=float)
+    x = np.arange(n, dtype=float)
+    # Buckets interiores (se excluyen primer y último punto)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], max(edges[i + 2], edges[i + 1] + 1)
+            avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        else:
+            avg_x, avg_y = x[n - 1], y[n - 1]
+        # Área del triángulo (a, candidato, promedio del siguiente bucket)
+        areas = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(areas.argmax())
+        selected.append(a)
+    selected.append(n - 1)
+    return selected
+
+
+# =============================================================================
+# Construcción de figuras
+# =============================================================================
+
+def build_figure(metric: str, labels: Sequence[str], values: Sequence[float], chart_type: str):
+    """
+    Construye la figura Plotly para una serie ya reducida.
+
+    Para "waterfall" la serie son contribuciones relativas y el último punto
+    es el total (p. ej. Revenue, -COGS, -OPEX, EBITDA).
+    """
+    import plotly.graph_objects as go
+
+    title = metric.replace("_", " ").title()
+    is_percent = metric in PERCENT_METRICS
+    display = [v * 100 for v in values] if is_percent else list(values)
+
+    if chart_type == "gauge":
+        fig = go.Figure(go.Indicator(
+            mode="gauge+number",
+            value=display[-1] if display else 0,
+            number={"suffix": "%" if is_percent else "", "valueformat": ".1f"},
+            title={"text": f"{title} ({labels[-1] if labels else ''})"},
+            gauge={"axis": {"range": [0, 100]}, "bar": {"color": SDRAG_BLUE}},
+        ))
+    elif chart_type == "bar":
+        fig = go.Figure(go.Bar(x=list(labels), y=display, marker_color=SDRAG_BLUE))
+    elif chart_type == "waterfall":
+        measures = ["relative"] * (len(display) - 1) + ["total"]
+        fig = go.Figure(go.Waterfall(x=list(labels), y=display, measure=measures))
+    else:
+        fig = go.Figure(go.Scatter(
+            x=list(labels), y=display, mode="lines+markers", line={"color": SDRAG_BLUE}
+        ))
+
+    if chart_type != "gauge":
+        fig.update_layout(title=title, yaxis_tickformat=".1f" if is_percent else "$,.0f")
+    fig.update_layout(autosize=True, width=None, margin={"l": 40, "r": 20, "t": 50, "b": 40})
+    return fig
+
+
+# =============================================================================
+# Elemento Chainlit con JSON pre-serializado
+# =============================================================================
+
+@dataclass
+class CachedPlotly(cl.Plotly):
+    """cl.Plotly que recibe el JSON ya serializado en `content` (sin re-serializar)."""
+
+    def __post_init__(self) -> None:
+        self.mime = "application/json"
+        Element.__post_init__(self)
+
+
+class ChartService:
+    """Genera y cachea (LRU) el JSON de las gráficas por métrica."""
+
+    def __init__(self, max_points: int = CHART_MAX_POINTS, cache_size: int = CHART_CACHE_SIZE):
+        self.max_points = max_points
+        self.cache_size = cache_size
+        self._cache: OrderedDict[tuple, str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def figure_json(
+        self,
+        metric: str,
+        series: Sequence[tuple[str, float]],
+        data_version: str,
+        chart_type: Optional[str] = None
+    ) -> str:
+        """
+        JSON de la figura para la serie (cacheado).
+
+        Args:
+            metric: Métrica graficada
+            series: Pares (etiqueta de período, valor) en orden temporal
+            data_version: Versión de los datos fuente (invalida el cache)
+            chart_type: Forzar tipo de gráfico (default: según la métrica)
+        """
+        import plotly.io as pio
+
+        chart_type = chart_type or chart_type_for(metric)
+        labels = [label for label, _ in series]
+        key = (metric, chart_type, labels[0] if labels else None,
+               labels[-1] if labels else None, len(labels), data_version)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return cached
+
+        self.misses += 1
+        values = [value for _, value in series]
+        if chart_type in ("line", "bar") and len(values) > self.max_points:
+            keep = lttb(values, self.max_points)
+            labels = [labels[i] for i in keep]
+            values = [values[i] for i in keep]
+        fig = build_figure(metric, labels, values, chart_type)
+        content = pio.to_json(fig, validate=False)
+
+        self._cache[key] = content
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return content
+
+    async def element(
+        self,
+        metric: str,
+        series: Sequence[tuple[str, float]],
+        data_version: str,
+        chart_type: Optional[str] = None,
+        display: str = "inline"
+    ) -> cl.Plotly:
+        """Elemento cl.Plotly listo para adjuntar; el render corre en un thread."""
+        content = await asyncio.to_thread(
+            self.figure_json, metric, series, data_version, chart_type
+        )
+        return CachedPlotly(
+            name=f"chart_{metric}",
+            content=content,
+            display=display,
+            size="medium"
+        )
+
+
+# Instancia global
+chart_service = ChartService()
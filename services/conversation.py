@@ -0,0 +1,184 @@
+"""
+Memoria de conversación por sesión (se guarda en cl.user_session).
+
+- Ring buffer de los últimos MEMORY_MAX_TURNS turnos: la memoria por sesión
+  está acotada aunque la conversación sea larga.
+- Seguimientos como "¿y en Q3?" heredan la métrica y/o el período del turno
+  anterior. La métrica solo se hereda con una señal explícita de seguimiento
+  (elíptico "¿y…?" o un período suelto), y un trimestre sin año solo hereda
+  el año si el período resultante existe.
+- El historial que se envía al LLM se recorta con un estimador rápido de
+  tokens (~4 caracteres por token) a MEMORY_CONTEXT_TOKENS.
+- Las sesiones inactivas más de MEMORY_IDLE_SECONDS se vacían.
+"""
+import logging
+import os
+import re
+import time
+import weakref
+from collections import deque
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+MEMORY_MAX_TURNS = int(os.getenv("MEMORY_MAX_TURNS", "10"))
+MEMORY_CONTEXT_TOKENS = int(os.getenv("MEMORY_CONTEXT_TOKENS", "1500"))
+MEMORY_IDLE_SECONDS = float(os.getenv("MEMORY_IDLE_SECONDS", "1800"))
+
+# Trimestre sin año ("¿y en Q3?", "tercer trimestre")
+BARE_QUARTER_PATTERN = r"\bq([1-4])\b|\b(primer|segundo|tercer|cuarto)\s+trimestre\b"
+QUARTER_WORDS = {"primer": 1, "segundo": 2, "tercer": 3, "cuarto": 4}
+# Seguimiento elíptico: "¿y en Q3?", "y el margen", "what about 2023"
+FOLLOWUP_PATTERN = r"^\W*(y|e|and|what about|how about)\b"
+# Lo que puede acompañar a un período suelto ("¿y para el tercer trimestre de 2023?")
+PERIOD_ONLY_PATTERN = (
+    r"\bq[1-4]\b|\b(19|20)\d{2}\b|\b(primer|segundo|tercer|cuarto)\b|\btrimestre\b|"
+    r"\b(en|el|la|de|del|para|año|y|e|and|in|for)\b|\W|_"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación rápida de tokens (~4 caracteres por token, sin tokenizer)."""
+    return (len(text) + 3) // 4
+
+
+def _bare_quarter(query: str) -> Optional[int]:
+    match = re.search(BARE_QUARTER_PATTERN, query.lower())
+    if not match:
+        return None
+    return int(match.group(1)) if match.group(1) else QUARTER_WORDS[match.group(2)]
+
+
+def is_followup(query: str) -> bool:
+    """Señal explícita de seguimiento: elíptico ("¿y…?") o solo un período."""
+    text = query.lower()
+    if re.search(FOLLOWUP_PATTERN, text):
+        return True
+    return bool(text.strip()) and not re.sub(PERIOD_ONLY_PATTERN, "", text)
+
+
+# Memorias vivas (para vaciar las inactivas sin recorrer cl.user_session)
+_registry: "weakref.WeakSet[ConversationMemory]" = weakref.WeakSet()
+
+
+class ConversationMemory:
+    """
+    Estado conversacional de una sesión.
+
+    Args:
+        max_turns: Tamaño del ring buffer de turnos
+        idle_seconds: Inactividad tras la cual la memoria se vacía
+        periods: Períodos con datos (PERIOD_PATTERNS); None = no validar
+    """
+
+    def __init__(
+        self,
+        max_turns: int = MEMORY_MAX_TURNS,
+        idle_seconds: float = MEMORY_IDLE_SECONDS,
+        periods: Optional[Iterable[str]] = None
+    ):
+        self.turns: deque[tuple[str, str]] = deque(maxlen=max_turns)
+        self.idle_seconds = idle_seconds
+        self.periods = set(periods) if periods is not None else None
+        self.last_metric: Optional[str] = None
+        self.last_period: Optional[str] = None
+        self.last_active = time.monotonic()
+        _registry.add(self)
+
+    def is_idle(self, now: Optional[float] = None) -> bool:
+        return (now or time.monotonic()) - self.last_active > self.idle_seconds
+
+    def clear(self) -> None:
+        self.turns.clear()
+        self.last_metric = None
+        self.last_period = None
+
+    def touch(self) -> None:
+        """Marca actividad; si la sesión estuvo inactiva, empieza de cero."""
+        if self.is_idle():
+            self.clear()
+        self.last_active = time.monotonic()
+
+    def add_turn(self, user: str, assistant: str, classification: Optional[dict] = None) -> None:
+        """Agrega un turno y recuerda la métrica/período consultados."""
+        self.turns.append((user, assistant))
+        if classification and classification.get("is_financial"):
+            self.last_metric = classification.get("metric")
+            self.last_period = classification.get("period")
+        self.last_active = time.monotonic()
+
+    def resolve(self, classification: dict, query: str) -> dict:
+        """
+        Completa la clasificación de un seguimiento con el turno anterior.
+
+        - Sin métrica y con señal de seguimiento (`is_followup()`): hereda la métrica.
+        - Con métrica pero sin período explícito: hereda el período.
+        - Trimestre sin año ("Q3"): usa el año del período anterior; si ese
+          período no existe, marca `needs_period` para pedirlo al usuario.
+
+        Returns:
+            Copia de la clasificación con `inherited` (campos heredados)
+        """
+        result = dict(classification)
+        inherited = []
+        quarter = _bare_quarter(query)
+        explicit_period = result.get("period_explicit", True)
+
+        if quarter and self.last_period and not explicit_period:
+            year = self.last_period.split("_")[-1]
+            period = f"Q{quarter}_{year}"
+            if self.periods is not None and period not in self.periods:
+                # "ebitda 2023" y luego "¿y en Q3?": Q3_2023 no tiene datos
+                result.update({"needs_period": period, "inherited": []})
+                return result
+            result["period"] = period
+            explicit_period = True
+            inherited.append("year")
+
+        if not result.get("metric") and self.last_metric and is_followup(query):
+            result.update({
+                "metric": self.last_metric,
+                "route": "semantic",
+                "route_target": "Cube Core",
+                "is_financial": True,
+            })
+            inherited.append("metric")
+        elif result.get("metric") and not explicit_period and self.last_period:
+            result["period"] = self.last_period
+            inherited.append("period")
+
+        result["inherited"] = inherited
+        return result
+
+    def context_messages(self, budget_tokens: int = MEMORY_CONTEXT_TOKENS) -> list[dict]:
+        """
+        Turnos recientes como mensajes de chat, dentro del presupuesto.
+
+        Se incluyen del más reciente al más antiguo mientras quepan; el
+        resultado queda en orden cronológico.
+        """
+        messages: list[dict] = []
+        used = 0
+        for user, assistant in reversed(self.turns):
+            cost = estimate_tokens(user) + estimate_tokens(assistant)
+            if used + cost > budget_tokens:
+                break
+            messages[:0] = [
+                {"role": "user", "content": user},
+                {"role": "assistant", "content": assistant},
+            ]
+            used += cost
+        return messages
+
+
+def evict_idle() -> int:
+    """Vacía las memorias inactivas. Returns: número de sesiones vaciadas."""
+    now = time.monotonic()
+    evicted = 0
+    for memory in list(_registry):
+        if memory.turns and memory.is_idle(now):
+            memory.clear()
+            evicted += 1
+    if evicted:
+        logger.info(f"Conversation memory: {evicted} sesiones inactivas vaciadas")
+    return evicted
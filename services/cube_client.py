@@ -0,0 +1,253 @@
+"""
+Cliente REST de Cube Core (Fase 5) - endpoint /cubejs-api/v1/load.
+
+- Maneja el long-polling de Cube ("Continue wait") con backoff asíncrono.
+- Deduplica queries idénticas en vuelo: N mensajes con la misma consulta
+  generan una sola llamada.
+- Cachea resultados localmente con TTL; además el cache se vacía cuando
+  cambia la versión de datos (DataVersionMonitor llama a `invalidate()`).
+  La refresh key de Cube (refreshKeyValues / lastRefreshTime) se reporta en
+  cada resultado solo como trazabilidad.
+- Indica si una pre-aggregation sirvió cada respuesta.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from typing import Any, Optional
+
+import httpx
+
+from services.http_replay import cassette_transport
+
+logger = logging.getLogger(__name__)
+
+CUBE_API_URL = os.getenv("CUBE_API_URL", "http://100.116.107.52:4000")
+CUBE_API_SECRET = os.getenv("CUBE_API_SECRET", "")
+CUBE_ENABLED = os.getenv("CUBE_ENABLED", "false").lower() == "true"
+CUBE_TIMEOUT = float(os.getenv("CUBE_TIMEOUT", "10.0"))
+CUBE_MAX_WAIT = float(os.getenv("CUBE_MAX_WAIT", "30.0"))
+CUBE_CACHE_TTL = float(os.getenv("CUBE_CACHE_TTL", "300"))
+CUBE_CACHE_SIZE = int(os.getenv("CUBE_CACHE_SIZE", "1024"))
+
+# Métrica SDRAG -> medida del cubo Facts
+METRIC_MEASURES = {
+    "revenue": "Facts.revenue",
+    "cogs": "Facts.cogs",
+    "gross_margin": "Facts.grossMargin",
+    "opex": "Facts.opex",
+    "ebitda": "Facts.ebitda",
+    "net_income": "Facts.netIncome",
+}
+
+
+class CubeError(Exception):
+    """Error al consultar Cube Core."""
+
+
+@dataclass
+class CubeResult:
+    """Resultado de /load con metadatos de trazabilidad."""
+    data: list[dict]
+    sql: Optional[str] = None
+    annotation: dict[str, Any] = field(default_factory=dict)
+    used_pre_aggregations: dict[str, Any] = field(default_factory=dict)
+    refresh_key: Optional[str] = None
+    latency_ms: float = 0
+    from_cache: bool = False
+
+    @property
+    def from_pre_aggregation(self) -> bool:
+        return bool(self.used_pre_aggregations)
+
+
+def build_metric_query(metric: str, period: str) -> dict:
+    """
+    Query Cube para una métrica y período SDRAG ("Q4_2024" o "2024").
+
+    Raises:
+        ValueError: Si la métrica no tiene medida asociada
+    """
+    if metric not in METRIC_MEASURES:
+        raise ValueError(f"Métrica sin medida en Cube: {metric}")
+    if period.startswith("Q"):
+        member = "Facts.fiscalQuarter"
+    else:
+        member = "Facts.fiscalYear"
+    return {
+        "measures": [METRIC_MEASURES[metric]],
+        "filters": [{"member": member, "operator": "equals", "values": [period]}],
+    }
+
+
+def _query_key(query: dict) -> str:
+    return json.dumps(query, sort_keys=True, separators=(",", ":"))
+
+
+class CubeClient:
+    """
+    Cliente asíncrono de Cube Core con cache y deduplicación.
+
+    Args:
+        transport: Transporte httpx alternativo (tests / stub local)
+    """
+
+    def __init__(
+        self,
+        api_url: str = CUBE_API_URL,
+        api_secret: str = CUBE_API_SECRET,
+        timeout: float = CUBE_TIMEOUT,
+        max_wait: float = CUBE_MAX_WAIT,
+        cache_ttl: float = CUBE_CACHE_TTL,
+        cache_size: int = CUBE_CACHE_SIZE,
+        initial_backoff: float = 0.1,
+        max_backoff: float = 2.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.api_url = api_url.rstrip("/")
+        self.api_secret = api_secret
+        self.timeout = timeout
+        self.max_wait = max_wait
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._cache: OrderedDict[str, tuple[float, CubeResult]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _headers(self) -> dict:
+        if not self.api_secret:
+            return {}
+        import jwt  # PyJWT (dependencia de chainlit)
+
+        token = jwt.encode({"iat": int(time.time())}, self.api_secret, algorithm="HS256")
+        return {"Authorization": token}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.api_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                transport=self._transport
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # -------------------------------------------------------------------------
+    # Cache
+    # -------------------------------------------------------------------------
+
+    def invalidate(self) -> int:
+        """
+        Vacía el cache (cambió la versión de datos).
+
+        Returns:
+            Número de entradas eliminadas
+        """
+        removed = len(self._cache)
+        self._cache.clear()
+        return removed
+
+    def _cache_get(self, key: str) -> Optional[CubeResult]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        stored_at, result = entry
+        if time.monotonic() - stored_at > self.cache_ttl:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return result
+
+    def _cache_put(self, key: str, result: CubeResult) -> None:
+        self._cache[key] = (time.monotonic(), result)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    # -------------------------------------------------------------------------
+    # Load
+    # -------------------------------------------------------------------------
+
+    async def load(self, query: dict, use_cache: bool = True) -> CubeResult:
+        """
+        Ejecuta una query en Cube Core.
+
+        Args:
+            query: Query Cube (measures, dimensions, filters, ...)
+            use_cache: Consultar/poblar el cache local
+
+        Raises:
+            CubeError: Error HTTP, error de Cube o espera mayor a max_wait
+        """
+        key = _query_key(query)
+        if use_cache:
+            cached = self._cache_get(key)
+            if cached is not None:
+                self.hits += 1
+                return replace(cached, from_cache=True, latency_ms=0)
+        self.misses += 1
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(query))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        result = await asyncio.shield(future)
+        if use_cache:
+            self._cache_put(key, result)
+        return result
+
+    async def _fetch(self, query: dict) -> CubeResult:
+        start = time.perf_counter()
+        deadline = time.monotonic() + self.max_wait
+        backoff = self.initial_backoff
+        client = self._get_client()
+        while True:
+            try:
+                response = await client.post(
+                    "/cubejs-api/v1/load", json={"query": query}, headers=self._headers()
+                )
+            except httpx.HTTPError as e:
+                raise CubeError(f"Error de conexión con Cube Core: {e}") from e
+            payload = response.json() if response.content else {}
+            if payload.get("error") == "Continue wait":
+                if time.monotonic() + backoff > deadline:
+                    raise CubeError(f"Cube Core no respondió en {self.max_wait:.0f}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            if response.status_code >= 400 or "error" in payload:
+                raise CubeError(f"Cube Core {response.status_code}: {payload.get('error', response.text)}")
+            break
+
+        refresh = payload.get("refreshKeyValues") or payload.get("lastRefreshTime")
+        result = CubeResult(
+            data=payload.get("data", []),
+            sql=payload.get("sql") or (payload.get("query") or {}).get("sql"),
+            annotation=payload.get("annotation", {}),
+            used_pre_aggregations=payload.get("usedPreAggregations") or {},
+            refresh_key=_query_key(refresh) if refresh is not None else None,
+            latency_ms=(time.perf_counter() - start) * 1000
+        )
+        logger.info(
+            f"Cube load: {len(result.data)} filas en {result.latency_ms:.0f}ms "
+            f"(pre-aggregation={result.from_pre_aggregation})"
+        )
+        return result
+
+
+# Instancia global
+cube_client = CubeClient(transport=cassette_transport("cube"))
@@ -0,0 +1,183 @@
+"""
+Registro de versión de datos (épocas) con invalidación coordinada.
+
+Cada cambio de la fuente de métricas (hoy MOCK_METRICS; luego Parquet/Cube)
+produce un hash nuevo y una nueva época. La versión forma parte de las
+claves de todos los caches de resultados (`data_versions.key(...)`), así
+que las entradas viejas simplemente dejan de consultarse y expiran por TTL
+sin escanear nada; por eso esos caches pueden usar TTLs largos
+(DATA_VERSIONED_CACHE_TTL).
+
+Los caches que no llevan la versión en la clave (Cube, métricas derivadas,
+tabla precalculada) se registran con `on_change()` y se vacían en el cambio.
+
+Coordinación entre workers: la versión se publica en el backend compartido
+del cache (SQLite/Redis) y cada worker la consulta cada
+DATA_VERSION_POLL_SECONDS con `watch()`. Así un refresh detectado en un
+worker invalida los caches de todos en a lo sumo un intervalo.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Optional
+
+from services.cache import CACHE_NAMESPACE, CacheBackend, dumps, loads, shared_cache
+
+logger = logging.getLogger(__name__)
+
+DATA_VERSION_POLL_SECONDS = float(os.getenv("DATA_VERSION_POLL_SECONDS", "5"))
+DATA_VERSIONED_CACHE_TTL = float(os.getenv("DATA_VERSIONED_CACHE_TTL", str(7 * 24 * 3600)))
+
+# La clave compartida vive más que cualquier entrada versionada
+_SHARED_VERSION_TTL = 10 * 365 * 24 * 3600
+
+
+def compute_version(source: Any) -> str:
+    """Hash estable (12 hex) de una fuente serializable a JSON."""
+    return hashlib.sha256(
+        json.dumps(source, sort_keys=True, default=str).encode()
+    ).hexdigest()[:12]
+
+
+class DataVersionRegistry:
+    """
+    Versión vigente de los datos y aviso de cambios.
+
+    Args:
+        shared: Backend compartido donde se publica la versión (None = un solo worker)
+        source: Callable que devuelve la fuente actual; `watch()` la re-hashea
+        poll_interval: Segundos entre revisiones en `watch()`
+    """
+
+    def __init__(
+        self,
+        shared: Optional[CacheBackend] = None,
+        source: Optional[Callable[[], Any]] = None,
+        namespace: str = CACHE_NAMESPACE,
+        poll_interval: float = DATA_VERSION_POLL_SECONDS
+    ):
+        self.shared = shared
+        self.source = source
+        self.poll_interval = poll_interval
+        self.current: Optional[str] = None
+        self.epoch = 0
+        self.changed_at: Optional[float] = None
+        self._shared_key = f"{namespace}:data_version"
+        self._source_version: Optional[str] = None
+        self._published: Optional[str] = None
+        self._listeners: list[Callable[[str], None]] = []
+        self._watch_task: Optional[asyncio.Task] = None
+
+    def track(self, source: Callable[[], Any]) -> str:
+        """Fija el callable de la fuente y calcula la versión inicial."""
+        self.source = source
+        self.set_source(source())
+        return self.current
+
+    def on_change(self, callback: Callable[[str], None]) -> None:
+        """Registra un callback síncrono `callback(nueva_versión)`."""
+        self._listeners.append(callback)
+
+    def key(self, *parts: Any) -> str:
+        """Clave de cache con la versión vigente: `v<versión>:<partes>`."""
+        return ":".join([f"v{self.current}", *map(str, parts)])
+
+    def _apply(self, version: str, origin: str) -> bool:
+        if version == self.current:
+            return False
+        previous, self.current = self.current, version
+        self.changed_at = time.time()
+        if previous is None:
+            return True  # Versión inicial: no hay nada que invalidar
+        self.epoch += 1
+        logger.info(f"Datos: versión {previous} → {version} (época {self.epoch}, {origin})")
+        for callback in self._listeners:
+            try:
+                callback(version)
+            except Exception as e:
+                logger.error(f"Datos: fallo al invalidar tras el cambio de versión: {e}")
+        return True
+
+    def set_source(self, source: Any) -> bool:
+        """
+        Registra el estado actual de la fuente (síncrono, sin publicar).
+
+        Returns:
+            True si la versión cambió
+        """
+        version = compute_version(source)
+        if version == self._source_version:
+            return False
+        self._source_version = version
+        return self._apply(version, "fuente local")
+
+    async def refresh(self, source: Any = None) -> bool:
+        """
+        Re-hashea la fuente y publica su versión si aún no se publicó.
+
+        Args:
+            source: Fuente actual; por defecto la del callable `source`
+
+        Returns:
+            True si la versión cambió
+        """
+        if source is None and self.source is not None:
+            source = self.source()
+        changed = self.set_source(source)
+        if self.shared is not None and self._source_version != self._published:
+            try:
+                await self.shared.set(self._shared_key, dumps(self._source_version), _SHARED_VERSION_TTL)
+                self._published = self._source_version
+            except Exception as e:
+                logger.warning(f"Datos: no se pudo publicar la versión: {e}")
+        return changed
+
+    async def sync(self) -> bool:
+        """Adopta la versión publicada por otro worker, si difiere."""
+        if self.shared is None:
+            return False
+        try:
+            raw = await self.shared.get(self._shared_key)
+        except Exception as e:
+            logger.warning(f"Datos: no se pudo leer la versión compartida: {e}")
+            return False
+        if raw is None:
+            return False
+        return self._apply(loads(raw), "otro worker")
+
+    async def check(self) -> bool:
+        """Una revisión: fuente local primero, luego la versión compartida."""
+        changed = await self.refresh() if self.source is not None else False
+        return await self.sync() or changed
+
+    async def watch(self) -> None:
+        """Revisa (y publica) de inmediato y luego cada `poll_interval` hasta ser cancelada."""
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"Datos: error revisando versión: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self) -> None:
+        if self._watch_task is None:
+            self._watch_task = asyncio.create_task(self.watch())
+
+    async def stop(self) -> None:
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+    def snapshot(self) -> dict:
+        return {"version": self.current, "epoch": self.epoch, "changed_at": self.changed_at}
+
+
+# Instancia global (publica en el mismo backend que shared_cache)
+data_versions = DataVersionRegistry(shared_cache.shared)
@@ -0,0 +1,263 @@
+"""
+Motor determinista de métricas derivadas (YoY, QoQ, crecimiento, ratios,
+varianza vs presupuesto).
+
+El LLM no debe hacer aritmética: el motor calcula las cifras y el prompt
+solo le pide explicarlas. Los valores se cargan una vez en una matriz
+métricas × períodos y cada derivada se calcula para toda la matriz con
+operaciones vectorizadas; una consulta solo indexa el resultado.
+
+numpy se importa en el primer cálculo (no al cargar app.py).
+"""
+import logging
+import re
+from dataclasses import dataclass
+from typing import Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+DERIVED_INTENTS = ("yoy", "qoq", "growth", "ratio", "variance")
+
+# Denominador del ratio en la consulta ("opex como % de ventas")
+RATIO_BASE_PATTERN = r"(?:%|porcentaje) de (?:revenue|ventas|ingresos)|(?:sobre|/) ?(?:revenue|ventas|ingresos)"
+
+# Patrones de intención derivada (se evalúan en este orden)
+DERIVED_PATTERNS = {
+    "variance": [r"presupuest", r"budget", r"varianza", r"variance", r"\bvs\.? plan\b", r"contra plan"],
+    "ratio": [r"\bratio\b", RATIO_BASE_PATTERN],
+    "qoq": [r"\bqoq\b", r"trimestre anterior", r"quarter over quarter", r"vs\.? (el )?trimestre"],
+    "yoy": [r"\byoy\b", r"interanual", r"año anterior", r"year over year",
+            r"(vs\.?|versus|contra|respecto (a|al)|frente a) (el )?\d{4}"],
+    "growth": [r"creci", r"crecimiento", r"growth", r"aument", r"disminu", r"cambi", r"variaci", r"delta"],
+}
+
+# Año base explícito: "vs 2023", "respecto a 2023"
+BASE_YEAR_PATTERN = r"(?:vs\.?|versus|contra|respecto (?:a|al)|frente a) (?:el )?(\d{4})"
+
+# Métrica -> denominador del ratio
+RATIO_DENOMINATOR = "revenue"
+
+PERCENT_METRICS = {"gross_margin"}
+
+
+def detect_derived_intent(query: str) -> Optional[str]:
+    """Intención derivada de la consulta (None si pide un valor simple)."""
+    query_lower = query.lower()
+    for intent, patterns in DERIVED_PATTERNS.items():
+        if any(re.search(p, query_lower) for p in patterns):
+            return intent
+    return None
+
+
+def extract_base_year(query: str) -> Optional[str]:
+    """Año de comparación explícito ("vs 2023" -> "2023")."""
+    match = re.search(BASE_YEAR_PATTERN, query.lower())
+    return match.group(1) if match else None
+
+
+def _period_sort_key(period: str) -> tuple[int, int]:
+    """Orden cronológico; el año completo va después de sus trimestres."""
+    if period.startswith("Q"):
+        quarter, year = period.split("_")
+        return int(year), int(quarter[1:])
+    return int(period), 5
+
+
+def _format(metric: str, value: float) -> str:
+    if metric in PERCENT_METRICS:
+        return f"{value*100:.1f}%"
+    return f"${value:,.2f}"
+
+
+@dataclass(frozen=True)
+class DerivedFigure:
+    """Cifra derivada lista para mostrar y para incluir en el prompt."""
+    intent: str
+    metric: str
+    period: str
+    value: float
+    base_label: str
+    base_value: float
+    change: float
+    change_pct: Optional[float]
+
+    def describe(self) -> str:
+        """Líneas markdown con los cálculos (no se deben recalcular)."""
+        name = self.metric.replace("_", " ").title()
+        period = self.period.replace("_", " ")
+        if self.intent == "ratio":
+            return (
+                f"- {name} {period}: {_format(self.metric, self.value)}\n"
+                f"- {self.base_label} {period}: {_format(RATIO_DENOMINATOR, self.base_value)}\n"
+                f"- Ratio {name} / {self.base_label}: **{self.change_pct*100:.1f}%**"
+            )
+        if self.metric in PERCENT_METRICS:
+            delta = f"**{self.change*100:+.1f} pp**"
+        else:
+            pct = f" ({self.change_pct*100:+.1f}%)" if self.change_pct is not None else ""
+            sign = "+" if self.change >= 0 else "-"
+            delta = f"**{sign}${abs(self.change):,.2f}**{pct}"
+        return (
+            f"- {name} {period}: {_format(self.metric, self.value)}\n"
+            f"- {name} {self.base_label}: {_format(self.metric, self.base_value)}\n"
+            f"- Cambio: {delta}"
+        )
+
+
+class DerivedMetricEngine:
+    """
+    Calcula métricas derivadas sobre el store métrica -> {período: valor}.
+
+    Args:
+        metrics: Valores reales (mismo formato que MOCK_METRICS)
+        budget: Presupuesto con el mismo formato (opcional, para varianza)
+    """
+
+    def __init__(
+        self,
+        metrics: Mapping[str, Mapping[str, float]],
+        budget: Optional[Mapping[str, Mapping[str, float]]] = None
+    ):
+        self._metrics_source = metrics
+        self._budget_source = budget or {}
+        self._arrays: Optional[dict] = None
+
+    def _build(self) -> dict:
+        """Carga la matriz y calcula todas las derivadas de una vez."""
+        import numpy as np
+
+        metrics = list(self._metrics_source)
+        periods = sorted(
+            {p for values in self._metrics_source.values() for p in values}
+            | {p for values in self._budget_source.values() for p in values},
+            key=_period_sort_key
+        )
+        col = {p: j for j, p in enumerate(periods)}
+        row = {m: i for i, m in enumerate(metrics)}
+
+        def matrix(source):
+            out = np.full((len(metrics), len(periods)), np.nan)
+            for metric, values in source.items():
+                if metric in row:
+                    for period, value in values.items():
+                        out[row[metric], col[period]] = value
+            return out
+
+        actual = matrix(self._metrics_source)
+        budget = matrix(self._budget_source)
+
+        # Índice de la columna base de cada período (-1 si no existe)
+        prev_year = np.full(len(periods), -1)
+        prev_quarter = np.full(len(periods), -1)
+        for j, period in enumerate(periods):
+            if period.startswith("Q"):
+                quarter, year = int(period[1]), int(period.split("_")[1])
+                prev_year[j] = col.get(f"Q{quarter}_{year - 1}", -1)
+                prev_q = f"Q{quarter - 1}_{year}" if quarter > 1 else f"Q4_{year - 1}"
+                prev_quarter[j] = col.get(prev_q, -1)
+            else:
+                prev_year[j] = col.get(str(int(period) - 1), -1)
+
+        def shifted(index):
+            return np.where(index >= 0, actual[:, np.maximum(index, 0)], np.nan)
+
+        if RATIO_DENOMINATOR in row:
+            denominator = np.broadcast_to(actual[row[RATIO_DENOMINATOR]], actual.shape)
+        else:
+            denominator = np.full(actual.shape, np.nan)
+
+        # base/change/pct por intención, para toda la matriz
+        bases = {"yoy": shifted(prev_year), "qoq": shifted(prev_quarter),
+                 "ratio": denominator, "variance": budget}
+        arrays = {
+            "metrics": row,
+            "periods": col,
+            "period_names": periods,
+            "actual": actual,
+            "prev_year": prev_year,
+            "prev_quarter": prev_quarter,
+        }
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for intent, base in bases.items():
+                arrays[f"base_{intent}"] = base
+                arrays[f"change_{intent}"] = actual - base
+                ratio = np.where(base != 0, actual / base, np.nan)
+                arrays[f"pct_{intent}"] = ratio if intent == "ratio" else ratio - 1
+        logger.info(f"Derived metrics: matriz {actual.shape[0]}×{actual.shape[1]} calculada")
+        return arrays
+
+    def invalidate(self) -> None:
+        """Recalcula en el próximo uso (p. ej. tras refrescar datos)."""
+        self._arrays = None
+
+    def compute(
+        self,
+        intent: str,
+        metric: str,
+        period: str,
+        base_period: Optional[str] = None
+    ) -> Optional[DerivedFigure]:
+        """
+        Cifra derivada para (intención, métrica, período).
+
+        Args:
+            intent: Una de DERIVED_INTENTS; "growth" usa QoQ para trimestres
+                y YoY para años
+            base_period: Año/período de comparación explícito (solo YoY)
+
+        Returns:
+            DerivedFigure o None si faltan datos para el cálculo
+        """
+        import numpy as np
+
+        if self._arrays is None:
+            self._arrays = self._build()
+        a = self._arrays
+        if metric not in a["metrics"] or period not in a["periods"]:
+            return None
+        i, j = a["metrics"][metric], a["periods"][period]
+        value = float(a["actual"][i, j])
+
+        if intent == "growth":
+            intent = "qoq" if period.startswith("Q") else "yoy"
+
+        if base_period and period.startswith("Q") and not base_period.startswith("Q"):
+            # "Q4 2024 vs 2023" compara con el mismo trimestre, no con el año completo
+            base_period = f"{period.split('_')[0]}_{base_period}"
+        if base_period and base_period.startswith("Q") != period.startswith("Q"):
+            base_period = None  # Granos distintos (año vs trimestre): base YoY por defecto
+
+        if intent == "yoy" and base_period and base_period in a["periods"] and base_period != period:
+            # Comparación explícita ("vs 2023"): un solo par, no hay columna precalculada
+            base_value = float(a["actual"][i, a["periods"][base_period]])
+            change = value - base_value
+            change_pct = value / base_value - 1 if base_value else float("nan")
+            base_label = base_period.replace("_", " ")
+        elif intent in ("yoy", "qoq", "ratio", "variance"):
+            if intent == "ratio" and metric == RATIO_DENOMINATOR:
+                return None
+            base_value = float(a[f"base_{intent}"][i, j])
+            change = float(a[f"change_{intent}"][i, j])
+            change_pct = float(a[f"pct_{intent}"][i, j])
+            if intent in ("yoy", "qoq"):
+                index = a["prev_year" if intent == "yoy" else "prev_quarter"][j]
+                base_label = a["period_names"][index].replace("_", " ") if index >= 0 else ""
+            elif intent == "ratio":
+                base_label = RATIO_DENOMINATOR.replace("_", " ").title()
+            else:
+                base_label = "presupuesto"
+        else:
+            raise ValueError(f"Intención derivada desconocida: {intent}")
+
+        if np.isnan(value) or np.isnan(base_value):
+            return None
+        return DerivedFigure(
+            intent=intent,
+            metric=metric,
+            period=period,
+            value=value,
+            base_label=base_label,
+            base_value=base_value,
+            change=change,
+            change_pct=None if np.isnan(change_pct) else change_pct
+        )
@@ -0,0 +1,500 @@
+"""
+Ejecución distribuida (Dask) para trabajo pesado fuera de línea.
+
+Barridos de benchmarks, re-embedding masivo y agregaciones sobre Parquet
+particionado no corren en el proceso de Chainlit: se trocean en chunks y se
+envían a un backend de ejecución:
+
+- `dask`: el scheduler de DASK_SCHEDULER_URL (cluster SDRAG).
+- `local`: un `LocalCluster` de Dask en la misma máquina (procesos).
+- `process`: `ProcessPoolExecutor`, sin Dask instalado.
+
+Con DASK_BACKEND=auto se usa el scheduler si está configurado y responde,
+si no un LocalCluster, y si Dask no está instalado el pool de procesos; así
+todo corre en una sola máquina Linux sin servicios externos.
+
+`DistributedExecutor.map_chunks()` mantiene acotados los chunks en vuelo y
+entrega cada resultado en cuanto termina (en orden de llegada) junto con su
+`TaskTiming`: tiempo en el worker, tiempo desde el envío y worker que lo
+ejecutó.
+
+Uso:
+    python -m services.distributed aggregate data/metrics --group-by metric,period --measures value
+    python -m services.distributed embed textos.jsonl embeddings.jsonl
+    python -m services.distributed sweep --grid '{"sessions": [10, 50], "queries": [20]}'
+
+Los barridos de benchmarks corren una configuración a la vez (cada load test
+mide lag del event loop y latencias, que otra corrida en la misma máquina
+distorsionaría); `--concurrent N` solo aplica a un cluster Dask con un
+worker dedicado por máquina.
+
+Dependencia opcional:
+    uv add "dask[distributed]" pyarrow
+"""
+import argparse
+import concurrent.futures
+import itertools
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Optional, Sequence
+
+try:
+    from dask.distributed import Client, LocalCluster
+    from dask.distributed import wait as dask_wait
+except ImportError:  # Dependencia opcional
+    Client = LocalCluster = dask_wait = None
+
+logger = logging.getLogger(__name__)
+
+DASK_SCHEDULER_URL = os.getenv("DASK_SCHEDULER_URL", "")
+DASK_BACKEND = os.getenv("DASK_BACKEND", "auto").lower()  # auto | dask | local | process
+DASK_LOCAL_WORKERS = int(os.getenv("DASK_LOCAL_WORKERS", str(os.cpu_count() or 2)))
+DASK_CHUNK_SIZE = int(os.getenv("DASK_CHUNK_SIZE", "64"))
+DASK_CONNECT_TIMEOUT = float(os.getenv("DASK_CONNECT_TIMEOUT", "5"))
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "nomic-embed-text")
+
+BACKENDS = ("auto", "dask", "local", "process")
+ROOT = Path(__file__).resolve().parent.parent
+
+
+# =============================================================================
+# Chunks y timing
+# =============================================================================
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[list]:
+    """Parte un iterable (posiblemente perezoso) en listas de `size` elementos."""
+    iterator = iter(items)
+    while chunk := list(itertools.islice(iterator, max(1, size))):
+        yield chunk
+
+
+@dataclass
+class TaskTiming:
+    """Timing de un chunk."""
+    chunk: int
+    items: int
+    run_ms: float      # Ejecución en el worker
+    elapsed_ms: float  # Desde el envío hasta recibir el resultado (incluye cola y transferencia)
+    worker: str
+    error: Optional[str] = None
+
+
+@dataclass
+class ChunkResult:
+    """Resultado de un chunk, entregado en cuanto termina."""
+    chunk: int
+    results: list
+    timing: TaskTiming
+
+    @property
+    def ok(self) -> bool:
+        return self.timing.error is None
+
+
+def _run_chunk(fn: Callable[[list], list], index: int, items: list) -> tuple[int, list, float, str]:
+    """Corre en el worker: aplica `fn` al chunk y mide."""
+    start = time.perf_counter()
+    results = fn(items)
+    return index, list(results), (time.perf_counter() - start) * 1000, f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _percentile(values: Sequence[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+# =============================================================================
+# Executor
+# =============================================================================
+
+class DistributedExecutor:
+    """
+    Envía chunks de trabajo a Dask o a un pool de procesos local.
+
+    Args:
+        backend: "auto", "dask" (scheduler remoto), "local" (LocalCluster) o "process"
+        scheduler_url: Dirección del scheduler de Dask (tcp://host:8786)
+        workers: Procesos del LocalCluster / pool local
+        chunk_size: Elementos por tarea por defecto
+    """
+
+    def __init__(
+        self,
+        backend: str = DASK_BACKEND,
+        scheduler_url: str = DASK_SCHEDULER_URL,
+        workers: int = DASK_LOCAL_WORKERS,
+        chunk_size: int = DASK_CHUNK_SIZE
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend no soportado: {backend}")
+        self.requested = backend
+        self.scheduler_url = scheduler_url
+        self.workers = max(1, workers)
+        self.chunk_size = chunk_size
+        self.backend: Optional[str] = None
+        self.timings: list[TaskTiming] = []
+        self._client = None
+        self._cluster = None
+        self._pool: Optional[concurrent.futures.Executor] = None
+        self._started_at: Optional[float] = None
+
+    # -------------------------------------------------------------------------
+    # Ciclo de vida
+    # -------------------------------------------------------------------------
+
+    def start(self) -> str:
+        """Conecta/crea el backend (idempotente). Returns: backend en uso."""
+        if self.backend is not None:
+            return self.backend
+        backend = self.requested
+        if backend in ("dask", "local") and Client is None:
+            raise RuntimeError("Dask no está instalado: uv add \"dask[distributed]\"")
+        if backend == "auto":
+            backend = "process" if Client is None else ("dask" if self.scheduler_url else "local")
+
+        if backend == "dask":
+            try:
+                self._client = Client(self.scheduler_url, timeout=DASK_CONNECT_TIMEOUT)
+            except (OSError, TimeoutError) as e:
+                if self.requested == "dask":
+                    raise
+                logger.warning(f"Dask: scheduler {self.scheduler_url} no disponible ({e}), usando LocalCluster")
+                backend = "local"
+        if backend == "local":
+            self._cluster = LocalCluster(
+                n_workers=self.workers, threads_per_worker=1, processes=True, dashboard_address=None
+            )
+            self._client = Client(self._cluster)
+        if backend == "process":
+            self._pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+
+        self.backend = backend
+        self._started_at = time.perf_counter()
+        logger.info(f"Ejecución distribuida: backend {backend}")
+        return backend
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+        if self._cluster is not None:
+            self._cluster.close()
+            self._cluster = None
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+        self.backend = None
+
+    def __enter__(self) -> "DistributedExecutor":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # -------------------------------------------------------------------------
+    # Envío
+    # -------------------------------------------------------------------------
+
+    def _submit(self, fn: Callable, *args):
+        if self._client is not None:
+            # pure=False: chunks con el mismo contenido no se deduplican
+            return self._client.submit(fn, *args, pure=False)
+        return self._pool.submit(fn, *args)
+
+    def _wait_first(self, futures: list) -> Iterable:
+        if self._client is not None:
+            return dask_wait(futures, return_when="FIRST_COMPLETED").done
+        return concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED).done
+
+    def map_chunks(
+        self,
+        fn: Callable[[list], list],
+        items: Iterable[Any],
+        chunk_size: Optional[int] = None,
+        max_in_flight: Optional[int] = None
+    ) -> Iterator[ChunkResult]:
+        """
+        Aplica `fn` (lista -> lista, importable por los workers) por chunks.
+
+        Los chunks se generan y envían a medida que se liberan slots, así
+        que entradas grandes no se materializan completas.
+
+        Args:
+            chunk_size: Elementos por tarea (default: el del executor)
+            max_in_flight: Chunks enviados sin resultado (default: 2 × workers)
+
+        Yields:
+            ChunkResult en orden de llegada; un chunk fallido trae `timing.error`
+        """
+        self.start()
+        chunks = enumerate(chunked(items, chunk_size or self.chunk_size))
+        limit = max_in_flight or 2 * self.workers
+        pending: dict[Any, tuple[int, int, float]] = {}
+
+        def fill() -> None:
+            while len(pending) < limit:
+                try:
+                    index, chunk = next(chunks)
+                except StopIteration:
+                    return
+                pending[self._submit(_run_chunk, fn, index, chunk)] = (index, len(chunk), time.perf_counter())
+
+        fill()
+        while pending:
+            done = self._wait_first(list(pending))
+            finished = [(future, pending.pop(future)) for future in done]
+            fill()
+            for future, (index, size, submitted) in finished:
+                try:
+                    _, results, run_ms, worker = future.result()
+                    error = None
+                except Exception as e:
+                    results, run_ms, worker, error = [], 0.0, "-", f"{type(e).__name__}: {e}"
+                    logger.warning(f"Chunk {index} falló: {error}")
+                timing = TaskTiming(
+                    chunk=index, items=size, run_ms=run_ms,
+                    elapsed_ms=(time.perf_counter() - submitted) * 1000, worker=worker, error=error
+                )
+                self.timings.append(timing)
+                yield ChunkResult(index, results, timing)
+
+    def summary(self) -> dict:
+        """Resumen de los chunks ejecutados: conteos, percentiles y throughput."""
+        run = [t.run_ms for t in self.timings if t.error is None]
+        items = sum(t.items for t in self.timings if t.error is None)
+        wall = time.perf_counter() - self._started_at if self._started_at else 0.0
+        return {
+            "backend": self.backend or self.requested,
+            "tasks": len(self.timings),
+            "failed": sum(1 for t in self.timings if t.error is not None),
+            "items": items,
+            "run_ms": {"p50": _percentile(run, 0.5), "p95": _percentile(run, 0.95), "max": max(run, default=0.0)},
+            "workers": len({t.worker for t in self.timings if t.error is None}),
+            "items_per_second": items / wall if wall else 0.0,
+        }
+
+
+# =============================================================================
+# Trabajos (se ejecutan en el worker: funciones de módulo, serializables)
+# =============================================================================
+
+def _partition_values(path: Path) -> dict[str, str]:
+    """Columnas de particionado estilo Hive (`period=Q4_2024/part-0.parquet`)."""
+    return dict(part.split("=", 1) for part in path.parent.parts if "=" in part)
+
+
+@dataclass
+class PartialAggregate:
+    """Suma y conteo por grupo de un conjunto de archivos Parquet."""
+    group_by: Sequence[str]
+    measures: Sequence[str]
+
+    def __call__(self, paths: list[str]) -> list[dict]:
+        import pandas as pd
+
+        frames = []
+        for raw in paths:
+            path = Path(raw)
+            df = pd.read_parquet(path)
+            for column, value in _partition_values(path).items():
+                if column not in df.columns:
+                    df[column] = value
+            frames.append(df[[*self.group_by, *self.measures]])
+        if not frames:
+            return []
+        df = pd.concat(frames, ignore_index=True)
+        grouped = df.groupby(list(self.group_by), dropna=False)
+        partial = grouped[list(self.measures)].sum()
+        partial["rows"] = grouped.size()
+        return partial.reset_index().to_dict("records")
+
+
+def aggregate_parquet(
+    executor: DistributedExecutor,
+    source: str,
+    group_by: Sequence[str],
+    measures: Sequence[str],
+    files_per_task: int = 8,
+    on_chunk: Optional[Callable[[ChunkResult], None]] = None
+):
+    """
+    Suma `measures` por `group_by` sobre todos los Parquet bajo `source`.
+
+    Cada tarea agrega `files_per_task` particiones; los parciales se combinan
+    aquí (suma de sumas y de filas), así que la memoria del proceso que
+    coordina es proporcional al número de grupos, no de filas.
+
+    Returns:
+        DataFrame con las columnas de `group_by`, las sumas y `rows`
+    """
+    import pandas as pd
+
+    paths = sorted(str(p) for p in Path(source).rglob("*.parquet"))
+    totals: dict[tuple, dict] = {}
+    job = PartialAggregate(list(group_by), list(measures))
+    for result in executor.map_chunks(job, paths, chunk_size=files_per_task):
+        if on_chunk:
+            on_chunk(result)
+        for row in result.results:
+            key = tuple(row[c] for c in group_by)
+            total = totals.setdefault(key, {**{c: row[c] for c in group_by}, **{m: 0 for m in measures}, "rows": 0})
+            for column in (*measures, "rows"):
+                total[column] += row[column]
+    return pd.DataFrame(list(totals.values()), columns=[*group_by, *measures, "rows"])
+
+
+@dataclass
+class EmbedBatch:
+    """Embeddings de un lote de textos vía Ollama (`/api/embed`)."""
+    base_url: str = OLLAMA_BASE_URL
+    model: str = EMBEDDING_MODEL
+    timeout: float = 120.0
+
+    def __call__(self, records: list[dict]) -> list[dict]:
+        import httpx
+
+        response = httpx.post(
+            f"{self.base_url.rstrip('/')}/api/embed",
+            json={"model": self.model, "input": [r["text"] for r in records]},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        embeddings = response.json()["embeddings"]
+        return [
+            {"id": r.get("id", i), "model": self.model, "embedding": e}
+            for i, (r, e) in enumerate(zip(records, embeddings))
+        ]
+
+
+def run_benchmark(configs: list[dict]) -> list[dict]:
+    """Corre scripts/load_test.py con cada configuración en un subproceso."""
+    reports = []
+    for config in configs:
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / "report.json"
+            args = [f"--{k.replace('_', '-')}={v}" for k, v in config.items()]
+            subprocess.run(
+                [sys.executable, str(ROOT / "scripts" / "load_test.py"), *args, f"--output={output}"],
+                check=True, capture_output=True, cwd=ROOT
+            )
+            reports.append({"config": config, "report": json.loads(output.read_text())})
+    return reports
+
+
+def expand_grid(grid: dict[str, Sequence[Any]]) -> list[dict]:
+    """{"a": [1, 2], "b": [3]} -> [{"a": 1, "b": 3}, {"a": 2, "b": 3}]"""
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+def _print_chunk(result: ChunkResult) -> None:
+    t = result.timing
+    status = f"error {t.error}" if t.error else f"{len(result.results)} resultados"
+    print(
+        f"chunk {t.chunk}: {t.items} elementos, {status} · {t.run_ms:.0f}ms en {t.worker} "
+        f"({t.elapsed_ms:.0f}ms desde el envío)",
+        file=sys.stderr, flush=True
+    )
+
+
+def _read_jsonl(path: str) -> Iterator[dict]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Trabajo pesado fuera de línea sobre Dask")
+    parser.add_argument("--backend", choices=BACKENDS, default=DASK_BACKEND)
+    parser.add_argument("--scheduler", default=DASK_SCHEDULER_URL)
+    parser.add_argument("--workers", type=int, default=DASK_LOCAL_WORKERS)
+    parser.add_argument("--timings", help="Archivo JSON con el timing por tarea")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    aggregate = sub.add_parser("aggregate", help="Agregar Parquet particionado")
+    aggregate.add_argument("source")
+    aggregate.add_argument("--group-by", required=True, help="Columnas separadas por coma")
+    aggregate.add_argument("--measures", required=True, help="Columnas a sumar separadas por coma")
+    aggregate.add_argument("--files-per-task", type=int, default=8)
+    aggregate.add_argument("--output", help="CSV de salida (default: stdout)")
+
+    embed = sub.add_parser("embed", help="Re-embedding masivo (JSONL con id y text)")
+    embed.add_argument("input")
+    embed.add_argument("output")
+    embed.add_argument("--batch-size", type=int, default=DASK_CHUNK_SIZE)
+    embed.add_argument("--model", default=EMBEDDING_MODEL)
+    embed.add_argument("--ollama-url", default=OLLAMA_BASE_URL)
+
+    sweep = sub.add_parser(
+        "sweep",
+        help="Barrido de parámetros de scripts/load_test.py (una configuración a la vez: "
+             "corridas simultáneas en la misma máquina distorsionan lag y latencias)"
+    )
+    sweep.add_argument("--grid", required=True, help='JSON: {"sessions": [10, 50], "queries": [20]}')
+    sweep.add_argument(
+        "--concurrent", type=int, default=1,
+        help="Configuraciones simultáneas; > 1 solo con --backend dask y un worker dedicado por máquina"
+    )
+    sweep.add_argument("--output", help="Archivo JSONL con un reporte por configuración")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    with DistributedExecutor(args.backend, args.scheduler, args.workers) as executor:
+        if args.command == "aggregate":
+            df = aggregate_parquet(
+                executor, args.source, args.group_by.split(","), args.measures.split(","),
+                files_per_task=args.files_per_task, on_chunk=_print_chunk
+            )
+            df.to_csv(args.output or sys.stdout, index=False)
+        elif args.command == "embed":
+            job = EmbedBatch(base_url=args.ollama_url, model=args.model)
+            with open(args.output, "w", encoding="utf-8") as out:
+                for result in executor.map_chunks(job, _read_jsonl(args.input), chunk_size=args.batch_size):
+                    _print_chunk(result)
+                    # Cada lote se escribe al llegar: un corte no pierde lo ya calculado
+                    out.writelines(json.dumps(r) + "\n" for r in result.results)
+                    out.flush()
+        else:
+            configs = expand_grid(json.loads(args.grid))
+            out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+            try:
+                # Cada load test mide el event loop y latencias: no comparten máquina
+                concurrent = args.concurrent if executor.backend == "dask" else 1
+                for result in executor.map_chunks(
+                    run_benchmark, configs, chunk_size=1, max_in_flight=max(1, concurrent)
+                ):
+                    _print_chunk(result)
+                    out.writelines(json.dumps(r) + "\n" for r in result.results)
+                    out.flush()
+            finally:
+                if out is not sys.stdout:
+                    out.close()
+        summary = executor.summary()
+
+    if args.timings:
+        Path(args.timings).write_text(json.dumps(
+            {"summary": summary, "tasks": [asdict(t) for t in executor.timings]}, indent=2
+        ))
+    print(json.dumps(summary, indent=2), file=sys.stderr)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
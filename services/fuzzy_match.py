@@ -0,0 +1,198 @@
+"""
+Coincidencia aproximada de métricas y sinónimos con índice de trigramas.
+
+`classify_query()` busca primero substrings exactos de SEMANTIC_KEYWORDS;
+si no hay, `MetricMatcher.match()` tolera errores de escritura ("revenu",
+"ebidta", "utilidad netta") para que la consulta siga en la ruta
+semántica determinista en vez de caer al LLM.
+
+- El índice (trigrama -> sinónimos) se construye una vez a partir de la
+  tabla de sinónimos, con el texto sin acentos y en minúsculas.
+- Para cada ventana de 1..N palabras de la consulta se filtran candidatos
+  por trigramas compartidos (coeficiente de Dice) y longitud, y solo a esos
+  se les calcula la distancia de edición acotada (Damerau/OSA: una
+  transposición cuenta como un error).
+- La confianza es 1 - distancia / longitud del sinónimo; por debajo de
+  FUZZY_MIN_CONFIDENCE no hay match, así que los sinónimos cortos
+  ("cogs", "opex", "sales") requieren coincidencia exacta y ni siquiera
+  entran al índice.
+- Los de menos de CUE_MIN_LENGTH letras ("gastos", "ventas", "ebitda")
+  solo admiten un error si la consulta menciona un período ("ebidta 2024"):
+  sin esa señal, palabras comunes como "gustos" o "vetas" no se convierten
+  en cifras financieras.
+- Las ventanas cuya longitud no puede acercarse a ningún sinónimo se
+  descartan sin calcular trigramas, y cada ventana ya vista se resuelve
+  desde un LRU, así que en régimen la consulta cuesta pocos µs.
+"""
+import logging
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Mapping, NamedTuple, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+FUZZY_MATCH_ENABLED = os.getenv("FUZZY_MATCH_ENABLED", "true").lower() == "true"
+FUZZY_MIN_CONFIDENCE = float(os.getenv("FUZZY_MIN_CONFIDENCE", "0.82"))
+
+# Dice mínimo de trigramas para calcular la distancia de edición
+MIN_TRIGRAM_SIMILARITY = 0.3
+# Palabras de menos de 4 letras no se comparan solas (artículos, preposiciones)
+MIN_WORD_LENGTH = 4
+# Sinónimos más cortos solo toleran errores si la consulta menciona un período
+CUE_MIN_LENGTH = 8
+PERIOD_CUE_PATTERN = re.compile(r"\b(q[1-4]|(19|20)\d{2}|trimestre|ano|anual|semestre|fy)\b")
+# Ventanas (1..N palabras) ya puntuadas que se recuerdan
+TERM_CACHE_SIZE = 8192
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def normalize(text: str) -> str:
+    """Minúsculas y sin acentos ("Facturación" -> "facturacion")."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def trigrams(text: str) -> frozenset[str]:
+    """Trigramas de caracteres con relleno en los bordes."""
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def max_distance(length: int) -> int:
+    """Errores tolerados según la longitud del sinónimo."""
+    return 1 if length < 8 else 2
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Distancia OSA (Damerau restringida) con corte temprano.
+
+    Returns:
+        La distancia, o `limit + 1` si la supera
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2: Optional[list[int]] = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous2 is not None and i > 1 and j > 1
+                    and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1] if previous[-1] <= limit else limit + 1
+
+
+@dataclass(frozen=True)
+class FuzzyMatch:
+    """Sinónimo encontrado para un fragmento de la consulta."""
+    metric: str
+    keyword: str
+    term: str
+    distance: int
+    confidence: float
+
+
+class _Entry(NamedTuple):
+    """Sinónimo indexado."""
+    metric: str
+    keyword: str
+    grams: frozenset[str]
+    limit: int
+    needs_cue: bool
+
+
+class MetricMatcher:
+    """
+    Índice de trigramas sobre la tabla de sinónimos métrica -> palabras clave.
+
+    Args:
+        synonyms: Mapping métrica -> lista de sinónimos (SEMANTIC_KEYWORDS)
+        min_confidence: Confianza mínima para aceptar una coincidencia
+    """
+
+    def __init__(self, synonyms: Mapping[str, Sequence[str]], min_confidence: float = FUZZY_MIN_CONFIDENCE):
+        self.min_confidence = min_confidence
+        self.entries: list[_Entry] = []
+        self.index: dict[str, set[int]] = defaultdict(set)
+        for metric, keywords in synonyms.items():
+            for keyword in keywords:
+                normalized = normalize(keyword)
+                limit = self._limit(len(normalized))
+                if limit == 0:
+                    continue  # Sinónimo corto: solo coincidencia exacta
+                grams = trigrams(normalized)
+                entry_id = len(self.entries)
+                self.entries.append(_Entry(metric, normalized, grams, limit, len(normalized) < CUE_MIN_LENGTH))
+                for gram in grams:
+                    self.index[gram].add(entry_id)
+        self.max_words = max((len(e.keyword.split()) for e in self.entries), default=1)
+        self.min_length = min((len(e.keyword) - e.limit for e in self.entries), default=0)
+        self.max_length = max((len(e.keyword) + e.limit for e in self.entries), default=0)
+        # Las palabras de las consultas se repiten mucho: cada ventana se puntúa una vez
+        self._match_term = lru_cache(maxsize=TERM_CACHE_SIZE)(self._score_term)
+
+    def _limit(self, length: int) -> int:
+        """Errores aceptables: por longitud y sin bajar de `min_confidence`."""
+        return min(max_distance(length), int(length * (1 - self.min_confidence) + 1e-9))
+
+    def _spans(self, words: list[str]):
+        for size in range(1, self.max_words + 1):
+            for start in range(len(words) - size + 1):
+                span = words[start:start + size]
+                if size == 1 and len(span[0]) < MIN_WORD_LENGTH:
+                    continue
+                term = " ".join(span)
+                if self.min_length <= len(term) <= self.max_length:
+                    yield term
+
+    def match(self, query: str) -> Optional[FuzzyMatch]:
+        """
+        Mejor coincidencia aproximada en la consulta.
+
+        Returns:
+            FuzzyMatch con la confianza, o None si ninguna supera el mínimo
+        """
+        normalized = normalize(query)
+        words = _WORD_PATTERN.findall(normalized)
+        has_cue = PERIOD_CUE_PATTERN.search(normalized) is not None
+        best: Optional[FuzzyMatch] = None
+        for term in self._spans(words):
+            candidate = self._match_term(term, has_cue)
+            if candidate is not None and (
+                best is None or (candidate.confidence, len(candidate.keyword)) > (best.confidence, len(best.keyword))
+            ):
+                best = candidate
+        return best
+
+    def _score_term(self, term: str, has_cue: bool) -> Optional[FuzzyMatch]:
+        """Mejor sinónimo para una ventana de la consulta (memoizado por término)."""
+        grams = trigrams(term)
+        shared: Counter = Counter()
+        for gram in grams:
+            for entry_id in self.index.get(gram, ()):
+                shared[entry_id] += 1
+        best: Optional[FuzzyMatch] = None
+        for entry_id, count in shared.items():
+            metric, keyword, keyword_grams, limit, needs_cue = self.entries[entry_id]
+            if needs_cue and not has_cue and term != keyword:
+                continue
+            if 2 * count / (len(grams) + len(keyword_grams)) < MIN_TRIGRAM_SIMILARITY:
+                continue
+            distance = edit_distance(term, keyword, limit)
+            if distance > limit:
+                continue
+            confidence = round(1 - distance / len(keyword), 3)
+            if best is None or (confidence, len(keyword)) > (best.confidence, len(best.keyword)):
+                best = FuzzyMatch(metric, keyword, term, distance, confidence)
+        return best
@@ -0,0 +1,239 @@
+"""
+Grabación y reproducción de llamadas HTTP externas (transportes httpx).
+
+- RecordingTransport: reenvía al transporte real y agrega cada par
+  request/response con su latencia a un cassette JSONL.
+- ReplayTransport: responde desde el cassette sin red, esperando la
+  latencia grabada (escalada) o una muestreada de la distribución grabada
+  para el mismo host.
+
+Los clientes (OpenRouter, Cube, n8n) toman su transporte de
+`cassette_transport(nombre)`, así que el modo se elige por entorno:
+
+    HTTP_CASSETTE_MODE=record python -m chainlit run app.py     # graba
+    HTTP_CASSETTE_MODE=replay python3 scripts/load_test.py ...  # reproduce
+
+Los headers de la request no se guardan (Authorization, API keys); el
+cuerpo se identifica por su SHA-256.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+HTTP_CASSETTE_MODE = os.getenv("HTTP_CASSETTE_MODE", "off").lower()  # off | record | replay
+HTTP_CASSETTE_DIR = os.getenv("HTTP_CASSETTE_DIR", "./cassettes")
+HTTP_REPLAY_LATENCY = os.getenv("HTTP_REPLAY_LATENCY", "recorded").lower()  # recorded | sampled | none
+HTTP_REPLAY_LATENCY_SCALE = float(os.getenv("HTTP_REPLAY_LATENCY_SCALE", "1.0"))
+HTTP_REPLAY_STRICT = os.getenv("HTTP_REPLAY_STRICT", "false").lower() == "true"
+
+# El cuerpo grabado ya está decodificado; estos headers ya no aplican
+_DROPPED_RESPONSE_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "set-cookie"}
+
+
+class CassetteMissError(httpx.TransportError):
+    """No hay interacción grabada para la request."""
+
+
+def _body_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def _encode_body(content: bytes) -> dict:
+    try:
+        return {"text": content.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"base64": base64.b64encode(content).decode("ascii")}
+
+
+def _decode_body(body: dict) -> bytes:
+    if "base64" in body:
+        return base64.b64decode(body["base64"])
+    return body.get("text", "").encode("utf-8")
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """
+    Graba cada interacción en `path` (una línea JSON por request).
+
+    Args:
+        path: Archivo cassette (se agrega al final)
+        inner: Transporte real; por defecto un httpx.AsyncHTTPTransport propio,
+            que se recrea si un cliente de vida corta lo cerró al salir
+    """
+
+    def __init__(self, path: str, inner: Optional[httpx.AsyncBaseTransport] = None):
+        self.path = Path(path)
+        self.inner = inner
+        self._owns_inner = inner is None
+        self._lock = asyncio.Lock()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.inner is None:
+            self.inner = httpx.AsyncHTTPTransport()
+        start = time.perf_counter()
+        response = await self.inner.handle_async_request(request)
+        try:
+            content = b"".join([chunk async for chunk in response.stream])
+        finally:
+            await response.aclose()
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        headers = [(k, v) for k, v in response.headers.items() if k.lower() not in _DROPPED_RESPONSE_HEADERS]
+        # El stream del transporte aún viene comprimido: se decodifica para grabar texto legible
+        decoded = httpx.Response(response.status_code, headers=response.headers, content=content).content
+        interaction = {
+            "request": {
+                "method": request.method,
+                "url": str(request.url),
+                "body_sha256": _body_hash(request.content),
+            },
+            "response": {"status": response.status_code, "headers": headers, "body": _encode_body(decoded)},
+            "latency_ms": round(latency_ms, 3),
+            "recorded_at": time.time(),
+        }
+        line = json.dumps(interaction, ensure_ascii=False) + "\n"
+        async with self._lock:
+            await asyncio.to_thread(self._append, line)
+        return httpx.Response(response.status_code, headers=headers, content=decoded, request=request)
+
+    def _append(self, line: str) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write(line)
+
+    async def aclose(self) -> None:
+        if self._owns_inner and self.inner is not None:
+            inner, self.inner = self.inner, None
+            await inner.aclose()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """
+    Reproduce un cassette sin red.
+
+    Busca primero por (método, URL, hash del cuerpo); si no hay y `strict`
+    es False, usa las interacciones grabadas para (método, URL) en orden
+    circular. Las repeticiones de una misma request también rotan en orden.
+
+    Args:
+        path: Archivo cassette
+        latency: "recorded" (la de cada interacción), "sampled" (al azar de las
+            grabadas para el mismo host) o "none"
+        latency_scale: Factor aplicado a la latencia (0.5 = el doble de rápido)
+        seed: Semilla para el modo "sampled"
+    """
+
+    def __init__(
+        self,
+        path: str,
+        latency: str = HTTP_REPLAY_LATENCY,
+        latency_scale: float = HTTP_REPLAY_LATENCY_SCALE,
+        strict: bool = HTTP_REPLAY_STRICT,
+        seed: Optional[int] = None
+    ):
+        if latency not in ("recorded", "sampled", "none"):
+            raise ValueError(f"Modo de latencia desconocido: {latency}")
+        self.path = Path(path)
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self.strict = strict
+        self.replayed = 0
+        self.misses = 0
+        self._random = random.Random(seed)
+        self._exact: Optional[dict[tuple, list[dict]]] = None
+        self._by_url: dict[tuple, list[dict]] = defaultdict(list)
+        self._by_host: dict[str, list[float]] = defaultdict(list)
+        self._cursor: dict[tuple, int] = defaultdict(int)
+
+    def _load(self) -> None:
+        """Indexa el cassette la primera vez que se usa."""
+        self._exact = defaultdict(list)
+        if not self.path.exists():
+            logger.warning(f"Cassette {self.path} no existe; todas las requests fallarán")
+            return
+        with self.path.open(encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                interaction = json.loads(line)
+                req = interaction["request"]
+                self._exact[(req["method"], req["url"], req["body_sha256"])].append(interaction)
+                self._by_url[(req["method"], req["url"])].append(interaction)
+                self._by_host[urlsplit(req["url"]).netloc].append(interaction["latency_ms"])
+
+    def _next(self, key: tuple, candidates: list[dict]) -> dict:
+        index = self._cursor[key] % len(candidates)
+        self._cursor[key] += 1
+        return candidates[index]
+
+    def _find(self, request: httpx.Request) -> dict:
+        if self._exact is None:
+            self._load()
+        url = str(request.url)
+        exact_key = (request.method, url, _body_hash(request.content))
+        if self._exact.get(exact_key):
+            return self._next(exact_key, self._exact[exact_key])
+        url_key = (request.method, url)
+        if not self.strict and self._by_url.get(url_key):
+            return self._next(url_key, self._by_url[url_key])
+        self.misses += 1
+        raise CassetteMissError(f"Sin interacción grabada para {request.method} {url}", request=request)
+
+    def _delay(self, request: httpx.Request, interaction: dict) -> float:
+        if self.latency == "none":
+            return 0.0
+        if self.latency == "sampled":
+            latency_ms = self._random.choice(self._by_host[request.url.netloc.decode("ascii")])
+        else:
+            latency_ms = interaction["latency_ms"]
+        return latency_ms * self.latency_scale / 1000
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        interaction = self._find(request)
+        delay = self._delay(request, interaction)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self.replayed += 1
+        response = interaction["response"]
+        return httpx.Response(
+            response["status"],
+            headers=response["headers"],
+            content=_decode_body(response["body"]),
+            request=request
+        )
+
+
+def cassette_transport(
+    name: str,
+    mode: str = HTTP_CASSETTE_MODE,
+    directory: str = HTTP_CASSETTE_DIR
+) -> Optional[httpx.AsyncBaseTransport]:
+    """
+    Transporte para el cliente `name` según HTTP_CASSETTE_MODE.
+
+    Returns:
+        None con el modo "off" (el cliente usa su transporte normal)
+    """
+    if mode == "off":
+        return None
+    path = Path(directory) / f"{name}.jsonl"
+    if mode == "record":
+        logger.info(f"HTTP {name}: grabando en {path}")
+        return RecordingTransport(str(path))
+    if mode == "replay":
+        logger.info(f"HTTP {name}: reproduciendo {path}")
+        return ReplayTransport(str(path))
+    raise ValueError(f"HTTP_CASSETTE_MODE desconocido: {mode}")
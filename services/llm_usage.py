@@ -0,0 +1,223 @@
+"""
+Contabilidad de tokens de las llamadas al LLM (OpenRouter).
+
+- Estimación local del tamaño del prompt antes de enviar (sin tokenizer).
+- Uso real leído del bloque `usage` de la respuesta, también en respuestas
+  streamed (SSE: el uso llega en el último chunk).
+- Tokens/s, latencia y costo agregados por modelo en el proceso.
+- Cuota diaria de tokens por usuario, verificada antes de llamar.
+
+Costo: se usa `usage.cost` de OpenRouter si viene en la respuesta; si no,
+los precios por millón de tokens configurados.
+"""
+import json
+import logging
+import os
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+from services.conversation import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+LLM_DAILY_TOKEN_QUOTA = int(os.getenv("LLM_DAILY_TOKEN_QUOTA", "0"))  # 0 = sin límite
+LLM_PROMPT_PRICE_PER_1M = float(os.getenv("LLM_PROMPT_PRICE_PER_1M", "0"))
+LLM_COMPLETION_PRICE_PER_1M = float(os.getenv("LLM_COMPLETION_PRICE_PER_1M", "0"))
+
+# Tokens de formato por mensaje del chat (rol, separadores)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class QuotaExceededError(Exception):
+    """El usuario agotó su cuota diaria de tokens."""
+
+
+def estimate_prompt_tokens(messages: Iterable[dict]) -> int:
+    """Estimación local de tokens de prompt para una lista de mensajes."""
+    return sum(estimate_tokens(m.get("content") or "") + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def parse_usage(payload: dict) -> Optional[dict]:
+    """
+    Extrae el uso de una respuesta (o chunk) de chat completions.
+
+    Returns:
+        Dict con prompt_tokens, completion_tokens y cost (None si no viene)
+    """
+    usage = payload.get("usage")
+    if not usage:
+        return None
+    return {
+        "prompt_tokens": int(usage.get("prompt_tokens") or 0),
+        "completion_tokens": int(usage.get("completion_tokens") or 0),
+        "cost": usage.get("cost"),
+    }
+
+
+def parse_stream_line(line: str) -> tuple[str, Optional[dict], bool]:
+    """
+    Parsea una línea SSE de una respuesta streamed.
+
+    Returns:
+        (texto del delta, uso si el chunk lo incluye, True si es "[DONE]")
+    """
+    if not line.startswith("data:"):
+        return "", None, False  # Comentarios SSE (": OPENROUTER PROCESSING") y líneas vacías
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return "", None, True
+    chunk = json.loads(data)
+    text = "".join(
+        (choice.get("delta") or {}).get("content") or "" for choice in chunk.get("choices") or []
+    )
+    return text, parse_usage(chunk), False
+
+
+def parse_stream(lines: Iterable[str]) -> tuple[str, Optional[dict]]:
+    """
+    Reconstruye el texto y el uso de una respuesta streamed (SSE).
+
+    Args:
+        lines: Líneas del stream ("data: {...}", comentarios, "data: [DONE]")
+
+    Returns:
+        (contenido concatenado, uso del último chunk que lo incluya)
+    """
+    parts = []
+    usage = None
+    for line in lines:
+        text, chunk_usage, done = parse_stream_line(line)
+        if done:
+            break
+        parts.append(text)
+        usage = chunk_usage or usage
+    return "".join(parts), usage
+
+
+@dataclass
+class CallUsage:
+    """Uso de una llamada al LLM."""
+    model: str
+    estimated_prompt_tokens: int
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency_ms: float = 0
+    cost: Optional[float] = None
+    streamed: bool = False
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def tokens_per_second(self) -> float:
+        if self.latency_ms <= 0:
+            return 0.0
+        return self.completion_tokens / (self.latency_ms / 1000)
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "total_tokens": self.total_tokens,
+                "tokens_per_second": round(self.tokens_per_second, 1)}
+
+
+@dataclass
+class ModelStats:
+    """Agregado por modelo."""
+    calls: int = 0
+    estimated_prompt_tokens: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency_ms: float = 0
+    cost: float = 0
+
+
+class UsageTracker:
+    """
+    Agrega el uso por modelo y aplica la cuota diaria por usuario.
+
+    Args:
+        daily_quota: Tokens por usuario y día (UTC); 0 desactiva la cuota
+    """
+
+    def __init__(
+        self,
+        daily_quota: int = LLM_DAILY_TOKEN_QUOTA,
+        prompt_price_per_1m: float = LLM_PROMPT_PRICE_PER_1M,
+        completion_price_per_1m: float = LLM_COMPLETION_PRICE_PER_1M
+    ):
+        self.daily_quota = daily_quota
+        self.prompt_price_per_1m = prompt_price_per_1m
+        self.completion_price_per_1m = completion_price_per_1m
+        self.models: dict[str, ModelStats] = defaultdict(ModelStats)
+        self._used: dict[tuple[str, str], int] = defaultdict(int)
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(timezone.utc).date().isoformat()
+
+    def used_today(self, user_id: str) -> int:
+        return self._used.get((user_id, self._today()), 0)
+
+    def check_quota(self, user_id: str, estimated_tokens: int) -> None:
+        """
+        Verifica la cuota antes de llamar al LLM.
+
+        Raises:
+            QuotaExceededError: Si la llamada excedería la cuota diaria
+        """
+        if self.daily_quota <= 0:
+            return
+        used = self.used_today(user_id)
+        if used + estimated_tokens > self.daily_quota:
+            raise QuotaExceededError(
+                f"Cuota diaria de tokens agotada ({used:,}/{self.daily_quota:,})"
+            )
+
+    def record(self, user_id: str, usage: CallUsage) -> CallUsage:
+        """Registra una llamada; completa el costo con la tabla de precios si falta."""
+        if usage.cost is None:
+            usage.cost = (
+                usage.prompt_tokens * self.prompt_price_per_1m
+                + usage.completion_tokens * self.completion_price_per_1m
+            ) / 1_000_000
+        stats = self.models[usage.model]
+        stats.calls += 1
+        stats.estimated_prompt_tokens += usage.estimated_prompt_tokens
+        stats.prompt_tokens += usage.prompt_tokens
+        stats.completion_tokens += usage.completion_tokens
+        stats.latency_ms += usage.latency_ms
+        stats.cost += usage.cost
+
+        today = self._today()
+        # Solo se conserva el día actual
+        for key in [k for k in self._used if k[1] != today]:
+            del self._used[key]
+        self._used[(user_id, today)] += usage.total_tokens or usage.estimated_prompt_tokens
+        logger.info(
+            f"LLM {usage.model}: {usage.prompt_tokens}+{usage.completion_tokens} tokens "
+            f"(estimado {usage.estimated_prompt_tokens}) en {usage.latency_ms:.0f}ms "
+            f"({usage.tokens_per_second:.1f} tok/s)"
+        )
+        return usage
+
+    def snapshot(self) -> dict[str, dict]:
+        """Métricas agregadas por modelo."""
+        result = {}
+        for model, stats in self.models.items():
+            seconds = stats.latency_ms / 1000
+            result[model] = {
+                "calls": stats.calls,
+                "prompt_tokens": stats.prompt_tokens,
+                "completion_tokens": stats.completion_tokens,
+                "estimated_prompt_tokens": stats.estimated_prompt_tokens,
+                "avg_latency_ms": stats.latency_ms / stats.calls if stats.calls else 0,
+                "tokens_per_second": stats.completion_tokens / seconds if seconds else 0,
+                "cost": stats.cost,
+            }
+        return result
+
+
+# Instancia global
+usage_tracker = UsageTracker()
@@ -0,0 +1,219 @@
+"""
+Monitor de lag del event loop y detector de callbacks lentos.
+
+Un thread watchdog agenda periódicamente un ping en el loop
+(`call_soon_threadsafe`) y mide cuánto tarda en ejecutarse: ese retraso es
+el lag que sufre cada sesión conectada. Si el ping no corre dentro de
+LOOP_BLOCK_THRESHOLD_MS, el watchdog captura el stack del thread del loop
+(lo que está bloqueando en ese momento) y el paso de la consulta que corría,
+registrado con `loop_monitor.step(...)`.
+
+Además configura `loop.slow_callback_duration` con el mismo umbral; con
+LOOP_DEBUG=true activa el modo debug de asyncio (más caro, solo desarrollo),
+que registra cada callback lento en el logger `asyncio`.
+
+Uso:
+    async with cl.Step(name="📊 Datos", type="tool") as step, loop_monitor.step("Datos"):
+        ...
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+import weakref
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.25"))
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100"))
+LOOP_MONITOR_SAMPLES = int(os.getenv("LOOP_MONITOR_SAMPLES", "1000"))
+LOOP_DEBUG = os.getenv("LOOP_DEBUG", "false").lower() == "true"
+
+# Frames del stack capturado que se conservan (los más internos)
+STACK_DEPTH = 12
+
+
+@dataclass
+class BlockEvent:
+    """Un bloqueo del event loop por encima del umbral."""
+    step: str
+    duration_ms: float
+    stack: str
+    timestamp: float
+
+    def to_dict(self) -> dict:
+        return {"step": self.step, "duration_ms": round(self.duration_ms, 1), "timestamp": self.timestamp}
+
+
+class _StepScope:
+    """Marca el paso activo de la tarea actual (usable con `with` y `async with`)."""
+
+    def __init__(self, monitor: "LoopMonitor", name: str):
+        self.monitor = monitor
+        self.name = name
+        self.task: Optional[asyncio.Task] = None
+
+    def __enter__(self):
+        self.task = asyncio.current_task()
+        if self.task is not None:
+            self.monitor._steps.setdefault(self.task, []).append(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        stack = self.monitor._steps.get(self.task) if self.task is not None else None
+        if stack:
+            stack.pop()
+            if not stack:
+                del self.monitor._steps[self.task]
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc):
+        return self.__exit__(*exc)
+
+
+class LoopMonitor:
+    """
+    Mide el lag del event loop desde un thread y detecta bloqueos.
+
+    Args:
+        interval: Segundos entre pings al loop
+        threshold_ms: Lag a partir del cual se considera bloqueo (y se captura el stack)
+        max_samples: Muestras de lag conservadas para percentiles
+        debug: Activa el modo debug de asyncio en el loop monitoreado
+    """
+
+    def __init__(
+        self,
+        interval: float = LOOP_MONITOR_INTERVAL,
+        threshold_ms: float = LOOP_BLOCK_THRESHOLD_MS,
+        max_samples: int = LOOP_MONITOR_SAMPLES,
+        debug: bool = LOOP_DEBUG
+    ):
+        self.interval = interval
+        self.threshold_ms = threshold_ms
+        self.debug = debug
+        self.samples: deque[float] = deque(maxlen=max_samples)
+        self.events: deque[BlockEvent] = deque(maxlen=50)
+        self.blocked = 0
+        self.blocked_by_step: Counter = Counter()
+        self._steps: "weakref.WeakKeyDictionary[asyncio.Task, list[str]]" = weakref.WeakKeyDictionary()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def step(self, name: str) -> _StepScope:
+        """Registra `name` como paso en curso de la tarea actual."""
+        return _StepScope(self, name)
+
+    # -------------------------------------------------------------------------
+    # Ciclo de vida
+    # -------------------------------------------------------------------------
+
+    def start(self) -> None:
+        """Arranca el watchdog sobre el loop en ejecución."""
+        if self._thread is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._loop.slow_callback_duration = self.threshold_ms / 1000
+        if self.debug:
+            self._loop.set_debug(True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="loop-monitor", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"Loop monitor: ping cada {self.interval}s, bloqueo > {self.threshold_ms:.0f}ms"
+        )
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=self.interval + 1)
+        self._thread = None
+
+    # -------------------------------------------------------------------------
+    # Watchdog
+    # -------------------------------------------------------------------------
+
+    def _current_step(self) -> str:
+        task = asyncio.current_task(self._loop)
+        stack = self._steps.get(task) if task is not None else None
+        if stack:
+            return stack[-1]
+        return task.get_name() if task is not None else "(callback)"
+
+    def _capture_stack(self) -> str:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return ""
+        return "".join(traceback.format_stack(frame)[-STACK_DEPTH:])
+
+    def _probe(self) -> Optional[float]:
+        """Un ping al loop; devuelve el lag en ms (None si se detuvo antes)."""
+        fired = threading.Event()
+        sent = time.perf_counter()
+        try:
+            self._loop.call_soon_threadsafe(fired.set)
+        except RuntimeError:  # Loop cerrado
+            self._stop.set()
+            return None
+        if fired.wait(self.threshold_ms / 1000):
+            return (time.perf_counter() - sent) * 1000
+
+        # Bloqueado: capturar qué corre ahora mismo y esperar a que se libere
+        step = self._current_step()
+        stack = self._capture_stack()
+        while not fired.wait(0.05):
+            if self._stop.is_set():
+                return None
+        lag_ms = (time.perf_counter() - sent) * 1000
+        self.blocked += 1
+        self.blocked_by_step[step] += 1
+        self.events.append(BlockEvent(step, lag_ms, stack, time.time()))
+        logger.warning(f"Event loop bloqueado {lag_ms:.0f}ms en paso '{step}':\n{stack}")
+        return lag_ms
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            lag_ms = self._probe()
+            if lag_ms is not None:
+                self.samples.append(lag_ms)
+
+    # -------------------------------------------------------------------------
+    # Reporte
+    # -------------------------------------------------------------------------
+
+    def snapshot(self) -> dict:
+        """Percentiles de lag y bloqueos por paso (para /metricas y load tests)."""
+        samples = sorted(self.samples)
+
+        def percentile(p: float) -> float:
+            if not samples:
+                return 0.0
+            return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+        return {
+            "samples": len(samples),
+            "p50_ms": percentile(0.50),
+            "p99_ms": percentile(0.99),
+            "max_ms": samples[-1] if samples else 0.0,
+            "blocked": self.blocked,
+            "blocked_by_step": dict(self.blocked_by_step),
+            "recent": [event.to_dict() for event in self.events],
+        }
+
+
+# Instancia global
+loop_monitor = LoopMonitor()
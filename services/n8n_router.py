@@ -0,0 +1,262 @@
+"""
+Cliente del router n8n (Fase 4) con presupuesto de latencia y fallback local.
+
+n8n es el router autoritativo, pero nunca debe agregar segundos a un mensaje:
+- La llamada al webhook compite contra un presupuesto (N8N_ROUTER_BUDGET_MS);
+  si se excede, decide el clasificador local y la respuesta tardía de n8n
+  solo se usa para poblar el cache.
+- Un circuit breaker deja de llamar a n8n tras fallos consecutivos.
+- Las decisiones se cachean por consulta normalizada.
+- Respuestas con ruta, métrica o período desconocidos se descartan: decide
+  el clasificador local (n8n no puede pedir SQL de una métrica inexistente).
+
+Cada clasificación incluye `decided_by` ("n8n", "local" o "cache") y
+`router_latency_ms` para trazabilidad.
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Callable, Iterable, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+N8N_WEBHOOK_URL = os.getenv("N8N_WEBHOOK_URL", "http://100.105.68.15:5678/webhook/sdrag-query")
+N8N_ROUTER_ENABLED = os.getenv("N8N_ROUTER_ENABLED", "true").lower() == "true"
+N8N_ROUTER_BUDGET_MS = float(os.getenv("N8N_ROUTER_BUDGET_MS", "150"))
+N8N_ROUTER_TIMEOUT = float(os.getenv("N8N_ROUTER_TIMEOUT", "2.0"))
+N8N_ROUTER_CACHE_TTL = float(os.getenv("N8N_ROUTER_CACHE_TTL", "3600"))
+N8N_ROUTER_CACHE_SIZE = int(os.getenv("N8N_ROUTER_CACHE_SIZE", "4096"))
+N8N_CIRCUIT_FAILURES = int(os.getenv("N8N_CIRCUIT_FAILURES", "3"))
+N8N_CIRCUIT_COOLDOWN = float(os.getenv("N8N_CIRCUIT_COOLDOWN", "30"))
+
+ROUTE_TARGETS = {
+    "semantic": "Cube Core",
+    "documental": "Weaviate",
+    "hybrid": "Cube Core + Weaviate",
+}
+
+
+def normalize_query(query: str) -> str:
+    """Normaliza para cache: minúsculas, sin acentos, sin puntuación ni espacios extra."""
+    text = unicodedata.normalize("NFKD", query.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+class CircuitBreaker:
+    """Abre el circuito tras `max_failures` fallos seguidos durante `cooldown` s."""
+
+    def __init__(self, max_failures: int = N8N_CIRCUIT_FAILURES, cooldown: float = N8N_CIRCUIT_COOLDOWN):
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        if self.opened_at is None:
+            return False
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return False  # Half-open: se permite un intento
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.max_failures:
+            if self.opened_at is None:
+                logger.warning(f"Router n8n: circuito abierto por {self.cooldown:.0f}s")
+            self.opened_at = time.monotonic()
+
+
+class N8nRouter:
+    """
+    Router con n8n como fuente autoritativa y clasificador local de respaldo.
+
+    Args:
+        local_classifier: Función query -> dict con el formato de classify_query()
+        metrics: Métricas válidas (SEMANTIC_KEYWORDS); None = no validar
+        periods: Períodos válidos (PERIOD_PATTERNS); None = no validar
+        transport: Transporte httpx alternativo (tests)
+    """
+
+    def __init__(
+        self,
+        local_classifier: Callable[[str], dict],
+        webhook_url: str = N8N_WEBHOOK_URL,
+        enabled: bool = N8N_ROUTER_ENABLED,
+        budget_ms: float = N8N_ROUTER_BUDGET_MS,
+        timeout: float = N8N_ROUTER_TIMEOUT,
+        cache_ttl: float = N8N_ROUTER_CACHE_TTL,
+        cache_size: int = N8N_ROUTER_CACHE_SIZE,
+        breaker: Optional[CircuitBreaker] = None,
+        metrics: Optional[Iterable[str]] = None,
+        periods: Optional[Iterable[str]] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.local_classifier = local_classifier
+        self.metrics = set(metrics) if metrics is not None else None
+        self.periods = set(periods) if periods is not None else None
+        self.webhook_url = webhook_url
+        self.enabled = enabled
+        self.budget_ms = budget_ms
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.breaker = breaker or CircuitBreaker()
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._cache: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._pending: set[asyncio.Task] = set()
+        self.decisions: Counter = Counter()
+        self.invalid_responses = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                transport=self._transport
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        for task in list(self._pending):
+            task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # -------------------------------------------------------------------------
+    # Cache
+    # -------------------------------------------------------------------------
+
+    def _cache_get(self, key: str) -> Optional[dict]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        stored_at, classification = entry
+        if time.monotonic() - stored_at > self.cache_ttl:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return classification
+
+    def _cache_put(self, key: str, classification: dict) -> None:
+        self._cache[key] = (time.monotonic(), classification)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    # -------------------------------------------------------------------------
+    # Routing
+    # -------------------------------------------------------------------------
+
+    async def _call_n8n(self, query: str, user_id: str, session_id: Optional[str]) -> dict:
+        response = await self._get_client().post(
+            self.webhook_url,
+            json={"query": query, "user_id": user_id, "session_id": session_id}
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def _merge(self, remote, local: dict) -> Optional[dict]:
+        """
+        Adapta la respuesta de n8n al formato de classify_query().
+
+        Returns:
+            La clasificación, o None si n8n devolvió valores desconocidos o
+            un JSON que no es objeto
+        """
+        if not isinstance(remote, dict):
+            return None
+        route = remote.get("route") or local["route"]
+        metric = remote.get("metric", local["metric"])
+        period = remote.get("period") or local["period"]
+        if (
+            route not in ROUTE_TARGETS
+            or (metric is not None and self.metrics is not None and metric not in self.metrics)
+            or (self.periods is not None and period not in self.periods)
+        ):
+            return None
+        return {
+            **local,
+            "route": route,
+            "route_target": ROUTE_TARGETS.get(route, local["route_target"]),
+            "metric": metric,
+            "period": period,
+            "is_financial": metric is not None and route in ("semantic", "hybrid"),
+            "confidence": remote.get("confidence"),
+        }
+
+    def _on_remote_done(self, task: asyncio.Task, key: str, local: dict) -> None:
+        self._pending.discard(task)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self.breaker.record_failure()
+            logger.warning(f"Router n8n: error {type(task.exception()).__name__}: {task.exception()}")
+            return
+        remote = task.result()
+        if isinstance(remote, dict):
+            self.breaker.record_success()
+        else:
+            # Cuerpo que no es objeto ([], "ok", null): webhook roto, cuenta como fallo
+            self.breaker.record_failure()
+        merged = self._merge(remote, local)
+        if merged is None:
+            self.invalid_responses += 1
+            logger.warning(f"Router n8n: respuesta con valores desconocidos descartada: {remote!r}")
+            return
+        self._cache_put(key, merged)
+
+    async def route(self, query: str, user_id: str = "default", session_id: Optional[str] = None) -> dict:
+        """
+        Clasifica la consulta respetando el presupuesto de latencia.
+
+        Returns:
+            Dict de classify_query() + decided_by y router_latency_ms
+        """
+        start = time.perf_counter()
+        key = normalize_query(query)
+
+        cached = self._cache_get(key)
+        if cached is not None:
+            return self._decided(cached, "cache", start)
+
+        local = self.local_classifier(query)
+        if not self.enabled or self.breaker.is_open:
+            return self._decided(local, "local", start)
+
+        task = asyncio.ensure_future(self._call_n8n(query, user_id, session_id))
+        self._pending.add(task)
+        task.add_done_callback(lambda t: self._on_remote_done(t, key, local))
+        try:
+            await asyncio.wait_for(asyncio.shield(task), self.budget_ms / 1000)
+        except asyncio.TimeoutError:
+            # n8n sigue en background y, si responde, poblará el cache
+            return self._decided(local, "local", start)
+        except Exception:
+            return self._decided(local, "local", start)
+        merged = self._merge(task.result(), local)
+        if merged is None:
+            return self._decided(local, "local", start)
+        return self._decided(merged, "n8n", start)
+
+    def _decided(self, classification: dict, decided_by: str, start: float) -> dict:
+        self.decisions[decided_by] += 1
+        return {
+            **classification,
+            "decided_by": decided_by,
+            "router_latency_ms": (time.perf_counter() - start) * 1000,
+        }
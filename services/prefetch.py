@@ -0,0 +1,323 @@
+"""
+Prefetch especulativo de los seguimientos probables de una consulta.
+
+Después de "revenue Q4 2024" la siguiente pregunta casi siempre es la misma
+métrica en un período vecino (Q3, Q1 2025), el mismo trimestre del año
+anterior o una métrica relacionada (cogs, gross_margin). Tras cada
+respuesta semántica, `Prefetcher.schedule()` calienta en background los
+caches de datos, explicación y gráfica de los N seguimientos más probables.
+
+- Las predicciones salen de un modelo de transiciones (par anterior -> par
+  siguiente) aprendido del audit log (`AuditStore.iter_query_sequence()`)
+  y actualizado en línea con cada consulta. Sin historial, pesos a priori
+  por relación (período anterior, YoY, métrica relacionada) dan el orden.
+- Baja prioridad: cada calentamiento espera a que no haya consultas de
+  usuario en curso (`foreground()`) y ocupa uno de PREFETCH_CONCURRENCY
+  slots; el LLM solo se usa si el usuario tiene cuota disponible.
+- El mensaje real siguiente cancela el prefetch pendiente de la sesión y
+  `record()` contabiliza si ese par ya estaba calentado (hit rate).
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Iterable, Mapping, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+PREFETCH_TOP_N = int(os.getenv("PREFETCH_TOP_N", "3"))
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "1"))
+# Consultas más separadas que esto no cuentan como seguimiento
+PREFETCH_SESSION_GAP_SECONDS = float(os.getenv("PREFETCH_SESSION_GAP_SECONDS", "1800"))
+PREFETCH_HISTORY_DAYS = int(os.getenv("PREFETCH_HISTORY_DAYS", "30"))
+PREFETCH_MAX_SESSIONS = int(os.getenv("PREFETCH_MAX_SESSIONS", "1000"))
+
+# Pesos a priori (< 1: una sola transición observada pesa más)
+PRIOR_WEIGHTS = {
+    "previous_period": 0.6,
+    "yoy": 0.5,
+    "related_metric": 0.4,
+    "next_period": 0.3,
+}
+
+_QUARTER_PATTERN = re.compile(r"^Q([1-4])_(\d{4})$")
+
+Pair = tuple[str, str]
+Warm = Callable[[str, str, str], Awaitable[None]]
+
+
+def neighbour_periods(period: str) -> dict[str, str]:
+    """
+    Períodos relacionados por tipo de relación.
+
+    Returns:
+        {"previous_period", "next_period", "yoy"} -> período ("Q4_2024", "2023")
+    """
+    match = _QUARTER_PATTERN.match(period)
+    if match:
+        quarter, year = int(match.group(1)), int(match.group(2))
+        previous = f"Q{quarter - 1}_{year}" if quarter > 1 else f"Q4_{year - 1}"
+        following = f"Q{quarter + 1}_{year}" if quarter < 4 else f"Q1_{year + 1}"
+        return {"previous_period": previous, "next_period": following, "yoy": f"Q{quarter}_{year - 1}"}
+    if period.isdigit():
+        year = int(period)
+        return {"previous_period": str(year - 1), "next_period": str(year + 1), "yoy": str(year - 1)}
+    return {}
+
+
+class TransitionModel:
+    """
+    Conteos de transiciones (métrica, período) -> (métrica, período).
+
+    Args:
+        periods: Períodos que el sistema sabe responder (PERIOD_PATTERNS)
+        related_metrics: Métrica -> métricas que suelen consultarse después
+        prior_weights: Peso a priori por relación para el arranque en frío
+    """
+
+    def __init__(
+        self,
+        periods: Iterable[str],
+        related_metrics: Optional[Mapping[str, Sequence[str]]] = None,
+        prior_weights: Mapping[str, float] = PRIOR_WEIGHTS
+    ):
+        self.periods = set(periods)
+        self.related_metrics = dict(related_metrics or {})
+        self.prior_weights = dict(prior_weights)
+        self.counts: dict[Pair, Counter] = defaultdict(Counter)
+        self.observations = 0
+
+    def observe(self, previous: Pair, current: Pair) -> None:
+        if previous == current:
+            return
+        self.counts[previous][current] += 1
+        self.observations += 1
+
+    def fit(self, history: Iterable[Mapping], gap_seconds: float = PREFETCH_SESSION_GAP_SECONDS) -> int:
+        """
+        Aprende de consultas ordenadas por usuario y timestamp.
+
+        Una consulta no financiera o una pausa mayor a `gap_seconds` corta la
+        cadena: la siguiente no cuenta como seguimiento.
+
+        Returns:
+            Número de transiciones aprendidas
+        """
+        learned = 0
+        previous: Optional[Pair] = None
+        previous_user, previous_time = None, None
+        for row in history:
+            user = row.get("user_id")
+            timestamp = datetime.fromisoformat(str(row["timestamp"]).replace("Z", "+00:00"))
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.replace(tzinfo=timezone.utc)
+            if (user != previous_user or previous_time is None
+                    or (timestamp - previous_time).total_seconds() > gap_seconds):
+                previous = None
+            previous_user, previous_time = user, timestamp
+            if not row.get("metric") or not row.get("period"):
+                previous = None
+                continue
+            current = (row["metric"], row["period"])
+            if previous is not None and previous != current:
+                self.observe(previous, current)
+                learned += 1
+            previous = current
+        return learned
+
+    def priors(self, metric: str, period: str) -> dict[Pair, float]:
+        scores: dict[Pair, float] = {}
+        candidates = [
+            (relation, (metric, other)) for relation, other in neighbour_periods(period).items()
+        ] + [
+            ("related_metric", (other, period)) for other in self.related_metrics.get(metric, ())
+        ]
+        for relation, pair in candidates:
+            if pair[1] in self.periods:
+                scores[pair] = max(scores.get(pair, 0.0), self.prior_weights.get(relation, 0.0))
+        return scores
+
+    def predict(self, metric: str, period: str, top_n: int = PREFETCH_TOP_N) -> list[Pair]:
+        """Los `top_n` pares siguientes más probables (aprendidos primero, luego a priori)."""
+        scores = Counter(self.priors(metric, period))
+        for pair, count in self.counts.get((metric, period), {}).items():
+            scores[pair] += count
+        scores.pop((metric, period), None)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [pair for pair, _ in ranked[:top_n]]
+
+
+@dataclass
+class _SessionState:
+    last: Optional[Pair] = None
+    predicted: Optional[set[Pair]] = None
+    warmed: set[Pair] = field(default_factory=set)
+    task: Optional[asyncio.Task] = None
+
+
+class Prefetcher:
+    """
+    Calienta caches para los seguimientos previstos de cada sesión.
+
+    Args:
+        model: Modelo de transiciones
+        warm: Async (métrica, período, user_id) que deja datos/explicación/gráfica en cache
+        top_n: Seguimientos a calentar por respuesta
+        concurrency: Calentamientos simultáneos en todo el proceso
+    """
+
+    def __init__(
+        self,
+        model: TransitionModel,
+        warm: Warm,
+        top_n: int = PREFETCH_TOP_N,
+        concurrency: int = PREFETCH_CONCURRENCY,
+        enabled: bool = PREFETCH_ENABLED,
+        max_sessions: int = PREFETCH_MAX_SESSIONS
+    ):
+        self.model = model
+        self.warm = warm
+        self.top_n = top_n
+        self.enabled = enabled
+        self.max_sessions = max_sessions
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._foreground = 0
+        self._sessions: OrderedDict[str, _SessionState] = OrderedDict()
+        self.warmed = 0
+        self.cancelled = 0
+        self.followups = 0
+        self.hits = 0
+
+    def _session(self, session_key: str) -> _SessionState:
+        state = self._sessions.get(session_key)
+        if state is None:
+            state = self._sessions[session_key] = _SessionState()
+            while len(self._sessions) > self.max_sessions:
+                _, evicted = self._sessions.popitem(last=False)
+                if evicted.task is not None:
+                    evicted.task.cancel()
+        self._sessions.move_to_end(session_key)
+        return state
+
+    @asynccontextmanager
+    async def foreground(self):
+        """Marca una consulta de usuario en curso; el prefetch espera a que termine."""
+        self._foreground += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self._foreground -= 1
+            if self._foreground == 0:
+                self._idle.set()
+
+    def cancel(self, session_key: str) -> None:
+        """Cancela el prefetch pendiente (llegó el siguiente mensaje real)."""
+        state = self._sessions.get(session_key)
+        if state is not None and state.task is not None and not state.task.done():
+            state.task.cancel()
+            self.cancelled += 1
+
+    def forget(self, session_key: str) -> None:
+        """Fin de la sesión: cancela y descarta su estado."""
+        self.cancel(session_key)
+        self._sessions.pop(session_key, None)
+
+    def record(self, session_key: str, pair: Optional[Pair]) -> Optional[bool]:
+        """
+        Registra la consulta real de la sesión y actualiza el modelo.
+
+        Args:
+            pair: (métrica, período) consultado; None para consultas no financieras
+
+        Returns:
+            True si el par ya estaba calentado, False si no, None si no había predicción
+        """
+        state = self._session(session_key)
+        if pair is not None and state.last is not None:
+            self.model.observe(state.last, pair)
+        state.last = pair
+        predicted, warmed = state.predicted, state.warmed
+        state.predicted, state.warmed = None, set()
+        if predicted is None:
+            return None
+        self.followups += 1
+        hit = pair is not None and pair in warmed
+        self.hits += hit
+        return hit
+
+    def schedule(self, session_key: str, metric: str, period: str, user_id: str) -> list[Pair]:
+        """
+        Lanza en background el calentamiento de los seguimientos previstos.
+
+        Returns:
+            Pares previstos (vacío si el prefetch está desactivado)
+        """
+        if not self.enabled:
+            return []
+        self.cancel(session_key)
+        targets = self.model.predict(metric, period, self.top_n)
+        state = self._session(session_key)
+        state.predicted, state.warmed = set(targets), set()
+        if targets:
+            state.task = asyncio.create_task(self._run(state, targets, user_id))
+        return targets
+
+    async def _run(self, state: _SessionState, targets: list[Pair], user_id: str) -> None:
+        warmed = state.warmed
+        for metric, period in targets:
+            async with self._slots:
+                await self._idle.wait()
+                start = time.perf_counter()
+                try:
+                    await self.warm(metric, period, user_id)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Prefetch: {metric} {period} falló: {e}")
+                    continue
+            warmed.add((metric, period))
+            self.warmed += 1
+            logger.debug(f"Prefetch: {metric} {period} en {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    async def stop(self) -> None:
+        tasks = [s.task for s in self._sessions.values() if s.task is not None and not s.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def snapshot(self) -> dict:
+        return {
+            "followups": self.followups,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.followups if self.followups else 0.0,
+            "warmed": self.warmed,
+            "cancelled": self.cancelled,
+            "transitions": self.model.observations,
+        }
+
+
+def read_history(days: int = PREFETCH_HISTORY_DAYS) -> list[dict]:
+    """
+    Secuencia de consultas del audit log de los últimos `days` días.
+
+    Ingesta primero los JSONL nuevos al índice SQLite (incremental). Es
+    bloqueante: llamarla con `asyncio.to_thread`.
+    """
+    from services.audit_store import AuditStore
+
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    store = AuditStore()
+    try:
+        store.ingest_directory()
+        return list(store.iter_query_sequence(since=since))
+    finally:
+        store.close()
@@ -0,0 +1,241 @@
+"""
+Profiling por consulta con salida collapsed-stack y speedscope.
+
+Profiler de muestreo sobre la tarea de la consulta (no sobre todo el
+proceso): un thread toma una muestra cada PROFILE_INTERVAL_MS.
+- Si el loop está ejecutando la tarea, se toma el stack real del thread
+  (tiempo de CPU en código síncrono).
+- Si la tarea está suspendida, se reconstruye su cadena de `await`
+  (tiempo esperando I/O: OpenRouter, Cube, n8n), con una hoja `(await)`.
+Así el perfil reparte el tiempo de pared de la consulta aunque otras
+sesiones compartan el loop. Las subtareas (create_task/gather) no se siguen.
+
+Se activa por usuario (PROFILE_USERS), por fracción muestreada de consultas
+(PROFILE_SAMPLE_RATE) o por sesión con el comando /perfilar. Desactivado,
+el costo es una consulta a un set.
+
+Archivos en PROFILE_DIR:
+    <clave>.collapsed          # flamegraph.pl / inferno / speedscope
+    <clave>.speedscope.json    # https://www.speedscope.app
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+from services.tables import markdown_table
+
+logger = logging.getLogger(__name__)
+
+PROFILE_USERS = {u.strip() for u in os.getenv("PROFILE_USERS", "").split(",") if u.strip()}
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "15"))
+
+AWAIT_FRAME = "(await)"
+
+
+def _label(code) -> str:
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class RequestProfile:
+    """
+    Muestras de una consulta; usar con `async with` dentro de la tarea a perfilar.
+
+    Args:
+        key: Identificador de los archivos (sesión + marca de tiempo)
+        interval_ms: Periodo de muestreo
+        output_dir: Directorio de salida (None = no escribir archivos)
+    """
+
+    def __init__(self, key: str, interval_ms: float = PROFILE_INTERVAL_MS,
+                 output_dir: Optional[str] = PROFILE_DIR):
+        self.key = key
+        self.interval = interval_ms / 1000
+        self.output_dir = Path(output_dir) if output_dir else None
+        self.samples: Counter = Counter()  # stack (tupla raíz→hoja) -> ms
+        self.duration_ms = 0.0
+        self.files: list[Path] = []
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id: Optional[int] = None
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._start = 0.0
+
+    # -------------------------------------------------------------------------
+    # Muestreo
+    # -------------------------------------------------------------------------
+
+    def _running_stack(self) -> tuple[str, ...]:
+        """Stack del thread del loop, recortado a partir de la corrutina de la tarea."""
+        frame = sys._current_frames().get(self._thread_id)
+        root = self._task.get_coro().cr_code
+        stack = []
+        while frame is not None:
+            stack.append(_label(frame.f_code))
+            if frame.f_code is root:
+                break
+            frame = frame.f_back
+        return tuple(reversed(stack))
+
+    def _await_stack(self) -> tuple[str, ...]:
+        """Cadena de `await` de la tarea suspendida."""
+        stack = []
+        coro = self._task.get_coro()
+        while coro is not None:
+            code = getattr(coro, "cr_code", None) or getattr(coro, "gi_code", None)
+            if code is None:
+                break
+            stack.append(_label(code))
+            coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+        stack.append(AWAIT_FRAME)
+        return tuple(stack)
+
+    def _run(self) -> None:
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            try:
+                if asyncio.current_task(self._loop) is self._task:
+                    stack = self._running_stack()
+                else:
+                    stack = self._await_stack()
+            except (AttributeError, RuntimeError, ValueError):
+                continue  # La tarea cambió de estado durante la lectura
+            now = time.perf_counter()
+            self.samples[stack] += (now - last) * 1000
+            last = now
+
+    async def __aenter__(self) -> "RequestProfile":
+        self._task = asyncio.current_task()
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._start = time.perf_counter()
+        self._sampler = threading.Thread(target=self._run, name=f"profiler-{self.key}", daemon=True)
+        self._sampler.start()
+        return self
+
+    async def __aexit__(self, *exc) -> bool:
+        self._stop.set()
+        self._sampler.join()
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+        if self.output_dir is not None and self.samples:
+            try:
+                self.files = await asyncio.to_thread(self.write)
+            except OSError as e:
+                logger.error(f"No se pudo escribir el perfil {self.key}: {e}")
+        return False
+
+    # -------------------------------------------------------------------------
+    # Salida
+    # -------------------------------------------------------------------------
+
+    def collapsed(self) -> str:
+        """Formato collapsed-stack: `raíz;...;hoja <microsegundos>` por línea."""
+        return "".join(
+            f"{';'.join(stack)} {round(ms * 1000)}\n" for stack, ms in self.samples.most_common()
+        )
+
+    def speedscope(self) -> dict:
+        """Perfil `sampled` de speedscope (pesos en milisegundos)."""
+        frames: dict[str, int] = {}
+        samples, weights = [], []
+        for stack, ms in self.samples.items():
+            samples.append([frames.setdefault(name, len(frames)) for name in stack])
+            weights.append(round(ms, 3))
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": [{"name": name} for name in frames]},
+            "profiles": [{
+                "type": "sampled",
+                "name": self.key,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(sum(weights), 3),
+                "samples": samples,
+                "weights": weights,
+            }],
+            "name": self.key,
+            "exporter": "sdrag-chainlit",
+        }
+
+    def write(self) -> list[Path]:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        collapsed_path = self.output_dir / f"{self.key}.collapsed"
+        speedscope_path = self.output_dir / f"{self.key}.speedscope.json"
+        collapsed_path.write_text(self.collapsed(), encoding="utf-8")
+        speedscope_path.write_text(json.dumps(self.speedscope()), encoding="utf-8")
+        logger.info(f"Perfil {self.key}: {self.duration_ms:.0f}ms → {collapsed_path}")
+        return [collapsed_path, speedscope_path]
+
+    def top_functions(self, n: int = PROFILE_TOP_N) -> list[tuple[str, float, float]]:
+        """(función, ms propios, ms inclusivos) ordenado por tiempo inclusivo."""
+        self_ms: Counter = Counter()
+        total_ms: Counter = Counter()
+        for stack, ms in self.samples.items():
+            self_ms[stack[-1]] += ms
+            for name in set(stack):
+                total_ms[name] += ms
+        ranked = sorted(total_ms, key=lambda name: (-total_ms[name], -self_ms[name]))
+        return [(name, self_ms[name], total_ms[name]) for name in ranked[:n]]
+
+    def summary_markdown(self, n: int = PROFILE_TOP_N) -> str:
+        sampled = sum(self.samples.values()) or 1
+        rows = [
+            (f"`{name}`", f"{own:.1f}", f"{total:.1f}", f"{total / sampled:.0%}")
+            for name, own, total in self.top_functions(n)
+        ]
+        files = "".join(f"\n- `{path}`" for path in self.files)
+        return (
+            f"**Duración:** {self.duration_ms:.0f}ms · **Muestras:** {len(self.samples)} stacks"
+            f" cada {self.interval * 1000:.0f}ms\n\n"
+            + (markdown_table(("Función", "Self (ms)", "Total (ms)", "%"), rows) if rows else "Sin muestras.")
+            + (f"\n\n**Archivos:**{files}" if files else "")
+        )
+
+
+class RequestProfiler:
+    """
+    Decide qué consultas perfilar.
+
+    Args:
+        users: Usuarios perfilados siempre
+        sample_rate: Fracción de consultas perfiladas al azar (0 = ninguna)
+    """
+
+    def __init__(
+        self,
+        users: Optional[set[str]] = None,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        interval_ms: float = PROFILE_INTERVAL_MS,
+        output_dir: Optional[str] = PROFILE_DIR
+    ):
+        self.users = PROFILE_USERS if users is None else users
+        self.sample_rate = sample_rate
+        self.interval_ms = interval_ms
+        self.output_dir = output_dir
+        self.profiled = 0
+
+    def should_profile(self, user_id: str, session_enabled: bool = False) -> bool:
+        return (
+            session_enabled
+            or user_id in self.users
+            or (self.sample_rate > 0 and random.random() < self.sample_rate)
+        )
+
+    def profile(self, key: str) -> RequestProfile:
+        self.profiled += 1
+        return RequestProfile(key, self.interval_ms, self.output_dir)
+
+
+# Instancia global
+request_profiler = RequestProfiler()
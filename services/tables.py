@@ -0,0 +1,146 @@
+"""
+Renderizado de tablas markdown sin pandas.
+
+Fast path para resultados pequeños (una métrica, un período): formatea el
+markdown directamente desde tuplas, sin construir un DataFrame ni pasar por
+tabulate. Para resultados grandes (Fase 6, Tarea 6.1: 1000 filas < 1s),
+`PaginatedTable` formatea solo la página visible y mantiene el resto como un
+cursor que se rebana bajo demanda.
+"""
+from typing import Any, Iterable, Optional, Sequence
+
+DEFAULT_PAGE_SIZE = 50
+
+PERCENT_HINTS = ("ratio", "margin", "margen", "pct")
+CURRENCY_HINTS = (
+    "revenue", "cost", "cogs", "opex", "ebitda", "income", "amount", "valor", "value"
+)
+
+
+def format_value(column: str, value: Any) -> str:
+    """
+    Formatea una celda según el nombre de la columna.
+
+    Ratios/márgenes como porcentaje y montos como moneda (mismas reglas que
+    `render_dataframe` de la Fase 6); el resto con str().
+    """
+    if value is None:
+        return ""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return str(value)
+    name = column.lower()
+    if any(hint in name for hint in PERCENT_HINTS):
+        return f"{value:.2%}"
+    if any(hint in name for hint in CURRENCY_HINTS):
+        return f"${value:,.2f}"
+    return f"{value:,}" if isinstance(value, int) else f"{value:,.2f}"
+
+
+def _cell(value: Any) -> str:
+    return str(value).replace("|", "\\|").replace("\n", " ")
+
+
+def markdown_table(headers: Sequence[str], rows: Iterable[Sequence[Any]]) -> str:
+    """
+    Genera una tabla markdown (formato pipe) a partir de tuplas.
+
+    Args:
+        headers: Nombres de columna
+        rows: Filas ya formateadas (cualquier iterable de secuencias)
+
+    Returns:
+        Tabla markdown con columnas alineadas
+    """
+    header_cells = [_cell(h) for h in headers]
+    body = [[_cell(v) for v in row] for row in rows]
+    widths = [max(len(h), 3) for h in header_cells]
+    for row in body:
+        for i, cell in enumerate(row):
+            if len(cell) > widths[i]:
+                widths[i] = len(cell)
+
+    def line(cells: Sequence[str]) -> str:
+        return "| " + " | ".join(c.ljust(w) for c, w in zip(cells, widths)) + " |"
+
+    separator = "|" + "|".join(":" + "-" * (w + 1) for w in widths) + "|"
+    return "\n".join([line(header_cells), separator, *(line(row) for row in body)])
+
+
+class RecordCursor:
+    """
+    Vista de solo lectura sobre una lista de dicts (p. ej. `data` de Cube Core).
+
+    Convierte a tuplas únicamente las filas del slice solicitado.
+    """
+
+    def __init__(self, records: Sequence[dict], columns: Optional[Sequence[str]] = None):
+        self.records = records
+        self.columns = list(columns) if columns is not None else (
+            list(records[0].keys()) if records else []
+        )
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __getitem__(self, index: slice) -> list[tuple]:
+        return [
+            tuple(format_value(col, record.get(col)) for col in self.columns)
+            for record in self.records[index]
+        ]
+
+
+class PaginatedTable:
+    """
+    Tabla paginada que formatea solo la página solicitada.
+
+    Args:
+        headers: Nombres de columna
+        rows: Secuencia rebanable de filas (lista de tuplas o RecordCursor)
+        page_size: Filas por página
+    """
+
+    def __init__(
+        self,
+        headers: Sequence[str],
+        rows: Sequence[Sequence[Any]],
+        page_size: int = DEFAULT_PAGE_SIZE
+    ):
+        self.headers = list(headers)
+        self.rows = rows
+        self.page_size = page_size
+
+    @classmethod
+    def from_records(
+        cls,
+        records: Sequence[dict],
+        columns: Optional[Sequence[str]] = None,
+        page_size: int = DEFAULT_PAGE_SIZE
+    ) -> "PaginatedTable":
+        """Construye la tabla desde una lista de dicts sin copiarla."""
+        cursor = RecordCursor(records, columns)
+        headers = [col.replace("_", " ").title() for col in cursor.columns]
+        return cls(headers, cursor, page_size)
+
+    @property
+    def total_rows(self) -> int:
+        return len(self.rows)
+
+    @property
+    def num_pages(self) -> int:
+        return max(1, -(-self.total_rows // self.page_size))
+
+    def render_page(self, page: int = 1) -> str:
+        """
+        Renderiza una página (1-indexada) como markdown.
+
+        Raises:
+            ValueError: Si la página está fuera de rango
+        """
+        if not 1 <= page <= self.num_pages:
+            raise ValueError(f"Página {page} fuera de rango (1-{self.num_pages})")
+        start = (page - 1) * self.page_size
+        end = min(start + self.page_size, self.total_rows)
+        table = markdown_table(self.headers, self.rows[start:end])
+        if self.num_pages == 1:
+            return table
+        return f"{table}\n\n*Página {page}/{self.num_pages} (filas {start + 1}-{end} de {self.total_rows})*"
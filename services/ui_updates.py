@@ -0,0 +1,190 @@
+"""
+Actualizaciones de UI agrupadas: menos frames de websocket por respuesta.
+
+- TokenBuffer: acumula tokens streamed y los envía al mensaje/step en un
+  solo `stream_token` cada UI_FLUSH_INTERVAL_MS o UI_FLUSH_MAX_CHARS, con
+  un flush final al cerrar. Un flush pendiente por tiempo se dispara aunque
+  no lleguen más tokens.
+- CoalescedStep: cl.Step que difiere el `send` inicial; si el paso termina
+  antes del intervalo (clasificación, SQL, datos) sale un único frame con el
+  resultado en vez de send + update. Los pasos lentos (LLM) se muestran al
+  vencer el intervalo, como antes.
+
+`ui_stats` cuenta frames y tokens por respuesta para /metricas y el
+benchmark (scripts/benchmark_ui_updates.py).
+"""
+import asyncio
+import logging
+import os
+from typing import Optional, Protocol
+
+import chainlit as cl
+
+logger = logging.getLogger(__name__)
+
+UI_FLUSH_INTERVAL_MS = float(os.getenv("UI_FLUSH_INTERVAL_MS", "50"))
+UI_FLUSH_MAX_CHARS = int(os.getenv("UI_FLUSH_MAX_CHARS", "256"))
+
+
+class StreamTarget(Protocol):
+    async def stream_token(self, token: str, is_sequence: bool = False) -> None: ...
+
+
+class UIStats:
+    """Frames enviados por respuesta (tokens vs. frames de streaming)."""
+
+    def __init__(self):
+        self.answers = 0
+        self.tokens = 0
+        self.frames = 0
+        self.step_frames = 0
+        self.steps = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "answers": self.answers,
+            "tokens_per_answer": self.tokens / self.answers if self.answers else 0,
+            "frames_per_answer": self.frames / self.answers if self.answers else 0,
+            "frames_per_step": self.step_frames / self.steps if self.steps else 0,
+        }
+
+
+class TokenBuffer:
+    """
+    Buffer de tokens hacia un cl.Message / cl.Step con flush por tiempo o tamaño.
+
+    Args:
+        target: Objeto con `stream_token` (cl.Message, cl.Step)
+        interval_ms: Máximo tiempo que un token espera en el buffer
+        max_chars: Flush inmediato al acumular este tamaño
+        stats: Contadores a actualizar (None = no contar)
+    """
+
+    def __init__(
+        self,
+        target: StreamTarget,
+        interval_ms: float = UI_FLUSH_INTERVAL_MS,
+        max_chars: int = UI_FLUSH_MAX_CHARS,
+        stats: Optional[UIStats] = None
+    ):
+        self.target = target
+        self.interval = interval_ms / 1000
+        self.max_chars = max_chars
+        self.stats = stats
+        self.tokens = 0
+        self.frames = 0
+        self._parts: list[str] = []
+        self._size = 0
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+
+    async def push(self, token: str) -> None:
+        if not token:
+            return
+        self.tokens += 1
+        self._parts.append(token)
+        self._size += len(token)
+        if self._size >= self.max_chars or self.interval <= 0:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.interval)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._parts:
+                return
+            chunk = "".join(self._parts)
+            self._parts.clear()
+            self._size = 0
+            self.frames += 1
+            await self.target.stream_token(chunk)
+
+    async def close(self) -> None:
+        """Flush final; cancela el flush por tiempo pendiente."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
+        if self.stats is not None:
+            self.stats.answers += 1
+            self.stats.tokens += self.tokens
+            self.stats.frames += self.frames
+
+    async def __aenter__(self) -> "TokenBuffer":
+        return self
+
+    async def __aexit__(self, *exc) -> bool:
+        await self.close()
+        return False
+
+
+class CoalescedStep(cl.Step):
+    """
+    cl.Step que envía un solo frame si termina antes de `delay_ms`.
+
+    Uso idéntico a cl.Step (`async with CoalescedStep(name=..., type=...) as step`).
+    """
+
+    def __init__(self, *args, delay_ms: float = UI_FLUSH_INTERVAL_MS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._delay = delay_ms / 1000
+        self._sent = False
+        self._pending_send: Optional[asyncio.Task] = None
+        self._frames = 0
+
+    async def _send_now(self):
+        self._sent = True
+        self._frames += 1
+        return await super().send()
+
+    async def _send_later(self) -> None:
+        await asyncio.sleep(self._delay)
+        await self._send_now()
+
+    async def _settle_pending(self) -> None:
+        """Cancela el send diferido si aún espera; si ya está enviando, lo espera."""
+        task, self._pending_send = self._pending_send, None
+        if task is None:
+            return
+        if self._sent:
+            await task
+        else:
+            task.cancel()
+
+    async def send(self):
+        # Llamado por __aenter__: se difiere; si el paso termina antes, update() lo envía completo
+        if self._sent or self._pending_send is not None:
+            return self
+        if self._delay <= 0:
+            return await self._send_now()
+        self._pending_send = asyncio.create_task(self._send_later())
+        return self
+
+    async def stream_token(self, token: str, is_sequence=False, is_input=False):
+        await self._settle_pending()
+        if not self._sent:
+            await self._send_now()
+        self._frames += 1
+        await super().stream_token(token, is_sequence=is_sequence, is_input=is_input)
+
+    async def update(self):
+        await self._settle_pending()
+        if not self._sent:
+            await self._send_now()  # Un solo frame con el resultado final
+            return True
+        self._frames += 1
+        return await super().update()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await super().__aexit__(exc_type, exc_val, exc_tb)
+        ui_stats.steps += 1
+        ui_stats.step_frames += self._frames
+
+
+# Instancia global
+ui_stats = UIStats()
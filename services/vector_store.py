@@ -0,0 +1,335 @@
+"""
+Almacén compacto de embeddings con cuantización int8 o PQ (memory-mapped).
+
+Un vector de 768 dimensiones de `nomic-embed-text` ocupa 3 KB como float32
+y ~25 KB como lista de Python. Para recuperación local y cache semántico el
+índice guarda en disco, como arrays contiguos abiertos con `np.memmap`:
+
+- `codes.bin`: códigos compactos que se recorren en cada búsqueda
+  (int8: 1 byte por dimensión, 4x menos; PQ: 1 byte por subespacio, p. ej.
+  96 bytes por vector, 32x menos).
+- `vectors.f32`: los float32 normalizados, solo para re-puntuar los
+  candidatos; el sistema operativo pagina únicamente esas filas.
+- `meta.json` / `quantizer.npz`: ids, dimensiones y parámetros del cuantizador.
+
+Búsqueda en dos fases con distancia asimétrica (la consulta no se cuantiza):
+1. Puntaje aproximado de todos los códigos por bloques, vectorizado
+   (int8: producto matricial con la consulta escalada; PQ: tabla de
+   productos consulta-centroide por subespacio y suma de lookups).
+2. Los `k × rescore_factor` mejores se re-puntúan con el coseno exacto en
+   float32.
+
+Ver scripts/benchmark_vectors.py para recall@10, memoria y QPS frente a la
+búsqueda exacta en float32.
+"""
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "int8")  # "int8" o "pq"
+VECTOR_PQ_SUBSPACES = int(os.getenv("VECTOR_PQ_SUBSPACES", "96"))
+VECTOR_RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", "4"))
+
+QUANTIZATIONS = ("int8", "pq")
+PQ_CENTROIDS = 256  # Un byte por subespacio
+PQ_TRAIN_SAMPLES = 10_000  # ~40 puntos por centroide
+PQ_KMEANS_ITERATIONS = 10
+# Filas por bloque en el barrido aproximado (acota la memoria temporal)
+SCAN_BLOCK_ROWS = 8192
+
+_META_FILE = "meta.json"
+_CODES_FILE = "codes.bin"
+_VECTORS_FILE = "vectors.f32"
+_QUANTIZER_FILE = "quantizer.npz"
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """float32 contiguo con filas de norma 1 (coseno = producto punto)."""
+    array = np.ascontiguousarray(np.atleast_2d(np.asarray(vectors, dtype=np.float32)))
+    norms = np.linalg.norm(array, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return array / norms
+
+
+# =============================================================================
+# Cuantizadores
+# =============================================================================
+
+class ScalarQuantizer:
+    """
+    int8 afín por dimensión: x ≈ (code + 128) * step + low.
+
+    El puntaje asimétrico de q contra un código es
+    (q * step) · code + q · (128 * step + low), así que basta un producto
+    matricial con la consulta escalada más una constante por consulta.
+    """
+
+    def __init__(self, low: np.ndarray, step: np.ndarray):
+        self.low = low.astype(np.float32)
+        self.step = step.astype(np.float32)
+
+    @classmethod
+    def train(cls, vectors: np.ndarray) -> "ScalarQuantizer":
+        low, high = vectors.min(axis=0), vectors.max(axis=0)
+        step = np.maximum(high - low, 1e-12) / 255
+        return cls(low, step)
+
+    @property
+    def code_size(self) -> int:
+        return len(self.low)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((vectors - self.low) / self.step) - 128
+        return np.clip(codes, -128, 127).astype(np.int8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return (codes.astype(np.float32) + 128) * self.step + self.low
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Puntajes aproximados (consultas × filas) de un bloque de códigos."""
+        weights = queries * self.step
+        offset = queries @ (128 * self.step + self.low)
+        if len(queries) == 1:
+            # Una consulta: einsum convierte el int8 por tramos, sin copiar el bloque a float32
+            approx = np.einsum("nd,d->n", codes, weights[0])[None, :]
+        else:
+            approx = weights @ codes.astype(np.float32).T
+        return approx + offset[:, None]
+
+    def state(self) -> dict[str, np.ndarray]:
+        return {"low": self.low, "step": self.step}
+
+
+class ProductQuantizer:
+    """
+    Product quantization: `subspaces` bloques de dimensiones, 256 centroides
+    por bloque (k-means) y un byte por bloque.
+
+    El puntaje asimétrico suma, por subespacio, el producto de la consulta
+    con el centroide asignado (tabla de `subspaces × 256` por consulta).
+    """
+
+    def __init__(self, centroids: np.ndarray):
+        self.centroids = centroids.astype(np.float32)  # (subspaces, 256, sub_dim)
+
+    @property
+    def subspaces(self) -> int:
+        return self.centroids.shape[0]
+
+    @property
+    def code_size(self) -> int:
+        return self.subspaces
+
+    @classmethod
+    def train(
+        cls,
+        vectors: np.ndarray,
+        subspaces: int = VECTOR_PQ_SUBSPACES,
+        iterations: int = PQ_KMEANS_ITERATIONS,
+        seed: int = 0
+    ) -> "ProductQuantizer":
+        n, dim = vectors.shape
+        if dim % subspaces:
+            raise ValueError(f"{dim} dimensiones no se dividen en {subspaces} subespacios")
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(n, min(n, PQ_TRAIN_SAMPLES), replace=False)]
+        k = min(PQ_CENTROIDS, len(sample))
+        sub_dim = dim // subspaces
+        centroids = np.zeros((subspaces, PQ_CENTROIDS, sub_dim), dtype=np.float32)
+        for m in range(subspaces):
+            block = np.ascontiguousarray(sample[:, m * sub_dim:(m + 1) * sub_dim])
+            centers = block[rng.choice(len(block), k, replace=False)].copy()
+            for _ in range(iterations):
+                assignment = cls._nearest(block, centers)
+                counts = np.bincount(assignment, minlength=k)[:, None]
+                sums = np.stack(
+                    [np.bincount(assignment, weights=block[:, j], minlength=k) for j in range(sub_dim)],
+                    axis=1
+                )
+                # Centroides vacíos conservan su posición
+                centers = np.where(counts > 0, sums / np.maximum(counts, 1), centers).astype(np.float32)
+            centroids[m, :k] = centers
+            centroids[m, k:] = centers[0]
+        return cls(centroids)
+
+    @staticmethod
+    def _nearest(block: np.ndarray, centers: np.ndarray) -> np.ndarray:
+        # ||x - c||² sin el término ||x||² (constante por fila)
+        distances = block @ (-2 * centers.T)
+        distances += (centers ** 2).sum(axis=1)
+        return distances.argmin(axis=1)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        sub_dim = self.centroids.shape[2]
+        codes = np.empty((len(vectors), self.subspaces), dtype=np.uint8)
+        for m in range(self.subspaces):
+            block = np.ascontiguousarray(vectors[:, m * sub_dim:(m + 1) * sub_dim])
+            codes[:, m] = self._nearest(block, self.centroids[m])
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        parts = [self.centroids[m][codes[:, m]] for m in range(self.subspaces)]
+        return np.concatenate(parts, axis=1)
+
+    def lookup_tables(self, queries: np.ndarray) -> np.ndarray:
+        """(consultas, subespacios, 256): producto de cada sub-consulta con cada centroide."""
+        sub_queries = queries.reshape(len(queries), self.subspaces, -1)
+        return np.einsum("qms,mks->qmk", sub_queries, self.centroids)
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        tables = self.lookup_tables(queries).reshape(len(queries), -1)
+        # Posición de cada código en la tabla aplanada (subespacio * 256 + código)
+        positions = codes + np.arange(0, self.subspaces * PQ_CENTROIDS, PQ_CENTROIDS, dtype=np.int32)
+        return np.stack([table[positions].sum(axis=1) for table in tables])
+
+    def state(self) -> dict[str, np.ndarray]:
+        return {"centroids": self.centroids}
+
+
+# =============================================================================
+# Índice
+# =============================================================================
+
+class QuantizedVectorStore:
+    """
+    Índice de solo lectura sobre un directorio creado con `build()`.
+
+    Args:
+        directory: Directorio con meta.json, codes.bin, vectors.f32 y quantizer.npz
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        meta = json.loads((self.directory / _META_FILE).read_text())
+        self.dim: int = meta["dim"]
+        self.count: int = meta["count"]
+        self.quantization: str = meta["quantization"]
+        self.ids: list[str] = meta["ids"]
+        state = np.load(self.directory / _QUANTIZER_FILE)
+        if self.quantization == "int8":
+            self.quantizer = ScalarQuantizer(state["low"], state["step"])
+            code_dtype = np.int8
+        else:
+            self.quantizer = ProductQuantizer(state["centroids"])
+            code_dtype = np.uint8
+        self.codes = np.memmap(
+            self.directory / _CODES_FILE, dtype=code_dtype, mode="r",
+            shape=(self.count, self.quantizer.code_size)
+        )
+        self.vectors = np.memmap(
+            self.directory / _VECTORS_FILE, dtype=np.float32, mode="r", shape=(self.count, self.dim)
+        )
+
+    @classmethod
+    def build(
+        cls,
+        directory: str,
+        ids: Sequence[str],
+        vectors,
+        quantization: str = VECTOR_QUANTIZATION,
+        pq_subspaces: int = VECTOR_PQ_SUBSPACES
+    ) -> "QuantizedVectorStore":
+        """
+        Entrena el cuantizador, escribe los arrays y abre el índice.
+
+        Args:
+            ids: Identificador por vector (chunk de documento, clave de cache)
+            vectors: Matriz (n, dim) o lista de listas de floats
+            quantization: "int8" (escalar) o "pq" (product quantization)
+            pq_subspaces: Bytes por vector con PQ (debe dividir a dim)
+        """
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Cuantización no soportada: {quantization}")
+        normalized = normalize_rows(vectors)
+        if len(ids) != len(normalized):
+            raise ValueError(f"{len(ids)} ids para {len(normalized)} vectores")
+        if quantization == "int8":
+            quantizer = ScalarQuantizer.train(normalized)
+        else:
+            quantizer = ProductQuantizer.train(normalized, pq_subspaces)
+
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        normalized.tofile(path / _VECTORS_FILE)
+        with open(path / _CODES_FILE, "wb") as f:
+            for start in range(0, len(normalized), SCAN_BLOCK_ROWS):
+                quantizer.encode(normalized[start:start + SCAN_BLOCK_ROWS]).tofile(f)
+        np.savez(path / _QUANTIZER_FILE, **quantizer.state())
+        (path / _META_FILE).write_text(json.dumps({
+            "dim": normalized.shape[1],
+            "count": len(normalized),
+            "quantization": quantization,
+            "ids": [str(i) for i in ids],
+        }))
+        logger.info(
+            f"Vector store: {len(normalized)} vectores {quantization} "
+            f"({quantizer.code_size} bytes/vector) en {path}"
+        )
+        return cls(directory)
+
+    @property
+    def code_bytes(self) -> int:
+        """Bytes que recorre cada búsqueda (los códigos)."""
+        return self.codes.nbytes
+
+    def search(
+        self,
+        queries,
+        k: int = 10,
+        rescore_factor: int = VECTOR_RESCORE_FACTOR
+    ) -> list[list[tuple[str, float]]]:
+        """
+        Los `k` vecinos más cercanos (coseno) de cada consulta.
+
+        Args:
+            queries: Un vector o una matriz (consultas, dim)
+            rescore_factor: Candidatos aproximados por resultado que se
+                re-puntúan en float32 (0 = solo puntaje aproximado)
+
+        Returns:
+            Por consulta, [(id, coseno)] de mayor a menor
+        """
+        queries = normalize_rows(queries)
+        if queries.shape[1] != self.dim:
+            raise ValueError(f"Consulta de {queries.shape[1]} dimensiones; el índice tiene {self.dim}")
+        k = min(k, self.count)
+        candidates = min(self.count, max(k, k * rescore_factor))
+
+        # Fase 1: barrido aproximado por bloques, conservando los mejores de cada uno
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, self.count, SCAN_BLOCK_ROWS):
+            block = np.asarray(self.codes[start:start + SCAN_BLOCK_ROWS])
+            scores = np.concatenate([best_scores, self.quantizer.scores(queries, block)], axis=1)
+            rows = np.concatenate(
+                [best_rows, np.broadcast_to(np.arange(start, start + len(block)), (len(queries), len(block)))],
+                axis=1
+            )
+            keep = _top(scores, candidates)
+            best_scores = np.take_along_axis(scores, keep, axis=1)
+            best_rows = np.take_along_axis(rows, keep, axis=1)
+
+        results = []
+        for query, rows, approx in zip(queries, best_rows, best_scores):
+            if rescore_factor:
+                # Fase 2: coseno exacto solo para los candidatos (filas ordenadas: lectura secuencial)
+                rows = np.sort(rows)
+                scores = np.asarray(self.vectors[rows]) @ query
+            else:
+                scores = approx
+            order = np.argsort(-scores)[:k]
+            results.append([(self.ids[rows[i]], float(scores[i])) for i in order])
+        return results
+
+
+def _top(scores: np.ndarray, n: int) -> np.ndarray:
+    """Índices (sin orden) de los `n` mayores por fila."""
+    if scores.shape[1] <= n:
+        return np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    return np.argpartition(-scores, n - 1, axis=1)[:, :n]
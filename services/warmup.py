@@ -0,0 +1,50 @@
+"""
+Precalentamiento de dependencias pesadas después del arranque.
+
+`app.py` no importa pandas, plotly ni los clientes de servicios a nivel de
+módulo; cada servicio los importa en su primer uso. Para que la primera
+consulta no pague ese costo, `warm_up()` los importa en un thread una vez que
+Chainlit ya acepta conexiones.
+"""
+import asyncio
+import importlib
+import logging
+import os
+import time
+from typing import Sequence
+
+logger = logging.getLogger(__name__)
+
+# Módulos a precalentar (los que no estén instalados se omiten)
+WARMUP_MODULES = tuple(
+    m.strip() for m in os.getenv(
+        "WARMUP_MODULES", "numpy,pandas,plotly.graph_objects,plotly.io"
+    ).split(",") if m.strip()
+)
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+
+
+def _import_all(modules: Sequence[str]) -> dict[str, float]:
+    timings = {}
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            logger.info(f"Warm-up: {name} no instalado, omitido")
+            continue
+        timings[name] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+async def warm_up(modules: Sequence[str] = WARMUP_MODULES) -> dict[str, float]:
+    """
+    Importa `modules` en un thread y retorna los ms por módulo.
+
+    Los módulos ya importados cuestan ~0 ms, así que es seguro llamarlo más
+    de una vez.
+    """
+    timings = await asyncio.to_thread(_import_all, modules)
+    total = sum(timings.values())
+    logger.info(f"Warm-up: {len(timings)} módulos en {total:.0f}ms {timings}")
+    return timings
@@ -0,0 +1,148 @@
+"""
+Tests para services/answer_table.py - respuestas precalculadas.
+
+Verifica:
+- Materialización de todos los pares métrica × período
+- Lookup solo con explicación disponible; reintento de las faltantes
+- Versionado por hash de datos y workers acotados
+"""
+import asyncio
+
+import pytest
+
+from services.answer_table import AnswerTable, data_version
+
+VALUES = {
+    ("revenue", "Q4_2024"): 1_234_567,
+    ("revenue", "2024"): 4_364_567,
+    ("ebitda", "2024"): 1_539_567,
+}
+
+
+def make_fetch(values: dict):
+    async def fetch(metric: str, period: str):
+        value = values.get((metric, period))
+        if value is None:
+            return None
+        return {"metric": metric, "period": period, "value": value, "formatted": f"${value:,.2f}"}
+    return fetch
+
+
+def generate_sql(metric: str, period: str) -> str:
+    return f"SELECT {metric} FROM financial_metrics WHERE period = '{period}'"
+
+
+async def explain(metric: str, period: str, formatted: str) -> str:
+    return f"{metric} en {period} fue {formatted}"
+
+
+class TestAnswerTable:
+    """Tests de AnswerTable.build() y lookup()."""
+
+    @pytest.mark.asyncio
+    async def test_build_materializes_every_pair(self):
+        table = AnswerTable(workers=2)
+        pairs = list(VALUES) + [("opex", "2023")]  # sin datos: se omite
+        version = await table.build(pairs, make_fetch(VALUES), generate_sql, explain)
+
+        assert len(table) == 3
+        answer = table.lookup("revenue", "Q4_2024")
+        assert answer.formatted == "$1,234,567.00"
+        assert answer.sql.startswith("SELECT revenue")
+        assert "| Revenue | Q4 2024 | $1,234,567.00 |" in answer.table
+        assert answer.explanation == "revenue en Q4_2024 fue $1,234,567.00"
+        assert answer.data_version == version
+        assert answer.data["value"] == 1_234_567
+        assert table.lookup("opex", "2023") is None
+
+    @pytest.mark.asyncio
+    async def test_lookup_requires_explanation(self):
+        table = AnswerTable()
+        await table.build(VALUES, make_fetch(VALUES), generate_sql, explain=None)
+
+        assert len(table) == 3
+        assert table.lookup("revenue", "2024") is None
+        assert table.misses == 1
+
+    @pytest.mark.asyncio
+    async def test_unchanged_data_keeps_table(self):
+        calls = []
+
+        async def counting_explain(metric, period, formatted):
+            calls.append((metric, period))
+            return "ok"
+
+        table = AnswerTable()
+        first = await table.build(VALUES, make_fetch(VALUES), generate_sql, counting_explain)
+        second = await table.build(VALUES, make_fetch(VALUES), generate_sql, counting_explain)
+        assert first == second
+        assert len(calls) == 3
+
+        changed = {**VALUES, ("revenue", "2024"): 5_000_000}
+        third = await table.build(changed, make_fetch(changed), generate_sql, counting_explain)
+        assert third != first
+        assert len(calls) == 6
+        assert table.lookup("revenue", "2024").value == 5_000_000
+
+    @pytest.mark.asyncio
+    async def test_workers_bound_concurrency(self):
+        active = 0
+        peak = 0
+
+        async def slow_explain(metric, period, formatted):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return "ok"
+
+        table = AnswerTable(workers=2)
+        await table.build(VALUES, make_fetch(VALUES), generate_sql, slow_explain)
+        assert peak == 2
+
+    @pytest.mark.asyncio
+    async def test_failing_pair_is_skipped(self):
+        async def flaky_explain(metric, period, formatted):
+            if metric == "ebitda":
+                raise RuntimeError("LLM caído")
+            return "ok"
+
+        table = AnswerTable()
+        await table.build(VALUES, make_fetch(VALUES), generate_sql, flaky_explain)
+        assert len(table) == 2
+        assert table.lookup("ebitda", "2024") is None
+
+    @pytest.mark.asyncio
+    async def test_missing_explanations_are_retried(self):
+        calls = []
+        llm_up = False
+
+        async def flaky_explain(metric, period, formatted):
+            calls.append((metric, period))
+            if metric == "ebitda" and not llm_up:
+                raise RuntimeError("LLM caído")
+            return None if period == "Q4_2024" and not llm_up else "ok"
+
+        table = AnswerTable(retry_seconds=0)
+        first = await table.build(VALUES, make_fetch(VALUES), generate_sql, flaky_explain)
+        assert table.incomplete == 2 and table.needs_retry()
+        assert table.lookup("revenue", "Q4_2024") is None
+
+        # Reintento fallido: no pierde la respuesta sin explicación que ya había
+        await table.build(VALUES, make_fetch(VALUES), generate_sql, flaky_explain)
+        assert sorted(calls[3:]) == [("ebitda", "2024"), ("revenue", "Q4_2024")]
+        assert ("revenue", "Q4_2024") in table._answers
+
+        llm_up = True
+        second = await table.build(VALUES, make_fetch(VALUES), generate_sql, flaky_explain)
+        assert second == first
+        assert sorted(calls[5:]) == [("ebitda", "2024"), ("revenue", "Q4_2024")]
+        assert table.lookup("ebitda", "2024").explanation == "ok"
+        assert table.incomplete == 0 and not table.needs_retry()
+
+
+def test_data_version_is_order_independent():
+    a = {("revenue", "2024"): {"value": 1}, ("cogs", "2024"): {"value": 2}}
+    b = dict(reversed(list(a.items())))
+    assert data_version(a) == data_version(b)
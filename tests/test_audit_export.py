@@ -0,0 +1,90 @@
+"""
+Tests para services/audit_export.py - exportación PDF/JSON en background.
+
+Verifica:
+- Bundle JSON con todas las sesiones
+- Cache por hash de contenido
+- PDF válido (si reportlab está instalado)
+- Ejecución en el pool de procesos
+"""
+import copy
+import json
+
+import pytest
+
+from services.audit_export import AuditExporter, run_export_job
+from services.audit_store import AuditStore
+
+try:
+    import reportlab
+except ImportError:
+    reportlab = None
+
+
+@pytest.fixture
+def audit_dirs(tmp_path, sample_session_trace):
+    """Base SQLite con dos sesiones y directorios de trabajo."""
+    db_path = str(tmp_path / "audit.db")
+    store = AuditStore(db_path)
+    second = copy.deepcopy(sample_session_trace)
+    second["session_id"] = "test-session-87654321"
+    store.add_sessions([sample_session_trace, second])
+    store.close()
+    trail_dir = tmp_path / "trails"
+    trail_dir.mkdir()
+    return {
+        "db_path": db_path,
+        "trail_dir": str(trail_dir),
+        "export_dir": str(tmp_path / "exports"),
+    }
+
+
+SESSION_IDS = ["test-session-12345678", "test-session-87654321"]
+
+
+class TestRunExportJob:
+    """Tests del job de exportación (se ejecuta en el worker)."""
+
+    def test_json_bundle_contains_sessions(self, audit_dirs):
+        """El bundle JSON incluye todas las sesiones solicitadas."""
+        path = run_export_job(SESSION_IDS, "json", **audit_dirs)
+        with open(path, encoding="utf-8") as f:
+            bundle = json.load(f)
+        assert bundle["count"] == 2
+        assert {s["session_id"] for s in bundle["sessions"]} == set(SESSION_IDS)
+
+    def test_export_is_cached_by_content_hash(self, audit_dirs):
+        """Mismo contenido reutiliza el archivo; contenido distinto no."""
+        first = run_export_job(SESSION_IDS, "json", **audit_dirs)
+        again = run_export_job(SESSION_IDS, "json", **audit_dirs)
+        subset = run_export_job(SESSION_IDS[:1], "json", **audit_dirs)
+        assert first == again
+        assert subset != first
+
+    @pytest.mark.skipif(reportlab is None, reason="reportlab no instalado")
+    def test_pdf_is_valid(self, audit_dirs):
+        """El PDF generado es un archivo PDF no vacío."""
+        path = run_export_job(SESSION_IDS, "pdf", **audit_dirs)
+        with open(path, "rb") as f:
+            assert f.read(5) == b"%PDF-"
+
+
+class TestAuditExporter:
+    """Tests de la cola de exportación."""
+
+    @pytest.mark.asyncio
+    async def test_export_runs_in_process_pool(self, audit_dirs):
+        """export() retorna la ruta generada por el worker."""
+        exporter = AuditExporter(max_workers=1, **audit_dirs)
+        try:
+            path = await exporter.export(SESSION_IDS, "json")
+        finally:
+            exporter.shutdown()
+        assert path.exists()
+        assert path.suffix == ".json"
+
+    @pytest.mark.asyncio
+    async def test_rejects_unknown_format(self, audit_dirs):
+        exporter = AuditExporter(**audit_dirs)
+        with pytest.raises(ValueError):
+            await exporter.export(SESSION_IDS, "xlsx")
@@ -0,0 +1,107 @@
+"""
+Tests para services/audit_store.py - índice SQLite del audit trail.
+
+Verifica:
+- Inserción idempotente y recuperación por session_id
+- Filtros por usuario, métrica y fechas
+- Ingesta incremental de JSONL
+- Percentiles de latencia por etapa
+"""
+import copy
+import json
+
+import pytest
+
+from services.audit_store import AuditStore, main
+
+
+def _trace(base: dict, session_id: str, **changes) -> dict:
+    trace = copy.deepcopy(base)
+    trace["session_id"] = session_id
+    trace.update(changes)
+    return trace
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = AuditStore(str(tmp_path / "audit.db"))
+    yield store
+    store.close()
+
+
+class TestAuditStore:
+    """Tests de AuditStore."""
+
+    def test_insert_is_idempotent(self, store, sample_session_trace):
+        """Re-insertar la misma sesión no la duplica."""
+        assert store.add_sessions([sample_session_trace]) == 1
+        assert store.add_sessions([sample_session_trace]) == 0
+        assert store.get_session("test-session-12345678") == sample_session_trace
+
+    def test_find_sessions_by_user_metric_and_date(self, store, sample_session_trace):
+        """Filtra por usuario, métrica y rango de fechas."""
+        ebitda = {"route": "semantic", "metric": "ebitda", "period": "2024"}
+        store.add_sessions([
+            _trace(sample_session_trace, "a", classification=ebitda),
+            _trace(sample_session_trace, "b", classification=ebitda,
+                   timestamp="2025-12-01T00:00:00Z"),
+            _trace(sample_session_trace, "c", user_id="otro", classification=ebitda),
+            _trace(sample_session_trace, "d"),
+        ])
+
+        rows = store.find_sessions(
+            user_id="test-user@example.com", metric="ebitda", since="2026-01-01"
+        )
+        assert [r["session_id"] for r in rows] == ["a"]
+
+    def test_ingest_directory_is_incremental(self, store, tmp_path, sample_session_trace):
+        """Solo se leen las líneas nuevas de un JSONL ya ingerido."""
+        path = tmp_path / "audit_trail_20260120_000000_0001.jsonl"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(_trace(sample_session_trace, "a")) + "\n")
+            f.write(json.dumps(_trace(sample_session_trace, "b"))[:20])  # línea parcial
+        assert store.ingest_directory(str(tmp_path)) == 1
+
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(_trace(sample_session_trace, "a")) + "\n")
+            f.write(json.dumps(_trace(sample_session_trace, "b")) + "\n")
+        assert store.ingest_directory(str(tmp_path)) == 1
+        assert store.ingest_directory(str(tmp_path)) == 0
+
+    def test_stage_latency_percentiles(self, store, sample_session_trace):
+        """Calcula percentiles por ruta y etapa."""
+        traces = []
+        for i in range(10):
+            trace = _trace(sample_session_trace, f"s-{i}")
+            trace["steps"][0]["duration_ms"] = float(i + 1)
+            traces.append(trace)
+        store.add_sessions(traces)
+
+        df = store.stage_latency_percentiles()
+        row = df[(df["route"] == "semantic") & (df["step_name"] == "Clasificación")].iloc[0]
+        assert row["count"] == 10
+        assert row["p50_ms"] == pytest.approx(5.5)
+        assert {"p95_ms", "p99_ms", "mean_ms"} <= set(df.columns)
+
+
+    def test_stage_latency_percentiles_empty(self, store, sample_session_trace):
+        """Sin etapas en el rango: DataFrame vacío con las columnas documentadas."""
+        assert list(store.stage_latency_percentiles().columns) == [
+            "route", "step_name", "count", "mean_ms", "p50_ms", "p95_ms", "p99_ms"
+        ]
+        store.add_sessions([_trace(sample_session_trace, "s-1")])
+        assert store.stage_latency_percentiles(since="2999-01-01").empty
+
+
+class TestAuditStoreCli:
+    """Tests del CLI."""
+
+    def test_session_lookup(self, tmp_path, sample_session_trace, capsys):
+        db = str(tmp_path / "audit.db")
+        store = AuditStore(db)
+        store.add_sessions([sample_session_trace])
+        store.close()
+
+        assert main(["--db", db, "session", "test-session-12345678"]) == 0
+        assert json.loads(capsys.readouterr().out)["query"] == sample_session_trace["query"]
+        assert main(["--db", db, "session", "missing"]) == 1
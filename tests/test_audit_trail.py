@@ -0,0 +1,103 @@
+"""
+Tests para services/audit_trail.py - writer asíncrono de audit trail.
+
+Verifica:
+- Serialización de SessionTrace a JSONL
+- Escritura por lotes, flush explícito y drenado al cerrar
+- Rotación por tamaño
+- Descarte sin bloquear cuando la cola está llena
+"""
+import json
+
+import pytest
+
+from services.audit_trail import AuditWriter, SessionTrace, zstandard
+
+
+def _read_jsonl(directory) -> list[dict]:
+    records = []
+    for path in sorted(directory.glob("audit_trail_*.jsonl")):
+        with open(path, encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f)
+    return records
+
+
+class TestSessionTrace:
+    """Tests del modelo SessionTrace."""
+
+    def test_add_step_and_serialize(self):
+        """Los pasos agregados aparecen en el dict serializado."""
+        trace = SessionTrace(session_id="s-1", user_id="u", query="revenue Q4 2024")
+        trace.add_step("Clasificación", "tool", "revenue Q4 2024", "semantic", 1.5)
+        data = trace.to_dict()
+        assert data["steps"][0]["step_name"] == "Clasificación"
+        assert data["steps"][0]["duration_ms"] == 1.5
+        json.dumps(data)
+
+
+class TestAuditWriter:
+    """Tests de AuditWriter."""
+
+    @pytest.mark.asyncio
+    async def test_records_are_flushed_on_close(self, tmp_path):
+        """close() drena la cola y escribe todas las trazas."""
+        writer = AuditWriter(directory=str(tmp_path), flush_interval=10, fsync_interval=0)
+        for i in range(5):
+            assert writer.record(SessionTrace(session_id=f"s-{i}", user_id="u", query="q"))
+        await writer.close()
+
+        records = _read_jsonl(tmp_path)
+        assert [r["session_id"] for r in records] == [f"s-{i}" for i in range(5)]
+        assert writer.written == 5
+
+    @pytest.mark.asyncio
+    async def test_flush_writes_pending_records(self, tmp_path):
+        """flush() retorna cuando lo encolado ya está en disco."""
+        writer = AuditWriter(directory=str(tmp_path), flush_interval=10)
+        writer.record({"session_id": "s-flush"})
+        await writer.flush()
+        assert [r["session_id"] for r in _read_jsonl(tmp_path)] == ["s-flush"]
+        await writer.close()
+
+    @pytest.mark.asyncio
+    async def test_accepts_plain_dicts(self, tmp_path, sample_session_trace):
+        """Trazas como dict (formato del fixture) se escriben tal cual."""
+        writer = AuditWriter(directory=str(tmp_path))
+        writer.record(sample_session_trace)
+        await writer.close()
+
+        records = _read_jsonl(tmp_path)
+        assert records == [sample_session_trace]
+
+    @pytest.mark.asyncio
+    async def test_rotates_by_size(self, tmp_path):
+        """Al exceder el tamaño máximo se abre un archivo nuevo."""
+        writer = AuditWriter(directory=str(tmp_path), max_file_mb=0.0005, flush_interval=0)
+        for i in range(20):
+            writer.record({"session_id": f"s-{i}", "padding": "x" * 100})
+        await writer.close()
+
+        files = list(tmp_path.glob("audit_trail_*.jsonl"))
+        assert len(files) > 1
+        assert len(_read_jsonl(tmp_path)) == 20
+
+    @pytest.mark.asyncio
+    async def test_full_queue_drops_without_blocking(self, tmp_path):
+        """Con la cola llena record() retorna False en lugar de esperar."""
+        writer = AuditWriter(directory=str(tmp_path), max_queue=2)
+        results = [writer.record({"n": i}) for i in range(5)]
+        assert results.count(False) == writer.dropped == 3
+        await writer.close()
+
+    @pytest.mark.asyncio
+    @pytest.mark.skipif(zstandard is None, reason="zstandard no instalado")
+    async def test_zstd_compression(self, tmp_path):
+        """Con compresión zstd los archivos son .jsonl.zst legibles."""
+        writer = AuditWriter(directory=str(tmp_path), compression="zstd")
+        writer.record({"session_id": "s-zst"})
+        await writer.close()
+
+        (path,) = tmp_path.glob("*.jsonl.zst")
+        with open(path, "rb") as f:
+            raw = zstandard.ZstdDecompressor().stream_reader(f).read()
+        assert json.loads(raw) == {"session_id": "s-zst"}
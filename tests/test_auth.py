@@ -0,0 +1,185 @@
+"""
+Tests para services/auth.py - credenciales con hash y verificación async.
+
+Verifica:
+- Hash/verificación scrypt
+- Carga desde archivo y fallback a variables de entorno
+- Cache de verificaciones (hit sin KDF, invalidación al cambiar el hash)
+- La KDF no bloquea el event loop
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from services import auth
+from services.auth import CredentialStore, hash_password, main, verify_password
+
+# Parámetros baratos para que los tests sean rápidos
+FAST = {"n": 2 ** 10, "r": 8, "p": 1}
+
+
+def write_users(path, users):
+    path.write_text(json.dumps({"users": users}), encoding="utf-8")
+
+
+def test_hash_roundtrip():
+    encoded = hash_password("sdrag2025", **FAST)
+    assert encoded.startswith("scrypt$1024$8$1$")
+    assert verify_password("sdrag2025", encoded)
+    assert not verify_password("otro", encoded)
+    assert hash_password("sdrag2025", **FAST) != encoded  # salt aleatorio
+
+
+def test_verify_rejects_malformed_hash():
+    assert not verify_password("x", "plaintext")
+    assert not verify_password("x", "bcrypt$1$2$3$4$5")
+    salt = hash_password("x", **FAST).split("$")[4]
+    assert not verify_password("x", f"scrypt$1024$8$1${salt}$no-es-base64!")
+
+
+def test_cli_add_writes_hashed_user(tmp_path, monkeypatch):
+    path = tmp_path / "credentials.json"
+    monkeypatch.setattr(auth.getpass, "getpass", lambda prompt: "secreto")
+    assert main(["add", "ana", "--role", "analyst", "--file", str(path)]) == 0
+
+    user = json.loads(path.read_text())["users"]["ana"]
+    assert user["role"] == "analyst"
+    assert verify_password("secreto", user["hash"])
+    assert "secreto" not in path.read_text()
+
+
+class TestCredentialStore:
+    """Tests de CredentialStore."""
+
+    @pytest.mark.asyncio
+    async def test_file_users(self, tmp_path):
+        path = tmp_path / "credentials.json"
+        write_users(path, {"hector": {"hash": hash_password("sdrag2025", **FAST), "role": "admin"}})
+        store = CredentialStore(str(path))
+
+        assert await store.verify("hector", "sdrag2025") == {"role": "admin"}
+        assert await store.verify("hector", "mal") is None
+        assert await store.verify("nadie", "sdrag2025") is None
+        store.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_env_fallback(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("CHAINLIT_USER", "ana")
+        monkeypatch.setenv("CHAINLIT_PASSWORD_HASH", hash_password("clave", **FAST))
+        store = CredentialStore(str(tmp_path / "missing.json"))
+
+        assert await store.verify("ana", "clave") == {"role": "admin"}
+        assert await store.verify("hector", "clave") is None
+        store.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_env_and_dummy_hashes_run_off_the_loop(self, tmp_path, monkeypatch):
+        threads = []
+        real_hash = auth.hash_password
+
+        def recording_hash(password, **kwargs):
+            threads.append(threading.current_thread().name)
+            return real_hash(password, **FAST)
+
+        monkeypatch.setattr(auth, "hash_password", recording_hash)
+        monkeypatch.setenv("CHAINLIT_PASSWORD_HASH", "")
+        monkeypatch.setenv("CHAINLIT_PASSWORD", "clave")
+        monkeypatch.setenv("CHAINLIT_USER", "ana")
+        store = CredentialStore(str(tmp_path / "missing.json"))
+
+        assert await store.verify("ana", "clave") == {"role": "admin"}
+        assert await store.verify("nadie", "clave") is None
+        assert len(threads) == 2 and all(name.startswith("auth") for name in threads)
+        store.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_empty_env_refuses_login(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("CHAINLIT_USER", "hector")
+        monkeypatch.setenv("CHAINLIT_PASSWORD_HASH", "")
+        monkeypatch.setenv("CHAINLIT_PASSWORD", "")
+        store = CredentialStore(str(tmp_path / "missing.json"))
+
+        assert store.users() == {}
+        assert await store.verify("hector", "") is None
+        assert await store.verify("hector", "sdrag2025") is None
+        store.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_empty_password_rejected(self, tmp_path):
+        path = tmp_path / "credentials.json"
+        write_users(path, {"hector": {"hash": hash_password("", **FAST)}})
+        store = CredentialStore(str(path))
+
+        assert await store.verify("hector", "") is None
+        store.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_cache_hit_skips_kdf(self, tmp_path, monkeypatch):
+        path = tmp_path / "credentials.json"
+        write_users(path, {"hector": {"hash": hash_password("sdrag2025", **FAST)}})
+        store = CredentialStore(str(path))
+        calls = 0
+        real_verify = auth.verify_password
+
+        def counting_verify(password, encoded):
+            nonlocal calls
+            calls += 1
+            return real_verify(password, encoded)
+
+        monkeypatch.setattr(auth, "verify_password", counting_verify)
+        assert await store.verify("hector", "sdrag2025") is not None
+        assert await store.verify("hector", "sdrag2025") is not None
+        assert calls == 1
+
+        # Los fallos no se cachean
+        await store.verify("hector", "mal")
+        await store.verify("hector", "mal")
+        assert calls == 3
+        store.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_hash_change_invalidates_cache(self, tmp_path):
+        path = tmp_path / "credentials.json"
+        write_users(path, {"hector": {"hash": hash_password("vieja", **FAST)}})
+        store = CredentialStore(str(path))
+        assert await store.verify("hector", "vieja") is not None
+
+        write_users(path, {"hector": {"hash": hash_password("nueva", **FAST)}})
+        os.utime(path, (time.time() + 5, time.time() + 5))
+        assert await store.verify("hector", "vieja") is None
+        assert await store.verify("hector", "nueva") is not None
+        store.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_cache_ttl_expires(self, tmp_path):
+        path = tmp_path / "credentials.json"
+        write_users(path, {"hector": {"hash": hash_password("sdrag2025", **FAST)}})
+        store = CredentialStore(str(path), cache_ttl=0)
+        await store.verify("hector", "sdrag2025")
+        assert all(expires <= time.monotonic() for expires, _ in store._cache.values())
+        store.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_concurrent_logins_do_not_block_loop(self, tmp_path):
+        path = tmp_path / "credentials.json"
+        write_users(path, {"hector": {"hash": hash_password("sdrag2025")}})
+        store = CredentialStore(str(path), workers=2)
+        ticks = 0
+
+        async def heartbeat():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.001)
+
+        beat = asyncio.create_task(heartbeat())
+        results = await asyncio.gather(*(store.verify("hector", f"intento-{i}") for i in range(4)))
+        beat.cancel()
+
+        assert results == [None] * 4
+        assert ticks > 4
+        store.shutdown()
@@ -0,0 +1,174 @@
+"""
+Tests para services/batch_api.py - API HTTP por lotes.
+
+Verifica:
+- Validación del cuerpo y negociación del formato
+- Autenticación Basic, Bearer y cookie de sesión
+- Ejecución concurrente acotada, errores aislados por consulta
+- Streaming NDJSON (y Arrow IPC si pyarrow está instalado) vía FastAPI
+"""
+import asyncio
+import base64
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from services.batch_api import (
+    BatchAPI, BatchItem, BatchRequestError, negotiate_format, parse_batch
+)
+
+try:
+    import pyarrow
+except ImportError:  # Dependencia opcional
+    pyarrow = None
+
+
+async def verify_password(username: str, password: str):
+    return {"role": "analyst"} if (username, password) == ("ana", "secreta") else None
+
+
+def verify_token(token: str) -> str:
+    if token != "jwt-bob":
+        raise ValueError("firma inválida")
+    return "bob"
+
+
+def basic(username: str, password: str) -> dict:
+    return {"Authorization": "Basic " + base64.b64encode(f"{username}:{password}".encode()).decode()}
+
+
+async def echo(item: BatchItem, explain: bool, user_id: str) -> dict:
+    if item.metric == "boom":
+        raise ValueError("sin datos")
+    return {"metric": item.metric or "revenue", "value": 1.0, "explanation": "texto" if explain else None}
+
+
+def client(answer=echo) -> TestClient:
+    app = FastAPI()
+    BatchAPI(answer, verify_password, verify_token).mount(app, cookie_token=lambda c: c.get("access_token"))
+    return TestClient(app)
+
+
+def test_parse_batch():
+    items, explain, fmt = parse_batch({
+        "queries": ["revenue Q4 2024", {"query": "cogs"}, {"metric": "ebitda", "period": "2023", "derived": "yoy"}]
+    })
+    assert [i.query for i in items] == ["revenue Q4 2024", "cogs", None]
+    assert items[2] == BatchItem(2, metric="ebitda", period="2023", derived="yoy")
+    assert (explain, fmt) == (False, None)
+
+    for body in ({}, {"queries": []}, {"queries": [1]}, {"queries": [{"metric": "revenue"}]},
+                 {"queries": ["x"], "explain": "yes"}, {"queries": ["x"], "format": "csv"}):
+        with pytest.raises(BatchRequestError):
+            parse_batch(body)
+    with pytest.raises(BatchRequestError):
+        parse_batch({"queries": ["x"] * 3}, max_queries=2)
+
+
+def test_negotiate_format():
+    assert negotiate_format(None, None) == "ndjson"
+    assert negotiate_format("ndjson", "application/vnd.apache.arrow.stream") == "ndjson"
+    if pyarrow is None:
+        with pytest.raises(BatchRequestError) as error:
+            negotiate_format("arrow", None)
+        assert error.value.status_code == 406
+    else:
+        assert negotiate_format(None, "application/vnd.apache.arrow.stream") == "arrow"
+
+
+class TestBatchAPI:
+    """Tests de BatchAPI."""
+
+    @pytest.mark.asyncio
+    async def test_authenticate(self):
+        api = BatchAPI(echo, verify_password, verify_token)
+        assert await api.authenticate(basic("ana", "secreta")["Authorization"]) == "ana"
+        assert await api.authenticate(basic("ana", "otra")["Authorization"]) is None
+        assert await api.authenticate("Basic no-es-base64!") is None
+        assert await api.authenticate("Bearer jwt-bob") == "bob"
+        assert await api.authenticate("Bearer falso") is None
+        assert await api.authenticate(None, cookie_token="jwt-bob") == "bob"
+        assert await api.authenticate(None) is None
+
+    @pytest.mark.asyncio
+    async def test_run_bounds_concurrency_and_isolates_errors(self):
+        in_flight = peak = 0
+
+        async def slow(item: BatchItem, explain: bool, user_id: str) -> dict:
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01 * (5 - item.index % 5))
+            in_flight -= 1
+            return await echo(item, explain, user_id)
+
+        api = BatchAPI(slow, concurrency=3)
+        items = [BatchItem(i, metric="boom" if i == 4 else "revenue", period="2024") for i in range(10)]
+        rows = [row async for row in api.run(items, False, "ana")]
+
+        assert peak == 3
+        assert sorted(row["index"] for row in rows) == list(range(10))
+        assert [row["index"] for row in rows] != list(range(10))  # orden de terminación
+        failed = [row for row in rows if row["error"]]
+        assert [row["index"] for row in failed] == [4] and "sin datos" in failed[0]["error"]
+        assert api.snapshot() == {"batches": 1, "queries": 10, "errors": 1}
+
+    @pytest.mark.asyncio
+    async def test_closing_stream_cancels_pending(self):
+        cancelled = 0
+
+        async def hang(item: BatchItem, explain: bool, user_id: str) -> dict:
+            nonlocal cancelled
+            if item.index == 0:
+                return {}
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled += 1
+                raise
+            return {}
+
+        rows = BatchAPI(hang, concurrency=4).run([BatchItem(i, query="q") for i in range(4)], False, "ana")
+        assert (await anext(rows))["index"] == 0
+        await rows.aclose()
+        await asyncio.sleep(0)
+        assert cancelled == 3
+
+
+class TestBatchEndpoint:
+    """Tests del endpoint montado en una app FastAPI."""
+
+    def test_requires_authentication(self):
+        response = client().post("/api/batch", json={"queries": ["revenue"]})
+        assert response.status_code == 401
+        assert "Basic" in response.headers["www-authenticate"]
+
+    def test_streams_ndjson(self):
+        response = client().post(
+            "/api/batch", headers=basic("ana", "secreta"),
+            json={"queries": ["revenue Q4", {"metric": "boom", "period": "2024"}], "explain": True}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        rows = {row["index"]: row for row in map(json.loads, response.text.splitlines())}
+        assert rows[0]["query"] == "revenue Q4" and rows[0]["explanation"] == "texto"
+        assert rows[1]["error"] == "ValueError: sin datos" and rows[1]["value"] is None
+
+    def test_session_cookie_and_bad_body(self):
+        test_client = client()
+        test_client.cookies.set("access_token", "jwt-bob")
+        response = test_client.post("/api/batch", content=b"no json")
+        assert response.status_code == 400
+        assert test_client.post("/api/batch", json={"queries": []}).status_code == 400
+
+    @pytest.mark.skipif(pyarrow is None, reason="pyarrow no instalado")
+    def test_streams_arrow_ipc(self):
+        response = client().post(
+            "/api/batch", headers=basic("ana", "secreta"),
+            json={"queries": [f"q{i}" for i in range(100)], "format": "arrow"}
+        )
+        table = pyarrow.ipc.open_stream(response.content).read_all()
+        assert table.num_rows == 100
+        assert sorted(table.column("index").to_pylist()) == list(range(100))
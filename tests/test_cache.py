@@ -0,0 +1,294 @@
+"""
+Tests para services/cache.py - cache local + compartido.
+
+Verifica:
+- LRU local con TTL y serialización
+- Nivel compartido SQLite (WAL) entre dos "réplicas"
+- Protocolo Redis contra un servidor RESP local de prueba
+- Protección contra estampidas en get_or_set()
+"""
+import asyncio
+import time
+
+import pytest
+
+from services.cache import (
+    REDIS_DELETE_IF_SCRIPT,
+    CacheBackend,
+    MemoryBackend,
+    RedisBackend,
+    SQLiteBackend,
+    TieredCache,
+    create_shared_backend,
+    dumps,
+    loads,
+)
+
+
+class RespStandIn:
+    """Servidor mínimo con protocolo Redis (GET/SET PX NX/DEL/SELECT) en memoria."""
+
+    def __init__(self):
+        self.data: dict[bytes, tuple[float, bytes]] = {}
+        self.server = None
+        self.port = None
+        self.delay = 0.0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _read_command(self, reader):
+        header = await reader.readline()
+        if not header:
+            return None
+        args = []
+        for _ in range(int(header[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        self.data.pop(key, None)
+        return None
+
+    async def _handle(self, reader, writer):
+        while (args := await self._read_command(reader)) is not None:
+            cmd = args[0].upper()
+            await asyncio.sleep(self.delay)
+            if cmd == b"GET":
+                value = self._live(args[1])
+                writer.write(b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value))
+            elif cmd == b"SET":
+                options = [a.upper() for a in args[3:]]
+                ttl = int(args[4]) / 1000 if b"PX" in options else 3600
+                if b"NX" in options and self._live(args[1]) is not None:
+                    writer.write(b"$-1\r\n")
+                else:
+                    self.data[args[1]] = (time.monotonic() + ttl, args[2])
+                    writer.write(b"+OK\r\n")
+            elif cmd == b"EVAL" and args[1] == REDIS_DELETE_IF_SCRIPT.encode():
+                owned = self._live(args[3]) == args[4]
+                if owned:
+                    del self.data[args[3]]
+                writer.write(b":%d\r\n" % int(owned))
+            elif cmd == b"DEL":
+                writer.write(b":%d\r\n" % int(self.data.pop(args[1], None) is not None))
+            elif cmd == b"SELECT":
+                writer.write(b"+OK\r\n")
+            else:
+                writer.write(b"-ERR unknown command\r\n")
+            await writer.drain()
+        writer.close()
+
+
+def test_serialization_roundtrip():
+    value = {"metric": "revenue", "values": [1.5, 2], "label": "Q4 2024"}
+    assert loads(dumps(value)) == value
+
+
+def test_backend_interface_is_abstract():
+    with pytest.raises(TypeError):
+        CacheBackend()
+
+
+def test_create_shared_backend(tmp_path):
+    assert create_shared_backend("") is None
+    assert isinstance(create_shared_backend(f"sqlite:///{tmp_path}/c.db"), SQLiteBackend)
+    backend = create_shared_backend("redis://cache-host:6380/2")
+    assert (backend.host, backend.port, backend.db) == ("cache-host", 6380, 2)
+    with pytest.raises(ValueError):
+        create_shared_backend("memcached://x")
+
+
+class TestMemoryBackend:
+    @pytest.mark.asyncio
+    async def test_lru_and_ttl(self):
+        backend = MemoryBackend(max_entries=2)
+        await backend.set("a", b"1", 60)
+        await backend.set("b", b"2", 60)
+        await backend.get("a")
+        await backend.set("c", b"3", 60)
+        assert await backend.get("b") is None
+        assert await backend.get("a") == b"1"
+
+        await backend.set("short", b"x", 0)
+        assert await backend.get("short") is None
+        assert await backend.add("a", b"9", 60) is False
+
+
+class TestTieredCache:
+    """Tests de TieredCache con nivel compartido."""
+
+    @pytest.mark.asyncio
+    async def test_replicas_share_sqlite_tier(self, tmp_path):
+        path = str(tmp_path / "cache.db")
+        replica_a = TieredCache(SQLiteBackend(path))
+        replica_b = TieredCache(SQLiteBackend(path))
+
+        await replica_a.set("explanation:revenue:Q4_2024", {"text": "Creció 12%"})
+        assert await replica_b.get("explanation:revenue:Q4_2024") == {"text": "Creció 12%"}
+        assert replica_b.shared_hits == 1
+        # Segunda lectura desde el LRU local
+        await replica_b.get("explanation:revenue:Q4_2024")
+        assert replica_b.local_hits == 1
+
+        await replica_a.delete("explanation:revenue:Q4_2024")
+        replica_b.local = MemoryBackend()
+        assert await replica_b.get("explanation:revenue:Q4_2024") is None
+        await replica_a.close()
+        await replica_b.close()
+
+    @pytest.mark.asyncio
+    async def test_shared_ttl_expires(self, tmp_path):
+        cache = TieredCache(SQLiteBackend(str(tmp_path / "cache.db")), local_ttl=0)
+        await cache.set("k", "v", ttl=0.01)
+        await asyncio.sleep(0.02)
+        assert await cache.get("k") is None
+        await cache.close()
+
+    @pytest.mark.asyncio
+    async def test_redis_protocol_tier(self):
+        server = RespStandIn()
+        await server.start()
+        backend = RedisBackend("127.0.0.1", server.port, db=1)
+        replica_a = TieredCache(backend)
+        replica_b = TieredCache(RedisBackend("127.0.0.1", server.port))
+
+        await replica_a.set("classification:revenue q4", {"route": "semantic"})
+        assert await replica_b.get("classification:revenue q4") == {"route": "semantic"}
+        assert await backend.add("sdrag:lock:x", b"1", 10) is True
+        assert await backend.add("sdrag:lock:x", b"1", 10) is False
+        assert await backend.delete_if("sdrag:lock:x", b"otro") is False
+        assert await backend.delete_if("sdrag:lock:x", b"1") is True
+        assert await backend.get("sdrag:lock:x") is None
+
+        await replica_a.close()
+        await replica_b.close()
+        await server.stop()
+
+    @pytest.mark.asyncio
+    async def test_cancelled_command_does_not_leak_reply(self):
+        server = RespStandIn()
+        await server.start()
+        backend = RedisBackend("127.0.0.1", server.port)
+        await backend.set("a", b"valor-a", 10)
+        await backend.set("b", b"valor-b", 10)
+
+        server.delay = 0.05
+        task = asyncio.create_task(backend.get("a"))
+        await asyncio.sleep(0.01)  # GET a escrito, respuesta pendiente
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        server.delay = 0.0
+        await asyncio.sleep(0.06)  # la respuesta de "a" ya llegó al socket viejo
+
+        assert await backend.get("b") == b"valor-b"
+        await backend.close()
+        await server.stop()
+
+    @pytest.mark.asyncio
+    async def test_stampede_single_load_across_replicas(self, tmp_path):
+        path = str(tmp_path / "cache.db")
+        replicas = [TieredCache(SQLiteBackend(path), poll_interval=0.01) for _ in range(2)]
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return "explicación costosa"
+
+        results = await asyncio.gather(*(
+            replica.get_or_set("explanation:ebitda:2024", loader)
+            for replica in replicas for _ in range(5)
+        ))
+        assert calls == 1
+        assert set(results) == {"explicación costosa"}
+        for replica in replicas:
+            await replica.close()
+
+    @pytest.mark.asyncio
+    async def test_waiters_stop_when_lock_released_without_value(self):
+        shared = MemoryBackend()
+        holder = TieredCache(shared, lock_timeout=3, poll_interval=0.01)
+        waiter = TieredCache(shared, lock_timeout=3, poll_interval=0.01)
+
+        async def uncacheable():
+            await asyncio.sleep(0.05)
+            return None
+
+        async def compute():
+            return "valor"
+
+        start = time.monotonic()
+        first = asyncio.create_task(holder.get_or_set("k", uncacheable))
+        await asyncio.sleep(0.01)
+        assert await waiter.get_or_set("k", compute) == "valor"
+        assert time.monotonic() - start < 1
+        assert await first is None
+
+    @pytest.mark.asyncio
+    async def test_expired_holder_does_not_release_new_lock(self):
+        shared = MemoryBackend()
+        cache = TieredCache(shared, lock_timeout=0.02)
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            # El lock expiró y otra réplica lo tomó
+            assert await shared.add("sdrag:lock:k", b"otra-replica", 10)
+            return 1
+
+        await cache.get_or_set("k", slow)
+        assert await shared.get("sdrag:lock:k") == b"otra-replica"
+
+    @pytest.mark.asyncio
+    async def test_unacquired_lock_is_not_released(self):
+        class Down(MemoryBackend):
+            releases = 0
+
+            async def add(self, key, value, ttl):
+                raise ConnectionError("caído")
+
+            async def delete_if(self, key, value):
+                Down.releases += 1
+                return False
+
+        async def loader():
+            return 1
+
+        assert await TieredCache(Down()).get_or_set("k", loader) == 1
+        assert Down.releases == 0
+
+    @pytest.mark.asyncio
+    async def test_none_is_not_cached(self):
+        cache = TieredCache()
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            return None
+
+        await cache.get_or_set("k", loader)
+        await cache.get_or_set("k", loader)
+        assert calls == 2
+
+    @pytest.mark.asyncio
+    async def test_shared_tier_failure_degrades_to_local(self):
+        cache = TieredCache(RedisBackend("127.0.0.1", 1, timeout=0.2))
+
+        async def loader():
+            return 42
+
+        assert await cache.get_or_set("k", loader) == 42
+        assert await cache.get("k") == 42
+        assert cache.local_hits == 1
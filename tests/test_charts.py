@@ -0,0 +1,87 @@
+"""
+Tests para services/charts.py - gráficas Plotly cacheadas.
+
+Verifica:
+- Selección de tipo de gráfico por métrica
+- Downsampling LTTB
+- Cache por (métrica, rango, versión de datos)
+"""
+import json
+import math
+
+import pytest
+
+from services.charts import ChartService, chart_type_for, lttb
+
+
+class TestChartType:
+    """Tests de chart_type_for()."""
+
+    def test_types_by_metric(self):
+        assert chart_type_for("revenue") == "line"
+        assert chart_type_for("opex") == "bar"
+        assert chart_type_for("gross_margin") == "gauge"
+        assert chart_type_for("unknown_metric") == "line"
+
+
+class TestLttb:
+    """Tests de lttb()."""
+
+    def test_reduces_to_threshold_keeping_endpoints(self):
+        values = [math.sin(i / 50) for i in range(10_000)]
+        keep = lttb(values, 200)
+        assert len(keep) == 200
+        assert keep[0] == 0 and keep[-1] == 9_999
+        assert keep == sorted(keep)
+
+    def test_preserves_spike(self):
+        """Un pico aislado sobrevive al downsampling."""
+        values = [0.0] * 1_000
+        values[537] = 100.0
+        assert 537 in lttb(values, 50)
+
+    def test_short_series_untouched(self):
+        assert lttb([1.0, 2.0, 3.0], 10) == [0, 1, 2]
+
+
+class TestChartService:
+    """Tests de ChartService."""
+
+    @pytest.fixture
+    def revenue_series(self):
+        return [("Q1 2024", 980_000), ("Q2 2024", 1_050_000),
+                ("Q3 2024", 1_100_000), ("Q4 2024", 1_234_567)]
+
+    def test_figure_json_is_cached(self, revenue_series):
+        service = ChartService()
+        first = service.figure_json("revenue", revenue_series, "v1")
+        second = service.figure_json("revenue", revenue_series, "v1")
+        assert first is second
+        assert (service.hits, service.misses) == (1, 1)
+        assert json.loads(first)["data"][0]["type"] == "scatter"
+
+    def test_new_data_version_rebuilds(self, revenue_series):
+        service = ChartService()
+        service.figure_json("revenue", revenue_series, "v1")
+        service.figure_json("revenue", revenue_series, "v2")
+        assert service.misses == 2
+
+    def test_long_series_is_downsampled(self):
+        service = ChartService(max_points=100)
+        series = [(str(i), float(i % 37)) for i in range(5_000)]
+        figure = json.loads(service.figure_json("revenue", series, "v1"))
+        assert len(figure["data"][0]["y"]) == 100
+
+    def test_lru_eviction(self, revenue_series):
+        service = ChartService(cache_size=1)
+        service.figure_json("revenue", revenue_series, "v1")
+        service.figure_json("opex", revenue_series, "v1")
+        service.figure_json("revenue", revenue_series, "v1")
+        assert service.misses == 3
+
+    @pytest.mark.asyncio
+    async def test_element_carries_cached_json(self, revenue_series):
+        service = ChartService()
+        element = await service.element("revenue", revenue_series, "v1")
+        assert element.type == "plotly"
+        assert element.content == service.figure_json("revenue", revenue_series, "v1")
@@ -0,0 +1,132 @@
+"""
+Tests para services/conversation.py - memoria de conversación por sesión.
+
+Verifica:
+- Herencia de métrica/período en seguimientos
+- Recorte del historial por presupuesto de tokens
+- Ring buffer acotado y vaciado de sesiones inactivas
+"""
+from services.conversation import ConversationMemory, estimate_tokens, evict_idle, is_followup
+
+PERIODS = ["Q1_2024", "Q2_2024", "Q3_2024", "Q4_2024", "2024", "2023"]
+
+
+def classification(metric=None, period="2024", period_explicit=True, derived=None) -> dict:
+    return {
+        "route": "semantic" if metric else "documental",
+        "route_target": "Cube Core" if metric else "Weaviate",
+        "metric": metric,
+        "period": period,
+        "period_explicit": period_explicit,
+        "is_financial": metric is not None,
+        "derived": derived,
+    }
+
+
+class TestResolve:
+    """Tests de ConversationMemory.resolve()."""
+
+    def test_bare_quarter_inherits_metric_and_year(self):
+        memory = ConversationMemory()
+        memory.add_turn("revenue Q4 2024", "...", classification("revenue", "Q4_2024"))
+
+        result = memory.resolve(classification(period_explicit=False), "¿y en Q3?")
+        assert result["metric"] == "revenue"
+        assert result["period"] == "Q3_2024"
+        assert result["is_financial"] is True
+        assert result["route_target"] == "Cube Core"
+        assert result["inherited"] == ["year", "metric"]
+
+    def test_metric_without_period_inherits_period(self):
+        memory = ConversationMemory()
+        memory.add_turn("revenue Q2 2024", "...", classification("revenue", "Q2_2024"))
+
+        result = memory.resolve(classification("ebitda", period_explicit=False), "¿y el EBITDA?")
+        assert result["metric"] == "ebitda"
+        assert result["period"] == "Q2_2024"
+        assert result["inherited"] == ["period"]
+
+    def test_general_question_is_not_hijacked(self):
+        memory = ConversationMemory()
+        memory.add_turn("revenue Q4 2024", "...", classification("revenue", "Q4_2024"))
+
+        result = memory.resolve(classification(period_explicit=False), "¿qué es el EBITDA ajustado?")
+        assert result["is_financial"] is False
+        assert result["inherited"] == []
+
+    def test_bare_quarter_without_data_asks_for_period(self):
+        memory = ConversationMemory(periods=PERIODS)
+        memory.add_turn("ebitda 2023", "...", classification("ebitda", "2023"))
+
+        result = memory.resolve(classification(period_explicit=False), "¿y en Q3?")
+        assert result["needs_period"] == "Q3_2023"
+        assert result["is_financial"] is False
+        assert result["inherited"] == []
+
+    def test_derived_keyword_alone_does_not_inherit_metric(self):
+        memory = ConversationMemory(periods=PERIODS)
+        memory.add_turn("ebitda Q4 2024", "...", classification("ebitda", "Q4_2024"))
+
+        result = memory.resolve(
+            classification(period_explicit=False, derived="growth"), "¿cómo cambió la política de viajes?"
+        )
+        assert result["is_financial"] is False
+        assert result["inherited"] == []
+        # Con señal de seguimiento sí se hereda
+        result = memory.resolve(classification(period_explicit=False, derived="yoy"), "¿y el yoy?")
+        assert result["metric"] == "ebitda"
+
+    def test_is_followup(self):
+        assert is_followup("¿y en Q3?")
+        assert is_followup("Y el margen")
+        assert is_followup("Q3 2023")
+        assert is_followup("¿para el tercer trimestre de 2023?")
+        assert not is_followup("¿cómo cambió la política de viajes en 2024?")
+        assert not is_followup("")
+
+    def test_no_history_leaves_classification(self):
+        result = ConversationMemory().resolve(classification(period_explicit=False), "¿y en Q3?")
+        assert result["metric"] is None
+
+
+class TestContext:
+    def test_estimate_tokens(self):
+        assert estimate_tokens("") == 0
+        assert estimate_tokens("abcd" * 10) == 10
+
+    def test_context_trimmed_to_budget_newest_first(self):
+        memory = ConversationMemory()
+        for i in range(5):
+            memory.add_turn(f"pregunta {i}", "x" * 40)
+        messages = memory.context_messages(budget_tokens=30)
+
+        assert [m["content"] for m in messages if m["role"] == "user"] == ["pregunta 3", "pregunta 4"]
+        assert messages[0]["role"] == "user"
+        assert messages[-1]["role"] == "assistant"
+
+    def test_ring_buffer_is_bounded(self):
+        memory = ConversationMemory(max_turns=3)
+        for i in range(10):
+            memory.add_turn(f"q{i}", f"a{i}")
+        assert [user for user, _ in memory.turns] == ["q7", "q8", "q9"]
+
+
+class TestIdle:
+    def test_touch_clears_idle_session(self):
+        memory = ConversationMemory(idle_seconds=0)
+        memory.add_turn("revenue 2024", "...", classification("revenue"))
+        memory.last_active -= 1
+        memory.touch()
+        assert not memory.turns
+        assert memory.last_metric is None
+
+    def test_evict_idle(self):
+        idle = ConversationMemory(idle_seconds=0)
+        idle.add_turn("q", "a")
+        idle.last_active -= 1
+        active = ConversationMemory(idle_seconds=3600)
+        active.add_turn("q", "a")
+
+        assert evict_idle() >= 1
+        assert not idle.turns
+        assert active.turns
@@ -0,0 +1,169 @@
+"""
+Tests para services/cube_client.py - cliente REST de Cube Core.
+
+Verifica:
+- Long-polling "Continue wait" con backoff
+- Deduplicación de queries idénticas en vuelo
+- Cache con TTL e invalidación completa por cambio de versión de datos
+- Detección de pre-aggregations
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from services.cube_client import CubeClient, CubeError, build_metric_query
+
+
+class CubeStub:
+    """Stub de /cubejs-api/v1/load: responde "Continue wait" `waits` veces."""
+
+    def __init__(self, payload: dict, waits: int = 0, status_code: int = 200):
+        self.payload = payload
+        self.waits = waits
+        self.status_code = status_code
+        self.calls = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        assert request.url.path == "/cubejs-api/v1/load"
+        self.calls += 1
+        if self.calls <= self.waits:
+            return httpx.Response(200, json={"error": "Continue wait"})
+        return httpx.Response(self.status_code, json=self.payload)
+
+
+class SlowCubeStub(CubeStub):
+    """Variante con latencia, para observar queries concurrentes."""
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(0.05)
+        return super().__call__(request)
+
+
+def make_client(handler, **kwargs) -> CubeClient:
+    kwargs.setdefault("initial_backoff", 0.001)
+    return CubeClient(
+        api_url="http://test-cube:4000",
+        api_secret="",
+        transport=httpx.MockTransport(handler),
+        **kwargs
+    )
+
+
+QUERY = build_metric_query("revenue", "Q4_2024")
+
+
+class TestBuildMetricQuery:
+    def test_quarter_and_year_filters(self):
+        assert QUERY["measures"] == ["Facts.revenue"]
+        assert QUERY["filters"][0]["member"] == "Facts.fiscalQuarter"
+        assert build_metric_query("ebitda", "2024")["filters"][0]["member"] == "Facts.fiscalYear"
+
+    def test_unknown_metric_raises(self):
+        with pytest.raises(ValueError):
+            build_metric_query("headcount", "2024")
+
+
+class TestCubeClient:
+    """Tests de CubeClient.load()."""
+
+    @pytest.mark.asyncio
+    async def test_continue_wait_is_retried(self, mock_cube_core_response):
+        stub = CubeStub(mock_cube_core_response, waits=3)
+        client = make_client(stub)
+        result = await client.load(QUERY)
+        await client.aclose()
+
+        assert stub.calls == 4
+        assert len(result.data) == 4
+        assert result.sql.startswith("SELECT")
+        assert result.from_cache is False
+
+    @pytest.mark.asyncio
+    async def test_continue_wait_gives_up_after_max_wait(self, mock_cube_core_response):
+        client = make_client(CubeStub(mock_cube_core_response, waits=1000), max_wait=0.05)
+        with pytest.raises(CubeError):
+            await client.load(QUERY)
+        await client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_error_response_raises(self):
+        client = make_client(CubeStub({"error": "Cube Facts not found"}, status_code=400))
+        with pytest.raises(CubeError, match="Facts not found"):
+            await client.load(QUERY)
+        await client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_identical_inflight_queries_are_deduplicated(self, mock_cube_core_response):
+        stub = SlowCubeStub(mock_cube_core_response)
+        client = make_client(stub)
+        results = await asyncio.gather(*(client.load(dict(QUERY)) for _ in range(5)))
+        await client.aclose()
+
+        assert stub.calls == 1
+        assert all(r.data == results[0].data for r in results)
+
+    @pytest.mark.asyncio
+    async def test_cache_hit_and_ttl(self, mock_cube_core_response):
+        stub = CubeStub(mock_cube_core_response)
+        client = make_client(stub)
+        await client.load(QUERY)
+        cached = await client.load(QUERY)
+        assert stub.calls == 1
+        assert cached.from_cache is True
+        assert client.hits == 1
+
+        client.cache_ttl = 0
+        await client.load(QUERY)
+        await client.aclose()
+        assert stub.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_invalidate_clears_cache(self, mock_cube_core_response):
+        payload = {**mock_cube_core_response, "lastRefreshTime": "2024-12-31T00:00:00.000Z"}
+        stub = CubeStub(payload)
+        client = make_client(stub)
+        first = await client.load(QUERY)
+        await client.load(build_metric_query("cogs", "2024"))
+
+        assert first.refresh_key is not None  # solo trazabilidad
+        assert client.invalidate() == 2
+        await client.load(QUERY)
+        await client.aclose()
+        assert stub.calls == 3
+
+    @pytest.mark.asyncio
+    async def test_pre_aggregation_is_reported(self, mock_cube_core_response):
+        payload = {
+            **mock_cube_core_response,
+            "usedPreAggregations": {"prod_pre_aggregations.facts_quarterly": {"targetTableName": "t"}},
+        }
+        client = make_client(CubeStub(payload))
+        result = await client.load(QUERY)
+        await client.aclose()
+
+        assert result.from_pre_aggregation is True
+        assert "prod_pre_aggregations.facts_quarterly" in result.used_pre_aggregations
+
+    @pytest.mark.asyncio
+    async def test_without_pre_aggregation(self, mock_cube_core_response):
+        client = make_client(CubeStub(mock_cube_core_response))
+        result = await client.load(QUERY)
+        await client.aclose()
+        assert result.from_pre_aggregation is False
+
+    @pytest.mark.asyncio
+    async def test_secret_sends_jwt_authorization(self, mock_cube_core_response):
+        seen = {}
+
+        def handler(request):
+            seen["auth"] = request.headers.get("Authorization")
+            return httpx.Response(200, json=mock_cube_core_response)
+
+        client = CubeClient(
+            api_url="http://test-cube:4000", api_secret="s" * 32,
+            transport=httpx.MockTransport(handler)
+        )
+        await client.load(QUERY)
+        await client.aclose()
+        assert seen["auth"].count(".") == 2
@@ -0,0 +1,123 @@
+"""
+Tests para services/data_version.py - épocas de datos e invalidación.
+
+Verifica:
+- Versión estable por contenido y claves versionadas
+- Callbacks de invalidación solo en cambios reales
+- Propagación de la versión entre workers vía backend compartido
+"""
+import asyncio
+
+import pytest
+
+from services.answer_table import AnswerTable
+from services.cache import MemoryBackend, SQLiteBackend
+from services.data_version import DataVersionRegistry, compute_version
+
+
+def metrics(q4_revenue: float = 1_234_567) -> dict:
+    return {"revenue": {"Q3_2024": 1_100_000, "Q4_2024": q4_revenue}}
+
+
+def test_compute_version_is_content_based():
+    assert compute_version(metrics()) == compute_version(dict(reversed(list(metrics().items()))))
+    assert compute_version(metrics()) != compute_version(metrics(1_300_000))
+
+
+class TestDataVersionRegistry:
+    """Tests de DataVersionRegistry."""
+
+    def test_track_and_versioned_keys(self):
+        registry = DataVersionRegistry()
+        version = registry.track(metrics)
+        assert registry.key("explanation", "revenue", "Q4_2024") == f"v{version}:explanation:revenue:Q4_2024"
+        assert registry.epoch == 0
+
+    @pytest.mark.asyncio
+    async def test_source_change_fires_listeners_once(self):
+        source = metrics()
+        registry = DataVersionRegistry()
+        registry.track(lambda: source)
+        old_key = registry.key("chart", "revenue")
+        changes = []
+        registry.on_change(changes.append)
+
+        assert await registry.refresh() is False
+        source["revenue"]["Q4_2024"] = 1_300_000
+        assert await registry.refresh() is True
+        assert await registry.refresh() is False
+
+        assert changes == [registry.current]
+        assert registry.epoch == 1
+        assert registry.key("chart", "revenue") != old_key
+
+    @pytest.mark.asyncio
+    async def test_failing_listener_does_not_block_others(self):
+        registry = DataVersionRegistry()
+        registry.track(metrics)
+        calls = []
+
+        def broken(version):
+            raise RuntimeError("cube no disponible")
+
+        registry.on_change(broken)
+        registry.on_change(calls.append)
+        await registry.refresh(metrics(1))
+        assert len(calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_change_propagates_to_other_workers(self, tmp_path):
+        path = str(tmp_path / "cache.db")
+        source = metrics()
+        worker_a = DataVersionRegistry(SQLiteBackend(path), poll_interval=0.01)
+        worker_b = DataVersionRegistry(SQLiteBackend(path), poll_interval=0.01)
+        worker_a.track(lambda: source)
+        worker_b.track(lambda: metrics())
+        invalidated = []
+        worker_b.on_change(invalidated.append)
+
+        await worker_a.check()
+        await worker_b.check()
+        assert invalidated == []
+
+        # Refresh de datos detectado solo por el worker A
+        source["revenue"]["Q4_2024"] = 1_300_000
+        worker_b.start()
+        await worker_a.check()
+        await asyncio.sleep(0.05)
+        await worker_b.stop()
+
+        assert invalidated == [worker_a.current]
+        assert worker_b.key("x") == worker_a.key("x")
+
+    @pytest.mark.asyncio
+    async def test_shared_backend_failure_is_tolerated(self):
+        class Down(MemoryBackend):
+            async def get(self, key):
+                raise ConnectionError("down")
+
+            async def set(self, key, value, ttl):
+                raise ConnectionError("down")
+
+        registry = DataVersionRegistry(Down())
+        registry.track(metrics)
+        assert await registry.check() is False
+
+
+@pytest.mark.asyncio
+async def test_answer_table_invalidate_forces_rebuild():
+    table = AnswerTable(workers=1)
+    values = {"revenue": 1.0}
+
+    async def fetch(metric, period):
+        return {"value": values[metric], "formatted": f"${values[metric]}"}
+
+    async def explain(metric, period, formatted):
+        return f"Explicación {formatted}"
+
+    pairs = [("revenue", "Q4_2024")]
+    version = await table.build(pairs, fetch, lambda m, p: "SELECT 1", explain)
+    table.invalidate()
+    assert table.lookup("revenue", "Q4_2024") is None
+    assert await table.build(pairs, fetch, lambda m, p: "SELECT 1", explain) == version
+    assert table.lookup("revenue", "Q4_2024").explanation == "Explicación $1.0"
@@ -0,0 +1,109 @@
+"""
+Tests para services/derived_metrics.py - métricas derivadas deterministas.
+
+Verifica:
+- Detección de intención derivada y año base
+- YoY, QoQ, ratios y varianza vs presupuesto
+- Deltas de márgenes en puntos porcentuales
+"""
+import pytest
+
+from services.derived_metrics import DerivedMetricEngine, detect_derived_intent, extract_base_year
+
+METRICS = {
+    "revenue": {"Q1_2024": 980_000, "Q2_2024": 1_050_000, "2024": 4_364_567, "2023": 3_890_000},
+    "opex": {"Q1_2024": 280_000, "Q2_2024": 290_000, "2024": 1_175_000, "2023": 1_100_000},
+    "gross_margin": {"Q1_2024": 0.612, "Q2_2024": 0.619, "2024": 0.622, "2023": 0.609},
+}
+BUDGET = {"revenue": {"Q2_2024": 1_000_000, "2024": 4_330_000}}
+
+
+def engine_without_q4_2023() -> DerivedMetricEngine:
+    return DerivedMetricEngine({"revenue": {"Q4_2024": 1_234_567, "2023": 3_890_000}})
+
+
+@pytest.fixture
+def engine() -> DerivedMetricEngine:
+    return DerivedMetricEngine(METRICS, BUDGET)
+
+
+class TestDetection:
+    @pytest.mark.parametrize("query,intent", [
+        ("¿Cuánto creció el revenue vs 2023?", "yoy"),
+        ("revenue interanual 2024", "yoy"),
+        ("opex Q2 2024 vs trimestre anterior", "qoq"),
+        ("opex como % de ventas 2024", "ratio"),
+        ("revenue 2024 vs presupuesto", "variance"),
+        ("crecimiento del EBITDA Q3 2024", "growth"),
+        ("¿Cuál fue el revenue del Q4 2024?", None),
+    ])
+    def test_detect_derived_intent(self, query, intent):
+        assert detect_derived_intent(query) == intent
+
+    def test_extract_base_year(self):
+        assert extract_base_year("revenue 2024 respecto a 2023") == "2023"
+        assert extract_base_year("revenue 2024") is None
+
+
+class TestDerivedMetricEngine:
+    """Tests de DerivedMetricEngine.compute()."""
+
+    def test_yoy(self, engine):
+        figure = engine.compute("yoy", "revenue", "2024")
+        assert figure.base_label == "2023"
+        assert figure.change == pytest.approx(474_567)
+        assert figure.change_pct == pytest.approx(4_364_567 / 3_890_000 - 1)
+
+    def test_yoy_with_explicit_base(self, engine):
+        figure = engine.compute("yoy", "opex", "2024", base_period="2023")
+        assert figure.base_value == 1_100_000
+
+    def test_quarter_vs_bare_year_uses_same_quarter(self):
+        metrics = {"revenue": {"Q4_2023": 1_000_000, "Q4_2024": 1_234_567, "2023": 3_890_000}}
+        figure = DerivedMetricEngine(metrics).compute("yoy", "revenue", "Q4_2024", base_period="2023")
+        assert figure.base_label == "Q4 2023"
+        assert figure.change_pct == pytest.approx(0.234567)
+        # Sin el trimestre base no se compara contra el año completo
+        assert engine_without_q4_2023().compute("yoy", "revenue", "Q4_2024", base_period="2023") is None
+
+    def test_year_vs_quarter_base_falls_back_to_default(self, engine):
+        figure = engine.compute("yoy", "revenue", "2024", base_period="Q1_2024")
+        assert figure.base_label == "2023"
+
+    def test_growth_uses_qoq_for_quarters(self, engine):
+        figure = engine.compute("growth", "revenue", "Q2_2024")
+        assert figure.intent == "qoq"
+        assert figure.base_label == "Q1 2024"
+        assert figure.change == pytest.approx(70_000)
+
+    def test_missing_base_returns_none(self, engine):
+        assert engine.compute("qoq", "revenue", "Q1_2024") is None
+        assert engine.compute("variance", "opex", "2024") is None
+
+    def test_ratio(self, engine):
+        figure = engine.compute("ratio", "opex", "2024")
+        assert figure.change_pct == pytest.approx(1_175_000 / 4_364_567)
+        assert "Ratio Opex / Revenue" in figure.describe()
+        assert engine.compute("ratio", "revenue", "2024") is None
+
+    def test_budget_variance(self, engine):
+        figure = engine.compute("variance", "revenue", "Q2_2024")
+        assert figure.base_value == 1_000_000
+        assert figure.change == pytest.approx(50_000)
+        assert "**+$50,000.00** (+5.0%)" in figure.describe()
+
+    def test_margin_delta_in_percentage_points(self, engine):
+        figure = engine.compute("yoy", "gross_margin", "2024")
+        assert "+1.3 pp" in figure.describe()
+
+    def test_unknown_intent_raises(self, engine):
+        with pytest.raises(ValueError):
+            engine.compute("forecast", "revenue", "2024")
+
+    def test_invalidate_reloads_store(self):
+        metrics = {"revenue": {"2023": 100.0, "2024": 110.0}}
+        engine = DerivedMetricEngine(metrics)
+        assert engine.compute("yoy", "revenue", "2024").change == pytest.approx(10)
+        metrics["revenue"]["2024"] = 120.0
+        engine.invalidate()
+        assert engine.compute("yoy", "revenue", "2024").change == pytest.approx(20)
@@ -0,0 +1,110 @@
+"""
+Tests para services/distributed.py - ejecución por chunks fuera de línea.
+
+Verifica:
+- Troceo perezoso y expansión de grids
+- Resultados incrementales con timing por tarea (pool de procesos)
+- Errores aislados por chunk
+- Agregación de Parquet particionado (si pyarrow está instalado)
+"""
+import pytest
+
+from services import distributed
+from services.distributed import (
+    DistributedExecutor, PartialAggregate, aggregate_parquet, chunked, expand_grid
+)
+
+try:
+    import pyarrow
+except ImportError:  # Dependencia opcional
+    pyarrow = None
+
+
+def squares(items: list[int]) -> list[int]:
+    return [i * i for i in items]
+
+
+def fail_on_seven(items: list[int]) -> list[int]:
+    if 7 in items:
+        raise ValueError("siete")
+    return items
+
+
+def test_chunked_is_lazy():
+    consumed = []
+
+    def numbers():
+        for i in range(5):
+            consumed.append(i)
+            yield i
+
+    chunks = chunked(numbers(), 2)
+    assert next(chunks) == [0, 1]
+    assert consumed == [0, 1]
+    assert list(chunks) == [[2, 3], [4]]
+
+
+def test_expand_grid():
+    assert expand_grid({"sessions": [10, 50], "queries": [20]}) == [
+        {"sessions": 10, "queries": 20}, {"sessions": 50, "queries": 20}
+    ]
+
+
+class TestDistributedExecutor:
+    """Tests de DistributedExecutor con el backend de procesos."""
+
+    def test_streams_chunks_with_timings(self):
+        with DistributedExecutor(backend="process", workers=2, chunk_size=3) as executor:
+            results = list(executor.map_chunks(squares, range(10), max_in_flight=2))
+            summary = executor.summary()
+
+        assert sorted(r.chunk for r in results) == [0, 1, 2, 3]
+        assert sorted(v for r in results for v in r.results) == [i * i for i in range(10)]
+        assert all(r.ok and r.timing.elapsed_ms >= r.timing.run_ms for r in results)
+        assert summary["backend"] == "process"
+        assert (summary["tasks"], summary["items"], summary["failed"]) == (4, 10, 0)
+
+    def test_failed_chunk_does_not_stop_the_rest(self):
+        with DistributedExecutor(backend="process", workers=2) as executor:
+            results = {r.chunk: r for r in executor.map_chunks(fail_on_seven, range(10), chunk_size=5)}
+
+        assert results[0].results == [0, 1, 2, 3, 4]
+        assert not results[1].ok and "siete" in results[1].timing.error
+        assert executor.summary()["failed"] == 1
+
+    def test_rejects_unknown_backend(self):
+        with pytest.raises(ValueError):
+            DistributedExecutor(backend="ray")
+
+
+def test_sweep_runs_configurations_one_at_a_time(monkeypatch):
+    calls = []
+
+    def fake_map_chunks(self, fn, items, chunk_size=None, max_in_flight=None):
+        calls.append((list(items), chunk_size, max_in_flight))
+        return iter(())
+
+    monkeypatch.setattr(DistributedExecutor, "map_chunks", fake_map_chunks)
+    grid = '{"sessions": [10, 50]}'
+    assert distributed.main(["--backend", "process", "sweep", "--grid", grid, "--concurrent", "4"]) == 0
+    assert calls == [([{"sessions": 10}, {"sessions": 50}], 1, 1)]
+
+
+@pytest.mark.skipif(pyarrow is None, reason="pyarrow no instalado")
+def test_aggregate_partitioned_parquet(tmp_path):
+    import pandas as pd
+
+    for period, values in {"Q3_2024": [1.0, 2.0], "Q4_2024": [3.0, 4.0, 5.0]}.items():
+        directory = tmp_path / f"period={period}"
+        directory.mkdir()
+        for part, value in enumerate(values):
+            pd.DataFrame({"metric": ["revenue"], "value": [value]}).to_parquet(directory / f"part-{part}.parquet")
+
+    assert PartialAggregate(["period"], ["value"])([str(tmp_path / "period=Q3_2024" / "part-0.parquet")]) == [
+        {"period": "Q3_2024", "value": 1.0, "rows": 1}
+    ]
+    with DistributedExecutor(backend="process", workers=2) as executor:
+        df = aggregate_parquet(executor, str(tmp_path), ["metric", "period"], ["value"], files_per_task=2)
+
+    totals = {row["period"]: (row["value"], row["rows"]) for row in df.to_dict("records")}
+    assert totals == {"Q3_2024": (3.0, 2), "Q4_2024": (12.0, 3)}
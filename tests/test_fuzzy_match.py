@@ -0,0 +1,81 @@
+"""
+Tests para services/fuzzy_match.py - sinónimos con errores de escritura.
+
+Verifica:
+- Distancia de edición acotada (transposición = un error)
+- Métricas detectadas con errores típicos y su confianza
+- Sin falsos positivos en consultas documentales o palabras parecidas
+"""
+import pytest
+
+from services.fuzzy_match import FUZZY_MIN_CONFIDENCE, MetricMatcher, edit_distance, normalize
+
+# Misma forma que SEMANTIC_KEYWORDS en app.py
+SYNONYMS = {
+    "revenue": ["revenue", "ventas", "ingresos", "sales", "facturación"],
+    "cogs": ["cogs", "costo", "cost of goods", "costo de ventas"],
+    "gross_margin": ["margen bruto", "gross margin", "margen"],
+    "opex": ["opex", "gastos operativos", "operating expenses", "gastos"],
+    "ebitda": ["ebitda", "utilidad operativa"],
+    "net_income": ["net income", "utilidad neta", "ganancia", "profit"]
+}
+
+
+@pytest.fixture
+def matcher() -> MetricMatcher:
+    return MetricMatcher(SYNONYMS)
+
+
+def test_normalize_strips_accents():
+    assert normalize("Facturación") == "facturacion"
+
+
+def test_edit_distance_counts_transposition_once():
+    assert edit_distance("ebidta", "ebitda", limit=2) == 1
+    assert edit_distance("revenu", "revenue", limit=1) == 1
+    assert edit_distance("ventana", "ventas", limit=1) == 2  # limit + 1
+
+
+class TestMetricMatcher:
+    """Tests de MetricMatcher."""
+
+    @pytest.mark.parametrize("query,metric", [
+        ("¿Cuál fue el revenu de Q4 2024?", "revenue"),
+        ("ebidta del 2024", "ebitda"),
+        ("utilidad netta del tercer trimestre 2024", "net_income"),
+        ("margin bruto q2 2024", "gross_margin"),
+        ("gross margn 2024", "gross_margin"),
+        ("facturacion 2023", "revenue"),
+    ])
+    def test_typos_resolve_to_metric(self, matcher, query, metric):
+        match = matcher.match(query)
+        assert match is not None
+        assert match.metric == metric
+        assert FUZZY_MIN_CONFIDENCE <= match.confidence <= 1
+
+    def test_confidence_reflects_distance(self, matcher):
+        match = matcher.match("utilidad netta")
+        assert (match.keyword, match.term, match.distance) == ("utilidad neta", "utilidad netta", 1)
+        assert match.confidence == pytest.approx(1 - 1 / 13, abs=1e-3)
+
+    @pytest.mark.parametrize("query", [
+        "¿Cuál es la política de viáticos de la empresa?",
+        "cerrar la ventana",
+        "oficina en costa rica",
+        "cost 2024",  # Sinónimos cortos: solo coincidencia exacta
+        "mis gustos musicales",  # "gastos" a un error, sin período
+        "gestos de la cara",
+        "las vetas de la madera",  # "ventas" a un error
+        "marges",
+    ])
+    def test_no_false_positives(self, matcher, query):
+        assert matcher.match(query) is None
+
+    def test_short_synonym_typo_needs_period_cue(self, matcher):
+        assert matcher.match("ebidta") is None
+        assert matcher.match("ebidta del año pasado").metric == "ebitda"
+        assert matcher.match("gastso q3 2024").metric == "opex"
+
+    def test_stricter_confidence_rejects_typos(self):
+        assert MetricMatcher(SYNONYMS, min_confidence=0.9).match("ebidta 2024") is None
+
@@ -0,0 +1,135 @@
+"""
+Tests para services/http_replay.py - grabación/reproducción de llamadas HTTP.
+
+Verifica:
+- Grabación de request/response con latencia, sin headers sensibles
+- Reproducción offline con latencia grabada, escalada y muestreada
+- Coincidencia exacta por cuerpo y fallback por URL
+"""
+import asyncio
+import gzip
+import json
+import time
+
+import httpx
+import pytest
+
+from services.http_replay import (
+    CassetteMissError,
+    RecordingTransport,
+    ReplayTransport,
+    cassette_transport,
+)
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+
+async def fake_openrouter(request: httpx.Request) -> httpx.Response:
+    await asyncio.sleep(0.05)
+    prompt = json.loads(request.content)["messages"][-1]["content"]
+    body = json.dumps({"choices": [{"message": {"content": f"Respuesta a: {prompt}"}}]}).encode()
+    return httpx.Response(
+        200, headers={"content-type": "application/json", "content-encoding": "gzip"},
+        content=gzip.compress(body)
+    )
+
+
+async def ask(transport, prompt: str) -> httpx.Response:
+    async with httpx.AsyncClient(transport=transport) as client:
+        return await client.post(
+            OPENROUTER_URL,
+            headers={"Authorization": "Bearer sk-secret"},
+            json={"messages": [{"role": "user", "content": prompt}]},
+        )
+
+
+async def record_cassette(tmp_path):
+    path = tmp_path / "openrouter.jsonl"
+    recorder = RecordingTransport(str(path), inner=httpx.MockTransport(fake_openrouter))
+    for prompt in ("revenue Q4", "ebitda 2024"):
+        response = await ask(recorder, prompt)
+        assert response.json()["choices"][0]["message"]["content"] == f"Respuesta a: {prompt}"
+    return path
+
+
+class TestRecording:
+    """Tests de RecordingTransport."""
+
+    @pytest.mark.asyncio
+    async def test_records_decoded_body_and_latency(self, tmp_path):
+        cassette = await record_cassette(tmp_path)
+        lines = [json.loads(line) for line in cassette.read_text().splitlines()]
+        assert len(lines) == 2
+        assert lines[0]["request"]["url"] == OPENROUTER_URL
+        assert lines[0]["latency_ms"] >= 50
+        assert "Respuesta a: revenue Q4" in lines[0]["response"]["body"]["text"]
+        assert "sk-secret" not in cassette.read_text()
+        assert "content-encoding" not in dict(lines[0]["response"]["headers"])
+
+
+class TestReplay:
+    """Tests de ReplayTransport."""
+
+    @pytest.mark.asyncio
+    async def test_exact_match_with_recorded_latency(self, tmp_path):
+        cassette = await record_cassette(tmp_path)
+        replay = ReplayTransport(str(cassette))
+        start = time.perf_counter()
+        response = await ask(replay, "ebitda 2024")
+        elapsed = time.perf_counter() - start
+
+        assert response.json()["choices"][0]["message"]["content"] == "Respuesta a: ebitda 2024"
+        assert elapsed >= 0.05
+        assert replay.replayed == 1
+
+    @pytest.mark.asyncio
+    async def test_latency_scale_and_none(self, tmp_path):
+        cassette = await record_cassette(tmp_path)
+        scaled = ReplayTransport(str(cassette), latency_scale=4)
+        start = time.perf_counter()
+        await ask(scaled, "revenue Q4")
+        assert time.perf_counter() - start >= 0.2
+
+        instant = ReplayTransport(str(cassette), latency="none")
+        start = time.perf_counter()
+        await ask(instant, "revenue Q4")
+        assert time.perf_counter() - start < 0.05
+
+    @pytest.mark.asyncio
+    async def test_sampled_latency_from_host_distribution(self, tmp_path):
+        cassette = await record_cassette(tmp_path)
+        replay = ReplayTransport(str(cassette), latency="sampled", seed=7)
+        replay._load()
+        recorded = replay._by_host["openrouter.ai"]
+        request = httpx.Request("POST", OPENROUTER_URL)
+        delays = {replay._delay(request, {}) for _ in range(20)}
+        assert delays <= {ms / 1000 for ms in recorded}
+
+    @pytest.mark.asyncio
+    async def test_unmatched_body_falls_back_to_url(self, tmp_path):
+        cassette = await record_cassette(tmp_path)
+        replay = ReplayTransport(str(cassette), latency="none")
+        first = await ask(replay, "consulta nueva")
+        second = await ask(replay, "otra consulta")
+        assert first.json() != second.json()  # Rota entre las grabadas
+
+        strict = ReplayTransport(str(cassette), latency="none", strict=True)
+        with pytest.raises(CassetteMissError):
+            await ask(strict, "consulta nueva")
+        assert strict.misses == 1
+
+    @pytest.mark.asyncio
+    async def test_missing_cassette(self, tmp_path):
+        replay = ReplayTransport(str(tmp_path / "none.jsonl"))
+        with pytest.raises(CassetteMissError):
+            await ask(replay, "x")
+
+
+def test_cassette_transport_modes(tmp_path):
+    assert cassette_transport("cube", mode="off") is None
+    recorder = cassette_transport("cube", mode="record", directory=str(tmp_path))
+    assert isinstance(recorder, RecordingTransport)
+    assert recorder.path == tmp_path / "cube.jsonl"
+    assert isinstance(cassette_transport("n8n", mode="replay", directory=str(tmp_path)), ReplayTransport)
+    with pytest.raises(ValueError):
+        cassette_transport("cube", mode="live")
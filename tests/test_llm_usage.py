@@ -0,0 +1,84 @@
+"""
+Tests para services/llm_usage.py - contabilidad de tokens del LLM.
+
+Verifica:
+- Estimación local y parseo de `usage` (normal y streamed)
+- Agregado por modelo (tokens/s, costo)
+- Cuota diaria por usuario
+"""
+import json
+
+import pytest
+
+from services.llm_usage import (
+    CallUsage,
+    QuotaExceededError,
+    UsageTracker,
+    estimate_prompt_tokens,
+    parse_stream,
+    parse_usage,
+)
+
+
+def test_estimate_prompt_tokens_counts_overhead():
+    messages = [{"role": "system", "content": "a" * 40}, {"role": "user", "content": "b" * 8}]
+    assert estimate_prompt_tokens(messages) == 10 + 2 + 2 * 4
+
+
+def test_parse_usage():
+    payload = {"choices": [], "usage": {"prompt_tokens": 120, "completion_tokens": 80, "cost": 0.0012}}
+    assert parse_usage(payload) == {"prompt_tokens": 120, "completion_tokens": 80, "cost": 0.0012}
+    assert parse_usage({"choices": []}) is None
+
+
+def test_parse_stream_reads_usage_from_last_chunk():
+    chunks = [
+        ": OPENROUTER PROCESSING",
+        "data: " + json.dumps({"choices": [{"delta": {"content": "El revenue "}}]}),
+        "",
+        "data: " + json.dumps({"choices": [{"delta": {"content": "creció."}}]}),
+        "data: " + json.dumps({"choices": [], "usage": {"prompt_tokens": 50, "completion_tokens": 4}}),
+        "data: [DONE]",
+    ]
+    text, usage = parse_stream(chunks)
+    assert text == "El revenue creció."
+    assert usage["prompt_tokens"] == 50
+    assert usage["completion_tokens"] == 4
+
+
+class TestUsageTracker:
+    """Tests de UsageTracker."""
+
+    def test_aggregates_per_model_with_price_table(self):
+        tracker = UsageTracker(prompt_price_per_1m=1.0, completion_price_per_1m=2.0)
+        tracker.record("hector", CallUsage("model-a", 90, 100, 50, latency_ms=500))
+        tracker.record("hector", CallUsage("model-a", 110, 100, 150, latency_ms=1500))
+        tracker.record("hector", CallUsage("model-b", 10, 10, 10, latency_ms=100, cost=0.5))
+
+        stats = tracker.snapshot()
+        assert stats["model-a"]["calls"] == 2
+        assert stats["model-a"]["completion_tokens"] == 200
+        assert stats["model-a"]["tokens_per_second"] == pytest.approx(100)
+        assert stats["model-a"]["avg_latency_ms"] == pytest.approx(1000)
+        assert stats["model-a"]["cost"] == pytest.approx((200 * 1.0 + 200 * 2.0) / 1_000_000)
+        assert stats["model-b"]["cost"] == pytest.approx(0.5)
+
+    def test_call_usage_tokens_per_second(self):
+        usage = CallUsage("m", 10, prompt_tokens=10, completion_tokens=40, latency_ms=2000)
+        assert usage.tokens_per_second == pytest.approx(20)
+        assert usage.to_dict()["total_tokens"] == 50
+
+    def test_quota_enforced_before_call(self):
+        tracker = UsageTracker(daily_quota=1000)
+        tracker.check_quota("hector", 900)
+        tracker.record("hector", CallUsage("m", 500, 600, 300))
+
+        with pytest.raises(QuotaExceededError):
+            tracker.check_quota("hector", 200)
+        tracker.check_quota("otro", 200)
+        assert tracker.used_today("hector") == 900
+
+    def test_quota_disabled(self):
+        tracker = UsageTracker(daily_quota=0)
+        tracker.record("hector", CallUsage("m", 0, 10**9, 0))
+        tracker.check_quota("hector", 10**9)
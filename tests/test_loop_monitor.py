@@ -0,0 +1,67 @@
+"""
+Tests para services/loop_monitor.py - lag del event loop y bloqueos.
+
+Verifica:
+- Muestras de lag con el loop libre
+- Detección de un bloqueo síncrono con paso y stack
+- Registro de pasos anidados por tarea
+"""
+import asyncio
+import time
+
+import pytest
+
+from services.loop_monitor import LoopMonitor
+
+
+def blocking_dataframe_build(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+class TestLoopMonitor:
+    """Tests de LoopMonitor."""
+
+    @pytest.mark.asyncio
+    async def test_samples_lag_when_idle(self):
+        monitor = LoopMonitor(interval=0.01, threshold_ms=200)
+        monitor.start()
+        await asyncio.sleep(0.1)
+        monitor.stop()
+
+        snapshot = monitor.snapshot()
+        assert snapshot["samples"] >= 3
+        assert snapshot["blocked"] == 0
+        assert snapshot["p99_ms"] < 200
+
+    @pytest.mark.asyncio
+    async def test_detects_blocking_step_with_stack(self):
+        monitor = LoopMonitor(interval=0.01, threshold_ms=50)
+        monitor.start()
+        await asyncio.sleep(0.03)
+        async with monitor.step("Datos"):
+            blocking_dataframe_build(0.2)
+        await asyncio.sleep(0.05)
+        monitor.stop()
+
+        assert monitor.blocked == 1
+        assert monitor.blocked_by_step == {"Datos": 1}
+        event = monitor.events[0]
+        assert event.duration_ms >= 150
+        assert "blocking_dataframe_build" in event.stack
+        assert monitor.snapshot()["max_ms"] >= 150
+        assert asyncio.get_running_loop().slow_callback_duration == pytest.approx(0.05)
+
+    @pytest.mark.asyncio
+    async def test_step_registry_per_task(self):
+        monitor = LoopMonitor()
+        task = asyncio.current_task()
+        with monitor.step("Explicación"):
+            with monitor.step("Derivadas"):
+                assert monitor._steps[task] == ["Explicación", "Derivadas"]
+            assert monitor._steps[task] == ["Explicación"]
+        assert task not in monitor._steps
+
+    def test_snapshot_empty(self):
+        snapshot = LoopMonitor().snapshot()
+        assert snapshot["samples"] == 0
+        assert snapshot["max_ms"] == 0.0
@@ -0,0 +1,138 @@
+"""
+Tests para services/n8n_router.py - router n8n con fallback local.
+
+Verifica:
+- n8n decide cuando responde dentro del presupuesto
+- Fallback local por presupuesto excedido, error o circuito abierto
+- Cache por consulta normalizada
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from services.n8n_router import CircuitBreaker, N8nRouter, normalize_query
+
+
+def local_classifier(query: str) -> dict:
+    """Clasificador local mínimo con el formato de classify_query()."""
+    return {
+        "route": "documental",
+        "route_target": "Weaviate",
+        "metric": None,
+        "period": "2024",
+        "is_financial": False,
+    }
+
+
+def make_router(handler, **kwargs) -> N8nRouter:
+    return N8nRouter(
+        local_classifier=local_classifier,
+        webhook_url="http://test-n8n:5678/webhook/test",
+        transport=httpx.MockTransport(handler),
+        **kwargs
+    )
+
+
+class TestNormalizeQuery:
+    def test_strips_accents_punctuation_and_case(self):
+        assert normalize_query("¿Cuál fue el  Revenue de Q4 2024?") == "cual fue el revenue de q4 2024"
+
+
+class TestN8nRouter:
+    """Tests de N8nRouter.route()."""
+
+    @pytest.mark.asyncio
+    async def test_n8n_decides_within_budget(self, mock_n8n_classification):
+        router = make_router(lambda request: httpx.Response(200, json=mock_n8n_classification))
+        result = await router.route("¿Cuál fue el revenue de Q4 2024?")
+        await router.aclose()
+
+        assert result["decided_by"] == "n8n"
+        assert result["route"] == "semantic"
+        assert result["route_target"] == "Cube Core"
+        assert result["metric"] == "revenue"
+        assert result["is_financial"] is True
+
+    @pytest.mark.asyncio
+    async def test_budget_exceeded_falls_back_and_late_answer_fills_cache(
+        self, mock_n8n_classification
+    ):
+        async def slow(request):
+            await asyncio.sleep(0.2)
+            return httpx.Response(200, json=mock_n8n_classification)
+
+        router = make_router(slow, budget_ms=20)
+        first = await router.route("revenue Q4 2024")
+        assert first["decided_by"] == "local"
+        assert first["router_latency_ms"] < 150
+
+        await asyncio.sleep(0.3)
+        second = await router.route("Revenue, Q4 2024")
+        await router.aclose()
+        assert second["decided_by"] == "cache"
+        assert second["metric"] == "revenue"
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("payload", [
+        {"route": "semantic", "metric": "revenue", "period": "Q4 2024"},
+        {"route": "semantic", "metric": "ventas_netas", "period": "Q4_2024"},
+        {"route": "sql", "metric": "revenue", "period": "Q4_2024"},
+    ])
+    async def test_malformed_remote_falls_back_to_local(self, payload):
+        router = make_router(
+            lambda request: httpx.Response(200, json=payload),
+            metrics=["revenue", "ebitda"], periods=["Q4_2024", "2024"]
+        )
+        result = await router.route("revenue Q4 2024")
+        cached = await router.route("revenue Q4 2024")
+        await router.aclose()
+
+        assert result["decided_by"] == "local"
+        assert result["metric"] is None and result["period"] == "2024"
+        assert cached["decided_by"] == "local"  # lo descartado no se cachea
+        assert router.invalid_responses == 2
+        assert router.decisions["local"] == 2
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("body", [b"[]", b'"ok"', b"null"])
+    async def test_non_object_body_falls_back_and_counts_as_failure(self, body):
+        router = make_router(
+            lambda request: httpx.Response(200, content=body, headers={"content-type": "application/json"}),
+            breaker=CircuitBreaker(max_failures=2)
+        )
+        result = await router.route("revenue Q4 2024")
+        await router.route("ebitda 2024")
+        await router.aclose()
+
+        assert result["decided_by"] == "local"
+        assert router.invalid_responses == 2
+        assert router.breaker.is_open
+
+    @pytest.mark.asyncio
+    async def test_errors_open_circuit(self):
+        calls = []
+
+        def failing(request):
+            calls.append(request)
+            return httpx.Response(500)
+
+        router = make_router(failing, breaker=CircuitBreaker(max_failures=2, cooldown=60))
+        for i in range(4):
+            result = await router.route(f"pregunta {i}")
+            assert result["decided_by"] == "local"
+            await asyncio.sleep(0)
+        await router.aclose()
+        assert len(calls) == 2
+        assert router.breaker.is_open
+
+    @pytest.mark.asyncio
+    async def test_disabled_router_never_calls_n8n(self):
+        def unexpected(request):
+            raise AssertionError("n8n no debe llamarse")
+
+        router = make_router(unexpected, enabled=False)
+        result = await router.route("revenue")
+        await router.aclose()
+        assert result["decided_by"] == "local"
+        assert router.decisions["local"] == 1
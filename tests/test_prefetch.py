@@ -0,0 +1,140 @@
+"""
+Tests para services/prefetch.py - prefetch especulativo de seguimientos.
+
+Verifica:
+- Períodos vecinos y predicción a priori / aprendida del audit log
+- Calentamiento en background con baja prioridad
+- Cancelación al llegar el siguiente mensaje y hit rate
+"""
+import asyncio
+
+import pytest
+
+from services.audit_store import AuditStore
+from services.prefetch import Prefetcher, TransitionModel, neighbour_periods
+
+PERIODS = ["Q1_2024", "Q2_2024", "Q3_2024", "Q4_2024", "2024", "2023"]
+RELATED = {"revenue": ["cogs", "gross_margin"]}
+
+
+def model() -> TransitionModel:
+    return TransitionModel(PERIODS, RELATED)
+
+
+def history_row(user: str, timestamp: str, metric=None, period=None) -> dict:
+    return {"user_id": user, "timestamp": timestamp, "metric": metric, "period": period}
+
+
+def test_neighbour_periods():
+    assert neighbour_periods("Q1_2024") == {
+        "previous_period": "Q4_2023", "next_period": "Q2_2024", "yoy": "Q1_2023"
+    }
+    assert neighbour_periods("2024")["yoy"] == "2023"
+    assert neighbour_periods("FY") == {}
+
+
+class TestTransitionModel:
+    """Tests de TransitionModel."""
+
+    def test_priors_only_known_periods(self):
+        predicted = model().predict("revenue", "Q4_2024", top_n=4)
+        assert predicted == [
+            ("revenue", "Q3_2024"), ("cogs", "Q4_2024"), ("gross_margin", "Q4_2024")
+        ]
+
+    def test_fit_learns_transitions_and_breaks_chains(self):
+        m = model()
+        learned = m.fit([
+            history_row("ana", "2026-09-01T10:00:00", "revenue", "Q4_2024"),
+            history_row("ana", "2026-09-01T10:01:00", "ebitda", "Q4_2024"),
+            # Consulta documental: corta la cadena
+            history_row("ana", "2026-09-01T10:02:00"),
+            history_row("ana", "2026-09-01T10:03:00", "opex", "2024"),
+            # Pausa larga: nueva secuencia
+            history_row("ana", "2026-09-01T15:00:00", "revenue", "2024"),
+            history_row("luis", "2026-09-01T15:01:00", "cogs", "2024"),
+        ])
+        assert learned == 1
+        assert m.predict("revenue", "Q4_2024", top_n=1) == [("ebitda", "Q4_2024")]
+
+    def test_fit_from_audit_store(self, tmp_path):
+        store = AuditStore(str(tmp_path / "audit.db"))
+        store.add_sessions([
+            {"session_id": f"s{i}", "user_id": "ana", "timestamp": f"2026-09-01T10:0{i}:00Z",
+             "query": "q", "classification": {"route": "semantic", "metric": metric, "period": "Q4_2024"}}
+            for i, metric in enumerate(["revenue", "net_income", "revenue", "net_income"])
+        ])
+        m = model()
+        assert m.fit(store.iter_query_sequence(since="2026-08-01")) == 3
+        store.close()
+        assert m.predict("revenue", "Q4_2024", top_n=1) == [("net_income", "Q4_2024")]
+
+
+class TestPrefetcher:
+    """Tests de Prefetcher."""
+
+    @staticmethod
+    def recording_warm(delay: float = 0.0):
+        warmed = []
+
+        async def warm(metric, period, user_id):
+            await asyncio.sleep(delay)
+            warmed.append((metric, period))
+
+        return warm, warmed
+
+    @pytest.mark.asyncio
+    async def test_warms_predictions_and_counts_hit(self):
+        warm, warmed = self.recording_warm()
+        prefetcher = Prefetcher(model(), warm, top_n=2)
+        prefetcher.record("s1", ("revenue", "Q4_2024"))
+        targets = prefetcher.schedule("s1", "revenue", "Q4_2024", "ana")
+        await asyncio.sleep(0.01)
+
+        assert warmed == targets == [("revenue", "Q3_2024"), ("cogs", "Q4_2024")]
+        assert prefetcher.record("s1", ("revenue", "Q3_2024")) is True
+        # La transición real se aprende en línea
+        assert prefetcher.model.counts[("revenue", "Q4_2024")][("revenue", "Q3_2024")] == 1
+        assert prefetcher.snapshot()["hit_rate"] == 1.0
+
+    @pytest.mark.asyncio
+    async def test_waits_for_foreground_requests(self):
+        warm, warmed = self.recording_warm()
+        prefetcher = Prefetcher(model(), warm, top_n=1)
+        async with prefetcher.foreground():
+            prefetcher.schedule("s1", "revenue", "Q4_2024", "ana")
+            await asyncio.sleep(0.01)
+            assert warmed == []
+        await asyncio.sleep(0.01)
+        assert warmed == [("revenue", "Q3_2024")]
+
+    @pytest.mark.asyncio
+    async def test_next_message_cancels_and_counts_miss(self):
+        warm, warmed = self.recording_warm(delay=0.05)
+        prefetcher = Prefetcher(model(), warm, top_n=3)
+        prefetcher.schedule("s1", "revenue", "Q4_2024", "ana")
+        await asyncio.sleep(0)
+        prefetcher.cancel("s1")
+        await asyncio.sleep(0.06)
+
+        assert warmed == []
+        assert prefetcher.record("s1", ("revenue", "Q3_2024")) is False
+        snapshot = prefetcher.snapshot()
+        assert (snapshot["followups"], snapshot["hits"], snapshot["cancelled"]) == (1, 0, 1)
+
+    @pytest.mark.asyncio
+    async def test_warm_failure_is_not_a_hit(self):
+        async def broken(metric, period, user_id):
+            raise ConnectionError("cube caído")
+
+        prefetcher = Prefetcher(model(), broken, top_n=1)
+        prefetcher.schedule("s1", "revenue", "Q4_2024", "ana")
+        await asyncio.sleep(0.01)
+        assert prefetcher.record("s1", ("revenue", "Q3_2024")) is False
+        await prefetcher.stop()
+
+    def test_disabled_schedules_nothing(self):
+        warm, _ = self.recording_warm()
+        prefetcher = Prefetcher(model(), warm, enabled=False)
+        assert prefetcher.schedule("s1", "revenue", "Q4_2024", "ana") == []
+        assert prefetcher.record("s1", ("revenue", "Q3_2024")) is None
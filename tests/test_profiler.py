@@ -0,0 +1,88 @@
+"""
+Tests para services/profiler.py - profiling por consulta.
+
+Verifica:
+- Atribución de tiempo de CPU y de espera (await) a la consulta perfilada
+- Formatos collapsed-stack y speedscope
+- Decisión de perfilar por usuario, sesión y muestreo
+"""
+import asyncio
+import json
+import time
+
+import pytest
+
+from services.profiler import AWAIT_FRAME, RequestProfile, RequestProfiler
+
+
+def build_dataframe(seconds: float) -> None:
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+async def call_llm(seconds: float) -> None:
+    await asyncio.sleep(seconds)
+
+
+async def pipeline() -> None:
+    build_dataframe(0.08)
+    await call_llm(0.08)
+
+
+class TestRequestProfile:
+    """Tests de RequestProfile."""
+
+    @pytest.mark.asyncio
+    async def test_attributes_cpu_and_await_time(self, tmp_path):
+        async with RequestProfile("sess-1", interval_ms=2, output_dir=str(tmp_path)) as profile:
+            await pipeline()
+
+        top = {name.split(" ")[0]: (own, total) for name, own, total in profile.top_functions(50)}
+        assert top["build_dataframe"][0] > 30
+        assert top["call_llm"][1] > 30
+        assert top[AWAIT_FRAME][0] > 30
+        assert top["pipeline"][1] >= top["build_dataframe"][1]
+        # El stack se recorta a la tarea: sin maquinaria del event loop
+        assert not any("_run_once" in name for name in top)
+
+        assert [p.name for p in profile.files] == ["sess-1.collapsed", "sess-1.speedscope.json"]
+        assert "build_dataframe" in profile.summary_markdown()
+
+    @pytest.mark.asyncio
+    async def test_other_tasks_are_not_attributed(self):
+        async def other_session():
+            build_dataframe(0.05)
+
+        async with RequestProfile("sess-2", interval_ms=2, output_dir=None) as profile:
+            await asyncio.gather(call_llm(0.1), asyncio.create_task(other_session()))
+
+        names = {name for stack in profile.samples for name in stack}
+        assert not any(name.startswith("build_dataframe") for name in names)
+        assert profile.files == []
+
+    def test_output_formats(self):
+        profile = RequestProfile("k", output_dir=None)
+        profile.samples[("main (app.py:1)", "classify (app.py:9)")] = 2.5
+        profile.samples[("main (app.py:1)", AWAIT_FRAME)] = 10.0
+
+        assert profile.collapsed().splitlines() == [
+            "main (app.py:1);(await) 10000",
+            "main (app.py:1);classify (app.py:9) 2500",
+        ]
+        speedscope = profile.speedscope()
+        frames = [f["name"] for f in speedscope["shared"]["frames"]]
+        sampled = speedscope["profiles"][0]
+        assert [[frames[i] for i in s] for s in sampled["samples"]] == [
+            ["main (app.py:1)", "classify (app.py:9)"], ["main (app.py:1)", AWAIT_FRAME]
+        ]
+        assert sampled["endValue"] == pytest.approx(12.5)
+        json.dumps(speedscope)
+
+
+def test_should_profile():
+    profiler = RequestProfiler(users={"ana"}, sample_rate=0)
+    assert profiler.should_profile("ana")
+    assert not profiler.should_profile("hector")
+    assert profiler.should_profile("hector", session_enabled=True)
+    assert RequestProfiler(users=set(), sample_rate=1.0).should_profile("hector")
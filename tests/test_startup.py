@@ -0,0 +1,42 @@
+"""
+Tests de arranque en frío.
+
+Verifica:
+- app.py no importa dependencias pesadas a nivel de módulo
+- warm_up() importa módulos en background y omite los no instalados
+"""
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from services.warmup import warm_up
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class TestLazyImports:
+    """Tests de imports diferidos en app.py."""
+
+    def test_app_import_does_not_load_heavy_modules(self):
+        """Importar app no carga plotly, reportlab ni multiprocessing."""
+        code = (
+            "import sys, app; "
+            "print(','.join(m for m in ('plotly', 'reportlab', 'concurrent.futures.process') "
+            "if m in sys.modules))"
+        )
+        proc = subprocess.run(
+            [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+        )
+        assert proc.stdout.strip() == ""
+
+
+class TestWarmUp:
+    """Tests de warm_up()."""
+
+    @pytest.mark.asyncio
+    async def test_imports_and_skips_missing(self):
+        timings = await warm_up(["json", "modulo_inexistente_sdrag"])
+        assert "json" in timings
+        assert "modulo_inexistente_sdrag" not in timings
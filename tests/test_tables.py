@@ -0,0 +1,80 @@
+"""
+Tests para services/tables.py - tablas markdown sin pandas.
+
+Verifica:
+- Fast path de una fila
+- Formato de columnas numéricas (%, $)
+- Paginación que solo formatea la página visible
+"""
+import pytest
+
+from services.tables import PaginatedTable, format_value, markdown_table
+
+
+class TestMarkdownTable:
+    """Tests de markdown_table()."""
+
+    def test_single_row(self):
+        """Una fila genera encabezado, separador y fila alineados."""
+        table = markdown_table(("Métrica", "Valor"), [("Revenue", "$1,234,567.00")])
+        lines = table.splitlines()
+        assert lines[0] == "| Métrica | Valor         |"
+        assert lines[1] == "|:--------|:--------------|"
+        assert lines[2] == "| Revenue | $1,234,567.00 |"
+
+    def test_escapes_pipes(self):
+        """Los pipes en celdas no rompen la tabla."""
+        table = markdown_table(("A",), [("x|y",)])
+        assert "x\\|y" in table
+
+
+class TestFormatValue:
+    """Tests de format_value()."""
+
+    def test_margin_as_percent(self):
+        assert format_value("gross_margin", 0.6122) == "61.22%"
+
+    def test_revenue_as_currency(self):
+        assert format_value("revenue", 980000) == "$980,000.00"
+
+    def test_text_passthrough(self):
+        assert format_value("quarter", "Q1_2024") == "Q1_2024"
+
+
+class _CountingRows(list):
+    """Lista que registra los slices solicitados."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.slices = []
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            self.slices.append(index)
+        return super().__getitem__(index)
+
+
+class TestPaginatedTable:
+    """Tests de PaginatedTable."""
+
+    def test_renders_only_requested_page(self):
+        """Con 1000 filas solo se formatea la página pedida."""
+        records = _CountingRows(
+            {"quarter": f"Q{i}", "revenue": float(i)} for i in range(1000)
+        )
+        table = PaginatedTable.from_records(records, page_size=50)
+        assert table.num_pages == 20
+
+        page = table.render_page(2)
+        assert records.slices == [slice(50, 100)]
+        assert "| Q50 " in page
+        assert "Página 2/20 (filas 51-100 de 1000)" in page
+
+    def test_single_page_has_no_footer(self):
+        table = PaginatedTable(("A",), [("1",)])
+        assert "Página" not in table.render_page()
+
+    def test_page_out_of_range(self):
+        table = PaginatedTable(("A",), [("1",)])
+        with pytest.raises(ValueError):
+            table.render_page(2)
@@ -0,0 +1,96 @@
+"""
+Tests para services/ui_updates.py - actualizaciones de UI agrupadas.
+
+Verifica:
+- Flush por tamaño, por tiempo y final en TokenBuffer
+- Un solo frame para pasos rápidos y send + update para pasos lentos
+"""
+import asyncio
+
+import chainlit as cl
+import pytest
+from chainlit.context import init_http_context
+
+from services.ui_updates import CoalescedStep, TokenBuffer, UIStats
+
+
+class RecordingTarget:
+    def __init__(self):
+        self.chunks = []
+
+    async def stream_token(self, token: str, is_sequence: bool = False) -> None:
+        self.chunks.append(token)
+
+
+class TestTokenBuffer:
+    """Tests de TokenBuffer."""
+
+    @pytest.mark.asyncio
+    async def test_flushes_on_size_and_close(self):
+        target = RecordingTarget()
+        stats = UIStats()
+        async with TokenBuffer(target, interval_ms=10_000, max_chars=12, stats=stats) as buffer:
+            for token in ["El ", "revenue ", "creció ", "12%"]:
+                await buffer.push(token)
+            assert target.chunks == ["El revenue creció "]
+
+        assert target.chunks == ["El revenue creció ", "12%"]
+        assert stats.snapshot() == {
+            "answers": 1, "tokens_per_answer": 4, "frames_per_answer": 2, "frames_per_step": 0
+        }
+
+    @pytest.mark.asyncio
+    async def test_flushes_on_interval_without_new_tokens(self):
+        target = RecordingTarget()
+        buffer = TokenBuffer(target, interval_ms=20, max_chars=1000)
+        await buffer.push("a")
+        await buffer.push("b")
+        assert target.chunks == []
+        await asyncio.sleep(0.05)
+        assert target.chunks == ["ab"]
+        await buffer.close()
+        assert buffer.frames == 1
+
+    @pytest.mark.asyncio
+    async def test_zero_interval_streams_every_token(self):
+        target = RecordingTarget()
+        async with TokenBuffer(target, interval_ms=0) as buffer:
+            await buffer.push("a")
+            await buffer.push("b")
+        assert target.chunks == ["a", "b"]
+
+
+class TestCoalescedStep:
+    """Tests de CoalescedStep (sin servidor: se cuentan los frames de cl.Step)."""
+
+    @pytest.fixture
+    def frames(self, monkeypatch):
+        sent = []
+
+        async def send(step):
+            sent.append(("send", step.output))
+            return step
+
+        async def update(step):
+            sent.append(("update", step.output))
+            return True
+
+        monkeypatch.setattr(cl.Step, "send", send)
+        monkeypatch.setattr(cl.Step, "update", update)
+        return sent
+
+    @pytest.mark.asyncio
+    async def test_fast_step_sends_single_frame(self, frames):
+        init_http_context()
+        async with CoalescedStep(name="📝 SQL Generado", type="tool", delay_ms=50) as step:
+            step.output = "SELECT 1"
+        await asyncio.sleep(0.08)
+        assert frames == [("send", "SELECT 1")]
+
+    @pytest.mark.asyncio
+    async def test_slow_step_shows_progress_then_updates(self, frames):
+        init_http_context()
+        async with CoalescedStep(name="💬 Generando Explicación", type="llm", delay_ms=10) as step:
+            await asyncio.sleep(0.05)
+            step.output = "Explicación"
+        assert frames == [("send", ""), ("update", "Explicación")]
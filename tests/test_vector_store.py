@@ -0,0 +1,99 @@
+"""
+Tests para services/vector_store.py - embeddings cuantizados en memmap.
+
+Verifica:
+- Error de reconstrucción acotado (int8 y PQ)
+- Recall@10 con re-puntuación float32 frente a la búsqueda exacta
+- Arrays memory-mapped con el tamaño de código esperado
+"""
+import numpy as np
+import pytest
+
+from services.vector_store import (
+    ProductQuantizer, QuantizedVectorStore, ScalarQuantizer, normalize_rows
+)
+
+
+def embeddings(n: int = 2000, dim: int = 64, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """Vectores con estructura de baja dimensión y consultas cercanas a documentos."""
+    rng = np.random.default_rng(seed)
+    projection = rng.normal(size=(8, dim))
+    points = rng.normal(size=(n, 8))
+    vectors = points @ projection + 0.2 * rng.normal(size=(n, dim))
+    queries = points[:20] @ projection + 0.1 * rng.normal(size=(20, dim))
+    return normalize_rows(vectors), normalize_rows(queries)
+
+
+def exact_top(vectors: np.ndarray, queries: np.ndarray, k: int = 10) -> list[set[int]]:
+    return [set(np.argsort(-(vectors @ q))[:k].tolist()) for q in queries]
+
+
+def recall(store: QuantizedVectorStore, vectors, queries, rescore_factor: int) -> float:
+    truth = exact_top(vectors, queries)
+    results = store.search(queries, k=10, rescore_factor=rescore_factor)
+    return float(np.mean([len({int(i) for i, _ in r} & t) / 10 for r, t in zip(results, truth)]))
+
+
+def test_scalar_quantizer_roundtrip():
+    vectors, queries = embeddings()
+    quantizer = ScalarQuantizer.train(vectors)
+    codes = quantizer.encode(vectors)
+    assert codes.dtype == np.int8
+    assert np.abs(quantizer.decode(codes) - vectors).max() <= quantizer.step.max()
+    # Puntaje asimétrico = producto con la reconstrucción
+    np.testing.assert_allclose(
+        quantizer.scores(queries[:2], codes[:50]), queries[:2] @ quantizer.decode(codes[:50]).T, atol=1e-4
+    )
+
+
+def test_product_quantizer_lookup_matches_decode():
+    vectors, queries = embeddings()
+    quantizer = ProductQuantizer.train(vectors, subspaces=8, iterations=5)
+    codes = quantizer.encode(vectors[:50])
+    assert codes.shape == (50, 8) and codes.dtype == np.uint8
+    np.testing.assert_allclose(
+        quantizer.scores(queries[:2], codes), queries[:2] @ quantizer.decode(codes).T, atol=1e-4
+    )
+    with pytest.raises(ValueError):
+        ProductQuantizer.train(vectors, subspaces=7)
+
+
+class TestQuantizedVectorStore:
+    """Tests de QuantizedVectorStore."""
+
+    def test_int8_store_is_memory_mapped_and_accurate(self, tmp_path):
+        vectors, queries = embeddings()
+        store = QuantizedVectorStore.build(str(tmp_path), [str(i) for i in range(len(vectors))], vectors)
+
+        assert isinstance(store.codes, np.memmap) and isinstance(store.vectors, np.memmap)
+        assert store.code_bytes == len(vectors) * 64  # 1 byte por dimensión
+        assert recall(QuantizedVectorStore(str(tmp_path)), vectors, queries, rescore_factor=4) >= 0.95
+
+    def test_pq_rescoring_improves_recall(self, tmp_path):
+        vectors, queries = embeddings()
+        ids = [str(i) for i in range(len(vectors))]
+        store = QuantizedVectorStore.build(str(tmp_path), ids, vectors, quantization="pq", pq_subspaces=8)
+
+        assert store.code_bytes == len(vectors) * 8
+        approximate = recall(store, vectors, queries, rescore_factor=0)
+        rescored = recall(store, vectors, queries, rescore_factor=8)
+        assert rescored >= 0.9
+        assert rescored >= approximate
+
+    def test_single_query_returns_exact_cosine(self, tmp_path):
+        vectors, _ = embeddings(n=300)
+        store = QuantizedVectorStore.build(str(tmp_path), [str(i) for i in range(300)], vectors)
+        [results] = store.search(vectors[42].tolist(), k=3)
+        assert results[0][0] == "42"
+        assert results[0][1] == pytest.approx(1.0, abs=1e-5)
+        assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+
+    def test_rejects_bad_input(self, tmp_path):
+        vectors, _ = embeddings(n=100)
+        with pytest.raises(ValueError):
+            QuantizedVectorStore.build(str(tmp_path), ["a"], vectors)
+        with pytest.raises(ValueError):
+            QuantizedVectorStore.build(str(tmp_path), [str(i) for i in range(100)], vectors, quantization="fp8")
+        store = QuantizedVectorStore.build(str(tmp_path), [str(i) for i in range(100)], vectors)
+        with pytest.raises(ValueError):
+            store.search(np.ones(32))